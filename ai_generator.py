@@ -5,7 +5,11 @@ Applies all 25 Harry Dry copywriting principles to generate segment-specific cam
 
 import json
 import os
-import requests
+
+import datastore
+from generation_cache import cached_generation, cached_result, store_result
+from json_stream import ObjectFieldParser
+from llm_client import chat_completion, stream_chat_completion, LLMError
 
 # All 25 Harry Dry Principles
 HARRY_DRY_PRINCIPLES = """
@@ -178,32 +182,23 @@ Seven Gables | $2.28B sold | Since 1976
 """
 
 
-def generate_campaign_content(segment_id, campaign_name="", custom_prompt=""):
+def _campaign_request(segment_id, campaign_name="", custom_prompt=""):
     """
-    Generate complete campaign content for a specific segment
-    using all Harry Dry principles
-    
-    Args:
-        segment_id: The segment to target
-        campaign_name: Optional campaign name
-        custom_prompt: Optional custom instructions from user
+    Model request for a segment's campaign (or {"error": ...} if the
+    segment can't be resolved)
     """
     
     # Try to load from hardcoded profiles first
     if segment_id in SEGMENT_PROFILES:
         profile = SEGMENT_PROFILES[segment_id]
     else:
-        # Try behavioral_audiences.json
+        # Try behavioral audiences
         try:
-            with open('behavioral_audiences.json', 'r') as f:
-                behavioral = json.load(f)
-            audience = next((b for b in behavioral if b['id'] == segment_id), None)
+            audience = datastore.get_item('audiences', segment_id)
             
             if not audience:
-                # Try past_clients.json
-                with open('past_clients.json', 'r') as f:
-                    past_clients = json.load(f)
-                audience = next((p for p in past_clients if p['id'] == segment_id), None)
+                # Try past client segments
+                audience = datastore.get_item('past_clients', segment_id)
             
             if audience:
                 # Convert to profile format
@@ -377,44 +372,99 @@ IMPORTANT:
 - Tell THEIR story, not yours
 """
 
+    return {
+        "model": "gpt-4.1-mini",
+        "messages": [
+            {"role": "system", "content": "You are an expert copywriter who specializes in applying Harry Dry's principles to real estate marketing. You generate conversion-focused, segment-specific email campaigns."},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.8,
+        "response_format": {"type": "json_object"}
+    }
+
+
+def generate_campaign_content(segment_id, campaign_name="", custom_prompt="", regenerate=False):
+    """
+    Generate complete campaign content for a specific segment
+    using all Harry Dry principles
+    
+    Identical requests (same resolved profile, custom prompt, model and
+    temperature) are answered from the generation cache.
+    
+    Args:
+        segment_id: The segment to target
+        campaign_name: Optional campaign name
+        custom_prompt: Optional custom instructions from user
+        regenerate: Skip the cache and ask the model for new copy
+    """
+    payload = _campaign_request(segment_id, campaign_name, custom_prompt)
+    if "error" in payload:
+        return payload
+    
     try:
-        # Use direct API call instead of OpenAI client
-        api_key = os.environ.get('OPENAI_API_KEY')
-        if not api_key:
+        if not os.environ.get('OPENAI_API_KEY'):
             return {"error": "OpenAI API key not configured"}
         
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": "gpt-4.1-mini",
-            "messages": [
-                {"role": "system", "content": "You are an expert copywriter who specializes in applying Harry Dry's principles to real estate marketing. You generate conversion-focused, segment-specific email campaigns."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.8,
-            "response_format": {"type": "json_object"}
-        }
-        
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=60
-        )
-        
-        if response.status_code != 200:
-            return {"error": f"API error: {response.status_code} - {response.text}"}
+        def generate():
+            try:
+                response = chat_completion(payload, timeout=60)
+            except LLMError as e:
+                return {"error": str(e)}
+            
+            return json.loads(response['choices'][0]['message']['content'])
         
-        content = json.loads(response.json()['choices'][0]['message']['content'])
-        return content
+        return cached_generation(payload, generate, refresh=regenerate)
         
     except Exception as e:
         return {"error": str(e)}
 
 
+def stream_campaign_content(segment_id, campaign_name="", custom_prompt="", regenerate=False):
+    """
+    Generate campaign content, handing over each field as soon as the
+    model has finished writing it
+    
+    A cached result (unless regenerate) is replayed field by field.
+    
+    Args:
+        Same as generate_campaign_content
+    
+    Yields:
+        tuple: ('text', piece) for each piece of the raw reply,
+               ('field', name, value) for each completed top-level field,
+               then ('done', content) or ('error', message)
+    """
+    payload = _campaign_request(segment_id, campaign_name, custom_prompt)
+    if "error" in payload:
+        yield ('error', payload['error'])
+        return
+    
+    if not regenerate:
+        cached = cached_result(payload)
+        if cached is not None:
+            for name, value in cached.items():
+                yield ('field', name, value)
+            yield ('done', cached)
+            return
+    
+    parser = ObjectFieldParser()
+    try:
+        for piece in stream_chat_completion(payload, timeout=60):
+            yield ('text', piece)
+            for name, value in parser.feed(piece):
+                yield ('field', name, value)
+        content = parser.result()
+    except LLMError as e:
+        yield ('error', str(e))
+        return
+    except ValueError as e:
+        yield ('error', f"Could not read the generated campaign: {e}")
+        return
+    
+    store_result(payload, content)
+    yield ('done', content)
+
+
 def get_segment_profile(segment_id):
     """Get detailed profile for a segment (static or behavioral)"""
     # Check static segments first
@@ -1,16 +1,35 @@
-from flask import Flask, request, jsonify, redirect, url_for, session
+from flask import Flask, request, jsonify, redirect, url_for, session, Response, render_template, stream_with_context
 from flask_cors import CORS
 import json
 import os
+import tempfile
 from datetime import datetime
-from ai_generator import generate_campaign_content, get_segment_profile
+from jinja2 import FileSystemBytecodeCache
+from ai_generator import generate_campaign_content, stream_campaign_content, get_segment_profile
 from audience_analyzer import analyze_audience_screenshots, create_audience_card, get_audience, load_audiences, generate_campaign_for_audience, analyze_csv_data
 from html_generator import generate_email_html_content
+import datastore
+import email_cache
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'keyes-campaign-builder-secret-2025')
 CORS(app)
 
+# Compiled templates are shared by all workers and survive restarts
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'keyes-jinja'))
+os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)}
+
+# Static files are fingerprinted by asset_url, so browsers may keep them for a year
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 365 * 24 * 3600
+
+
+@app.template_global()
+def asset_url(filename):
+    """URL of a static file, versioned by its modification time"""
+    version = int(os.path.getmtime(os.path.join(app.static_folder, filename)))
+    return url_for('static', filename=filename, v=version)
+
 # Global authentication check
 @app.before_request
 def require_authentication():
@@ -25,108 +44,75 @@ def require_authentication():
     
     return None
 
-SUBMISSIONS_FILE = 'submissions.json'
-CAMPAIGNS_FILE = 'campaigns.json'
-SEGMENTS_FILE = 'segments.json'
-TEMPLATES_FILE = 'email_templates.json'
 CURRENT_EMAIL_TEMPLATE = 'email_template.html'
 
+# Campaigns, submissions, segments, templates, audiences and past client
+# segments live in the SQLite datastore (imported from their JSON files once)
+
 def load_submissions():
-    if os.path.exists(SUBMISSIONS_FILE):
-        with open(SUBMISSIONS_FILE, 'r') as f:
-            return json.load(f)
-    return []
+    return datastore.load_items('submissions')
 
 
 def load_behavioral_audiences():
     """Load behavioral audiences from database"""
-    try:
-        with open('behavioral_audiences.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
-    except json.JSONDecodeError:
-        return []
-
-def save_submissions(submissions):
-    with open(SUBMISSIONS_FILE, 'w') as f:
-        json.dump(submissions, f, indent=2)
+    return datastore.load_items('audiences')
 
 def load_campaigns():
-    if os.path.exists(CAMPAIGNS_FILE):
-        with open(CAMPAIGNS_FILE, 'r') as f:
-            return json.load(f)
-    return []
-
-def save_campaigns(campaigns):
-    with open(CAMPAIGNS_FILE, 'w') as f:
-        json.dump(campaigns, f, indent=2)
+    return datastore.load_items('campaigns')
 
 def get_campaign(campaign_id):
-    campaigns = load_campaigns()
-    for campaign in campaigns:
-        if campaign['id'] == campaign_id:
-            return campaign
-    return None
+    return datastore.get_item('campaigns', campaign_id)
 
 def load_segments():
-    if os.path.exists(SEGMENTS_FILE):
-        with open(SEGMENTS_FILE, 'r') as f:
-            return json.load(f)
-    return []
-
-def save_segments(segments):
-    with open(SEGMENTS_FILE, 'w') as f:
-        json.dump(segments, f, indent=2)
+    return datastore.load_items('segments')
 
 def get_segment(segment_id):
-    segments = load_segments()
-    for segment in segments:
-        if segment['id'] == segment_id:
-            return segment
-    return None
+    return datastore.get_item('segments', segment_id)
 
 def load_templates():
-    if os.path.exists(TEMPLATES_FILE):
-        with open(TEMPLATES_FILE, 'r') as f:
-            return json.load(f)
-    return []
-
-def save_templates(templates):
-    with open(TEMPLATES_FILE, 'w') as f:
-        json.dump(templates, f, indent=2)
+    return datastore.load_items('templates')
 
 def get_template(template_id):
-    templates = load_templates()
-    for template in templates:
-        if template['id'] == template_id:
-            return template
-    return None
+    return datastore.get_item('templates', template_id)
+
+def load_past_clients():
+    return datastore.load_items('past_clients')
+
+def job_progress_page(job_id, title, done_url, confirm_text=None, confirm_url=None):
+    """
+    Page that polls a background job, then reports its result
+
+    Args:
+        job_id: ID from jobs.submit_job
+        title: Heading shown while the job runs
+        done_url: Where to go when the job finishes (or fails)
+        confirm_text: Optional question appended to the result message;
+                      confirming goes to confirm_url instead of done_url
+        confirm_url: Destination when the user confirms
+    """
+    return render_template('job_progress.html', job_id=job_id, title=title, done_url=done_url,
+                           confirm_text=confirm_text, confirm_url=confirm_url)
 
 @app.route('/test')
 def test_page():
-    from storage import download_file_from_spaces
-    import os
+    from storage import get_object_bytes
     
-    temp_path = '/tmp/email_template_test.html'
-    result = download_file_from_spaces('email_template.html', temp_path)
+    result = get_object_bytes('email_template.html', cache=True)
     
     if result['success']:
-        with open(temp_path, 'r') as f:
-            email_html = f.read()
-        os.remove(temp_path)
-        return email_html
+        return result['data'].decode('utf-8')
     else:
         return "<!-- Email template not found in cloud storage -->", 404
 
 @app.route('/')
 def index():
-    submissions = load_submissions()
-    total = len(submissions)
-    pending = sum(1 for s in submissions if s.get('status') == 'pending')
-    maximize = sum(1 for s in submissions if s.get('equity_priority') == 'maximize')
-    speed = sum(1 for s in submissions if s.get('equity_priority') == 'speed')
-    balance = sum(1 for s in submissions if s.get('equity_priority') == 'balance')
+    # Counts come from the submission aggregates, not a pass over every lead
+    stats = datastore.submission_stats()
+    total = stats['total']
+    pending = stats['pending']
+    maximize = stats['priorities'].get('maximize', 0)
+    speed = stats['priorities'].get('speed', 0)
+    balance = stats['priorities'].get('balance', 0)
     
     # Load campaigns for dropdown
     campaigns = load_campaigns()
@@ -135,16 +121,12 @@ def index():
         campaign_options += f'<option value="{camp["id"]}">{camp["name"]}</option>'
     
     # Load email template from Spaces
-    from storage import download_file_from_spaces
-    import os
+    from storage import get_object_bytes
     
-    temp_path = '/tmp/email_template_index.html'
-    result = download_file_from_spaces('email_template.html', temp_path)
+    result = get_object_bytes('email_template.html', cache=True)
     
     if result['success']:
-        with open(temp_path, 'r') as f:
-            email_html = f.read()
-        os.remove(temp_path)
+        email_html = result['data'].decode('utf-8')
     else:
         email_html = "<!-- Email template not found in cloud storage -->"
     
@@ -429,13 +411,10 @@ def submit_form():
     if request.method == 'OPTIONS':
         return '', 200
     
-    submissions = load_submissions()
-    
     # Get campaign_id from form or query param, default to home-equity-2025
     campaign_id = request.form.get('campaign_id') or request.args.get('campaign_id', 'home-equity-2025')
     
     new_submission = {
-        'id': len(submissions) + 1,
         'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
         'campaign_id': campaign_id,
         'email': request.form.get('email', ''),
@@ -450,8 +429,8 @@ def submit_form():
         'status': 'pending'
     }
     
-    submissions.insert(0, new_submission)
-    save_submissions(submissions)
+    # Single-row append; the id comes from the store's sequence
+    datastore.append_item('submissions', new_submission)
     
     return """<!DOCTYPE html>
 <html>
@@ -596,8 +575,7 @@ def submit_form():
 @app.route('/template/edit', methods=['GET', 'POST'])
 def edit_template():
     """Edit the email template HTML"""
-    from storage import upload_file_to_spaces, download_file_from_spaces
-    import os
+    from storage import put_object_bytes, get_object_bytes
     
     TEMPLATE_KEY = 'email_template.html'
     
@@ -605,28 +583,18 @@ def edit_template():
         # Save the template to DigitalOcean Spaces
         new_html = request.form.get('html_content', '')
         
-        # Write to temp file
-        temp_path = '/tmp/email_template.html'
-        with open(temp_path, 'w') as f:
-            f.write(new_html)
-        
-        # Upload to Spaces
-        result = upload_file_to_spaces(temp_path, TEMPLATE_KEY)
-        os.remove(temp_path)
+        result = put_object_bytes(TEMPLATE_KEY, new_html, content_type='text/html; charset=utf-8')
         
         if result['success']:
             return '<script>alert("Template saved successfully to cloud storage!"); window.location.href="/template/edit";</script>'
         else:
-            return f'<script>alert("Error saving template: {result.get("error", "Unknown error")}"); window.history.back();</script>'
+            return f'<script>alert("Error saving template: {result["message"]}"); window.history.back();</script>'
     
     # Load current template from DigitalOcean Spaces
-    temp_path = '/tmp/email_template_download.html'
-    result = download_file_from_spaces(TEMPLATE_KEY, temp_path)
+    result = get_object_bytes(TEMPLATE_KEY, cache=True)
     
     if result['success']:
-        with open(temp_path, 'r') as f:
-            current_html = f.read()
-        os.remove(temp_path)
+        current_html = result['data'].decode('utf-8')
     else:
         # Fallback to default template if not found in Spaces
         current_html = """<!-- Default Email Template -->
@@ -784,286 +752,152 @@ def edit_template():
 
 @app.route('/submissions')
 def view_submissions():
-    submissions = load_submissions()
-    rows_html = ""
-    
-    for sub in submissions:
-        priority_badge = {
-            'maximize': '<span style="background: #004237; color: white; padding: 6px 12px; border-radius: 6px; font-size: 12px;">MAXIMIZE</span>',
-            'speed': '<span style="background: #fcbfa7; color: white; padding: 6px 12px; border-radius: 6px; font-size: 12px;">SPEED</span>',
-            'balance': '<span style="background: #666; color: white; padding: 6px 12px; border-radius: 6px; font-size: 12px;">BALANCED</span>'
-        }.get(sub.get('equity_priority', ''), sub.get('equity_priority', ''))
-        
-        rows_html += f"""<tr>
-            <td>{sub.get('id', '')}</td>
-            <td>{sub.get('timestamp', '')}</td>
-            <td><span style="background: #f7f3e5; padding: 4px 8px; border-radius: 4px; font-size: 11px; color: #004237;">{sub.get('campaign_id', 'N/A')}</span></td>
-            <td><strong>{sub.get('email', '')}</strong></td>
-            <td>{sub.get('first_name', '')} {sub.get('last_name', '')}</td>
-            <td>{priority_badge}</td>
-            <td>{sub.get('goals', '')}</td>
-            <td>{sub.get('goals_text', '')}</td>
-            <td>{sub.get('phone_number', '')}</td>
-            <td>{'✓' if sub.get('wants_equity_report') else '—'}</td>
-            <td>{'✓' if sub.get('wants_expert_contact') else '—'}</td>
-        </tr>"""
-    
-    return f"""<!DOCTYPE html>
-<html>
-<head>
-    <title>All Submissions</title>
-    <style>
-        body {{
-            font-family: Arial, sans-serif;
-            background: linear-gradient(135deg, #f5f5f5 0%, #e8f5e3 100%);
-            padding: 20px;
-        }}
-        .header {{
-            background: linear-gradient(135deg, #004237 0%, #003329 100%);
-            color: white;
-            padding: 30px;
-            border-radius: 12px;
-            margin-bottom: 20px;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-        }}
-        .header-left {{
-            display: flex;
-            flex-direction: column;
-            gap: 10px;
-        }}
-        .logo {{
-            font-size: 24px;
-            font-weight: 700;
-            opacity: 0.95;
-        }}
-        .logo span {{ color: #fcbfa7; }}
-        .header h1 {{
-            margin: 0;
-            font-size: 28px;
-        }}
-        .header a {{ color: white; text-decoration: none; padding: 10px 20px; background: rgba(255,255,255,0.2); border-radius: 6px; }}
-        table {{ width: 100%; background: white; border-radius: 12px; overflow: hidden; box-shadow: 0 2px 12px rgba(0,0,0,0.08); }}
-        th {{ background: #004237; color: white; padding: 16px 12px; text-align: left; }}
-        td {{ padding: 14px 12px; border-bottom: 1px solid #e0e0e0; }}
-        tr:hover {{ background: #f0f8ed; }}
-        .zoom-controls {{
-            display: flex;
-            gap: 8px;
-            align-items: center;
-        }}
-        .zoom-btn {{
-            background: rgba(255,255,255,0.2);
-            border: 1px solid rgba(255,255,255,0.3);
-            color: white;
-            padding: 6px 12px;
-            border-radius: 4px;
-            cursor: pointer;
-            font-size: 14px;
-            transition: all 0.2s;
-        }}
-        .zoom-btn:hover {{
-            background: rgba(255,255,255,0.3);
-        }}
-        .zoom-level {{
-            font-size: 12px;
-            color: white;
-            min-width: 45px;
-            text-align: center;
-        }}
-    </style>
-</head>
-<body>
-    <div class="header">
-        <div class="header-left">
-            <div class="logo">The <span style="font-style: italic; font-family: Georgia, serif;">Keyes</span> Company</div>
-            <h1>All Submissions</h1>
-        </div>
-        <div style="display: flex; gap: 15px; align-items: center;">
-            <div class="zoom-controls">
-                <button class="zoom-btn" onclick="zoomOut()">−</button>
-                <span class="zoom-level" id="zoomLevel">100%</span>
-                <button class="zoom-btn" onclick="zoomIn()">+</button>
-            </div>
-            <a href="/">← Dashboard</a>
-        </div>
-    </div>
-    <table>
-        <tr>
-            <th>ID</th><th>Time</th><th>Campaign</th><th>Email</th><th>Name</th><th>Priority</th><th>Goals</th><th>Details</th><th>Phone</th><th>Report</th><th>Call Past Client</th>
-        </tr>
-        {rows_html if rows_html else '<tr><td colspan="11" style="text-align: center; padding: 60px; color: #999;">No submissions yet</td></tr>'}
-    </table>
-    <script>
-        let currentZoom = 1.0;
-        function zoomIn() {{
-            if (currentZoom < 1.5) {{
-                currentZoom += 0.1;
-                updateZoom();
-            }}
-        }}
-        function zoomOut() {{
-            if (currentZoom > 0.5) {{
-                currentZoom -= 0.1;
-                updateZoom();
-            }}
-        }}
-        function updateZoom() {{
-            document.querySelector('table').style.zoom = currentZoom;
-            document.getElementById('zoomLevel').textContent = Math.round(currentZoom * 100) + '%';
-        }}
-    </script>
-</body>
-</html>"""
+    """
+    One page of submissions, filtered and searched in the datastore
+
+    Query args: campaign_id, status, q (email/name search), sort
+    (newest/oldest), per_page, cursor (from the previous page)
+    """
+    from urllib.parse import urlencode
+    
+    campaign_id = request.args.get('campaign_id', '')
+    status = request.args.get('status', '')
+    search = request.args.get('q', '').strip()
+    sort = 'oldest' if request.args.get('sort') == 'oldest' else 'newest'
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 200)
+    cursor = request.args.get('cursor', type=int)
+    
+    filters = {}
+    if campaign_id:
+        filters['campaign_id'] = campaign_id
+    if status:
+        filters['status'] = status
+    
+    # The search index can't match fewer characters; say so rather than scanning every row
+    search_too_short = 0 < len(search) < datastore.SEARCH_MIN_CHARS
+    
+    # Fetch one extra row to know whether there is a next page
+    page = list(datastore.iter_items(
+        'submissions', filters=filters,
+        search=search if search and not search_too_short else None,
+        cursor=cursor, limit=per_page + 1, reverse=(sort == 'oldest')
+    ))
+    submissions = [sub for _, sub in page[:per_page]]
+    
+    query = {'campaign_id': campaign_id, 'status': status, 'q': search, 'sort': sort, 'per_page': per_page}
+    query = {key: value for key, value in query.items() if value}
+    first_url = f'/submissions?{urlencode(query)}' if cursor is not None else None
+    next_url = None
+    if len(page) > per_page:
+        next_url = f'/submissions?{urlencode({**query, "cursor": page[per_page - 1][0]})}'
+    
+    return render_template(
+        'submissions.html',
+        submissions=submissions,
+        campaigns=load_campaigns(),
+        statuses=datastore.submission_statuses(),
+        campaign_id=campaign_id,
+        status=status,
+        search=search,
+        search_too_short=search_too_short,
+        search_min_chars=datastore.SEARCH_MIN_CHARS,
+        sort=sort,
+        per_page=per_page,
+        first_url=first_url,
+        next_url=next_url,
+        export_query=urlencode({key: value for key, value in query.items() if key in ('campaign_id', 'status')})
+    )
 
 @app.route('/api/submissions')
 def get_submissions():
-    return jsonify(load_submissions())
+    """
+    Submissions as JSON, newest first
+
+    Filters: campaign_id, status, start/end (YYYY-MM-DD). Without limit or
+    cursor the whole list is streamed as an array; with them, one page is
+    returned as {'submissions': [...], 'next_cursor': cursor or null}.
+    """
+    from submission_export import submission_filters, iter_submissions, iter_json
+    
+    filters = submission_filters(request.args)
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor', type=int)
+    
+    if limit is None and cursor is None:
+        return Response(iter_json(filters), mimetype='application/json')
+    
+    limit = min(max(limit or 100, 1), 1000)
+    page = list(iter_submissions(filters, cursor=cursor, limit=limit + 1))
+    has_more = len(page) > limit
+    page = page[:limit]
+    
+    return jsonify({
+        'submissions': [submission for _, submission in page],
+        'next_cursor': page[-1][0] if has_more else None
+    })
 
 @app.route('/export')
 def export_csv():
-    submissions = load_submissions()
-    csv = "ID,Timestamp,Campaign ID,Email,First Name,Last Name,Equity Priority,Goals,Goals Text,Phone,Wants Report,Wants Expert\n"
+    """Stream submissions as CSV (or ?format=xlsx), with the same filters as /api/submissions"""
+    from submission_export import submission_filters, iter_csv, iter_xlsx
+    
+    filters = submission_filters(request.args)
     
-    for sub in submissions:
-        csv += f"{sub.get('id','')},{sub.get('timestamp','')},{sub.get('campaign_id','')},{sub.get('email','')},{sub.get('first_name','')},{sub.get('last_name','')},{sub.get('equity_priority','')},\"{sub.get('goals','')}\",\"{sub.get('goals_text','')}\",{sub.get('phone_number','')},{sub.get('wants_equity_report','')},{sub.get('wants_expert_contact','')}\n"
+    if request.args.get('format') == 'xlsx':
+        return Response(iter_xlsx(filters),
+                        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                        headers={"Content-disposition": "attachment; filename=keyes.xlsx"})
     
-    return Response(csv, mimetype="text/csv", headers={"Content-disposition": "attachment; filename=keyes.csv"})
+    return Response(iter_csv(filters), mimetype="text/csv", headers={"Content-disposition": "attachment; filename=keyes.csv"})
 
 # Campaign Management Routes
 @app.route('/campaigns')
 def campaigns_list():
-    campaigns = load_campaigns()
-    submissions = load_submissions()
-    
-    # Calculate stats per campaign
-    campaign_stats = {}
-    for campaign in campaigns:
-        campaign_id = campaign['id']
-        campaign_submissions = [s for s in submissions if s.get('campaign_id') == campaign_id]
-        campaign_stats[campaign_id] = {
-            'total': len(campaign_submissions),
-            'pending': sum(1 for s in campaign_submissions if s.get('status') == 'pending'),
-            'last_submission': campaign_submissions[0]['timestamp'] if campaign_submissions else 'None'
-        }
-    
-    segments = load_segments()
-    segment_map = {s['id']: s for s in segments}
-    
-    campaigns_html = ""
-    for campaign in campaigns:
-        stats = campaign_stats.get(campaign['id'], {'total': 0, 'pending': 0, 'last_submission': 'None'})
-        status_badge = f'<span style="background: {"#004237" if campaign["status"] == "active" else "#fcbfa7"}; color: white; padding: 4px 12px; border-radius: 12px; font-size: 11px; text-transform: uppercase; font-weight: 600;">{campaign["status"]}</span>'
-        
-        # Get segment info
-        segment_id = campaign.get('segment', 'general')
-        segment = segment_map.get(segment_id, {'name': 'General', 'icon': '•', 'color': '#fcbfa7'})
-        segment_badge = f'<span style="background: {segment["color"]}; color: white; padding: 6px 12px; border-radius: 8px; font-size: 12px; font-weight: 600;">{segment["icon"]} {segment["name"]}</span>'
-        
-        campaigns_html += f"""
-        <div style="background: white; border-radius: 12px; padding: 24px; margin-bottom: 20px; box-shadow: 0 2px 8px rgba(0,0,0,0.08); border-left: 4px solid #fcbfa7;">
-            <div style="display: flex; justify-content: space-between; align-items: start; margin-bottom: 15px;">
-                <div>
-                    <h3 style="color: #004237; font-size: 20px; margin-bottom: 8px;">{campaign['name']}</h3>
-                    <p style="color: #666; font-size: 14px; margin-bottom: 8px;">ID: {campaign['id']}</p>
-                    <div style="margin-bottom: 8px;">{segment_badge}</div>
-                    <p style="color: #999; font-size: 12px;">Created: {campaign['created_at']} | Updated: {campaign['updated_at']}</p>
-                </div>
-                <div>{status_badge}</div>
-            </div>
-            <div style="display: grid; grid-template-columns: repeat(3, 1fr); gap: 15px; margin: 20px 0; padding: 15px; background: #f7f3e5; border-radius: 8px;">
-                <div>
-                    <div style="color: #999; font-size: 11px; text-transform: uppercase; margin-bottom: 4px;">Total Submissions</div>
-                    <div style="color: #004237; font-size: 24px; font-weight: 700;">{stats['total']}</div>
-                </div>
-                <div>
-                    <div style="color: #999; font-size: 11px; text-transform: uppercase; margin-bottom: 4px;">Pending</div>
-                    <div style="color: #fcbfa7; font-size: 24px; font-weight: 700;">{stats['pending']}</div>
-                </div>
-                <div>
-                    <div style="color: #999; font-size: 11px; text-transform: uppercase; margin-bottom: 4px;">Last Submission</div>
-                    <div style="color: #666; font-size: 13px; font-weight: 600; margin-top: 8px;">{stats['last_submission']}</div>
-                </div>
-            </div>
-            <div style="display: flex; gap: 10px; flex-wrap: wrap;">
-                <a href="/campaign/{campaign['id']}" style="padding: 10px 20px; background: #004237; color: white; text-decoration: none; border-radius: 6px; font-size: 14px; font-weight: 600;">View Details</a>
-                <a href="/campaign/{campaign['id']}/edit" style="padding: 10px 20px; background: #fcbfa7; color: #004237; text-decoration: none; border-radius: 6px; font-size: 14px; font-weight: 600;">Edit Campaign</a>
-                <a href="/campaign/{campaign['id']}/preview" style="padding: 10px 20px; background: white; color: #004237; text-decoration: none; border-radius: 6px; font-size: 14px; font-weight: 600; border: 2px solid #004237;">Preview Email</a>
-                {'' if campaign['id'] == 'home-equity-2025' else f'<a href="/campaign/{campaign["id"]}/delete" onclick="return confirm(&quot;Are you sure you want to delete this campaign? This cannot be undone.&quot;);" style="padding: 10px 20px; background: #dc3545; color: white; text-decoration: none; border-radius: 6px; font-size: 14px; font-weight: 600;">Delete</a>'}
-            </div>
-        </div>
-        """
+    segment_map = {s['id']: s for s in load_segments()}
+    
+    return render_template(
+        'campaigns.html',
+        campaigns=load_campaigns(),
+        campaign_stats=datastore.campaign_submission_stats(),
+        empty_stats=datastore.empty_stats(),
+        segment_map=segment_map,
+        default_segment={'name': 'General', 'icon': '•', 'color': '#fcbfa7'}
+    )
+
+@app.route('/campaigns/bulk-generate', methods=['GET', 'POST'])
+def campaigns_bulk_generate():
+    """Generate draft campaigns for many segments at once (background job)"""
+    import uuid
+    from jobs import submit_job
+    from bulk_generation import bulk_generation_job, batch_campaigns, segment_choices
     
-    return f"""<!DOCTYPE html>
-<html>
-<head>
-    <title>Campaign Management - The Keyes Company</title>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Arial, sans-serif;
-            background: #f7f3e5;
-            padding: 40px 20px;
-        }}
-        .container {{
-            max-width: 1200px;
-            margin: 0 auto;
-        }}
-        .header {{
-            background: linear-gradient(135deg, #004237 0%, #003329 100%);
-            color: white;
-            padding: 30px 40px;
-            border-radius: 12px;
-            margin-bottom: 30px;
-            box-shadow: 0 4px 12px rgba(0,0,0,0.15);
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-        }}
-        .header h1 {{ font-size: 32px; }}
-        .btn {{
-            padding: 12px 24px;
-            background: #fcbfa7;
-            color: #004237;
-            text-decoration: none;
-            border-radius: 6px;
-            font-weight: 600;
-            display: inline-block;
-            transition: all 0.3s;
-        }}
-        .btn:hover {{
-            transform: translateY(-2px);
-            box-shadow: 0 4px 12px rgba(252, 191, 167, 0.4);
-        }}
-        .back-link {{
-            color: white;
-            text-decoration: none;
-            font-size: 14px;
-            opacity: 0.9;
-            transition: opacity 0.2s;
-        }}
-        .back-link:hover {{ opacity: 1; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <div>
-                <h1>Campaign Management</h1>
-                <p style="margin-top: 8px; opacity: 0.9;">Create, edit, and track your email campaigns</p>
-            </div>
-            <div style="display: flex; gap: 15px; align-items: center;">
-                <a href="/campaign/new" class="btn">+ New Campaign</a>
-                <a href="/" class="back-link">← Dashboard</a>
-            </div>
-        </div>
-        {campaigns_html if campaigns_html else '<div style="background: white; padding: 60px; text-align: center; border-radius: 12px; color: #999;"><p style="font-size: 18px;">No campaigns yet. Create your first campaign to get started!</p></div>'}
-    </div>
-</body>
-</html>"""
+    if request.method == 'POST':
+        segment_ids = request.form.getlist('segment_ids')
+        if not segment_ids:
+            return '<script>alert("Select at least one segment"); window.history.back();</script>'
+        
+        # Re-running a batch keeps its saved drafts and fills in the rest
+        batch_id = request.form.get('batch_id') or uuid.uuid4().hex[:12]
+        job_id = submit_job(bulk_generation_job, {
+            'batch_id': batch_id,
+            'segment_ids': segment_ids,
+            'label': request.form.get('label', '').strip(),
+            'custom_prompt': request.form.get('custom_prompt', '').strip()
+        }, unique='batch_id')
+        if job_id is None:
+            return '<script>alert("This batch is already being generated. Wait for it to finish before running it again."); window.history.back();</script>'
+        return job_progress_page(job_id, f'Generating {len(segment_ids)} campaigns',
+                                 f'/campaigns/bulk-generate?batch={batch_id}')
+    
+    batch_id = request.args.get('batch', '')
+    now = datetime.now()
+    return render_template(
+        'bulk_generate.html',
+        choices=segment_choices(),
+        batch_id=batch_id,
+        done=batch_campaigns(batch_id) if batch_id else {},
+        label=f'Q{(now.month - 1) // 3 + 1} {now.year}'
+    )
 
 @app.route('/campaign/<campaign_id>')
 def campaign_detail(campaign_id):
@@ -1071,8 +905,7 @@ def campaign_detail(campaign_id):
     if not campaign:
         return "Campaign not found", 404
     
-    submissions = load_submissions()
-    campaign_submissions = [s for s in submissions if s.get('campaign_id') == campaign_id]
+    campaign_submissions = datastore.find_items('submissions', campaign_id=campaign_id)
     
     rows_html = ""
     for sub in campaign_submissions:
@@ -1088,6 +921,11 @@ def campaign_detail(campaign_id):
         </tr>
         """
     
+    segment_options = ''.join(
+        f'<option value="{seg["id"]}">{seg["name"]} ({seg.get("count", 0)})</option>'
+        for seg in load_past_clients()
+    )
+    
     return f"""<!DOCTYPE html>
 <html>
 <head>
@@ -1152,6 +990,20 @@ def campaign_detail(campaign_id):
             opacity: 0.9;
         }}
         .back-link:hover {{ opacity: 1; }}
+        .personalize {{
+            display: flex;
+            gap: 12px;
+            align-items: center;
+            flex-wrap: wrap;
+            background: white;
+            padding: 20px 24px;
+            border-radius: 12px;
+            margin-bottom: 30px;
+            box-shadow: 0 2px 8px rgba(0,0,0,0.08);
+            color: #004237;
+        }}
+        .personalize select {{ padding: 8px 12px; border: 1px solid #ccc; border-radius: 6px; font-size: 14px; }}
+        .personalize button {{ padding: 8px 20px; background: #004237; color: white; border: none; border-radius: 6px; font-weight: 600; cursor: pointer; }}
     </style>
 </head>
 <body>
@@ -1182,6 +1034,19 @@ def campaign_detail(campaign_id):
             </div>
         </div>
         
+        <form method="POST" action="/campaign/{campaign['id']}/personalize" class="personalize">
+            <strong>Personalized emails</strong>
+            <select name="segment_id" required>
+                <option value="">Past client segment...</option>
+                {segment_options}
+            </select>
+            <select name="format">
+                <option value="zip">Zip of HTML files</option>
+                <option value="jsonl">JSONL</option>
+            </select>
+            <button type="submit">Render for every client</button>
+        </form>
+        
         <table>
             <tr>
                 <th>ID</th><th>Time</th><th>Email</th><th>Name</th><th>Priority</th><th>Goals</th><th>Phone</th>
@@ -1279,7 +1144,8 @@ def campaign_edit(campaign_id):
                 }
                 
                 campaigns[campaign_index]['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                save_campaigns(campaigns)
+                datastore.update_item('campaigns', campaigns[campaign_index])
+                email_cache.invalidate_campaign(campaign_id)
                 return f'<script>alert("Campaign saved successfully!"); window.location.href="/campaign/{campaign_id}/preview";</script>'
         return "Campaign not found", 404
     
@@ -1759,6 +1625,10 @@ def campaign_preview(campaign_id):
     if not campaign:
         return "Campaign not found", 404
     
+    return email_cache.email_response(email_cache.rendered_email('preview', campaign, _campaign_preview_html))
+
+def _campaign_preview_html(campaign):
+    """Email HTML shown by the preview page"""
     # Use the same email generation logic as generate-email route
     # This ensures preview shows exactly what will be generated
     config = campaign.get('form_config', {})
@@ -2003,12 +1873,32 @@ def campaign_preview(campaign_id):
 
 @app.route('/campaign/<campaign_id>/generate-email')
 def generate_email(campaign_id):
+    from storage import put_object_bytes
+    
     campaign = get_campaign(campaign_id)
     if not campaign:
         return "Campaign not found", 404
     
+    email_html = email_cache.rendered_email('email', campaign, _generated_email_html)['body']
+    
+    # Save to DigitalOcean Spaces
+    result = put_object_bytes('email_template.html', email_html, content_type='text/html; charset=utf-8')
+    
+    if result['success']:
+        return '<script>alert("Email HTML generated and saved to cloud storage!"); window.location.href="/campaign/' + campaign_id + '/edit";</script>'
+    else:
+        return '<script>alert("Email HTML generated but failed to save to cloud storage"); window.location.href="/campaign/' + campaign_id + '/edit";</script>'
+
+def _generated_email_html(campaign):
+    """Standalone email HTML saved by generate-email"""
     config = campaign.get('form_config', {})
     
+    # Format body copy with proper paragraphs
+    body_paragraphs = ''
+    if campaign.get('body_copy'):
+        paras = [p.strip() for p in campaign['body_copy'].split('\n\n') if p.strip()]
+        body_paragraphs = ''.join([f'<p style="font-size: 17px; line-height: 1.7; margin: 0 0 20px 0; color: #555555;">{para}</p>' for para in paras])
+    
     # Determine which option is pre-selected for Q1
     q1_checked = ''
     if config.get('q1_opt1_preselect'):
@@ -2243,21 +2133,7 @@ def generate_email(campaign_id):
 </body>
 </html>'''
     
-    # Save to DigitalOcean Spaces
-    from storage import upload_file_to_spaces
-    import os
-    
-    temp_path = '/tmp/email_template_generated.html'
-    with open(temp_path, 'w') as f:
-        f.write(email_html)
-    
-    result = upload_file_to_spaces(temp_path, 'email_template.html')
-    os.remove(temp_path)
-    
-    if result['success']:
-        return '<script>alert("Email HTML generated and saved to cloud storage!"); window.location.href="/campaign/' + campaign_id + '/edit";</script>'
-    else:
-        return '<script>alert("Email HTML generated but failed to save to cloud storage"); window.location.href="/campaign/' + campaign_id + '/edit";</script>'
+    return email_html
 
 @app.route('/campaign/<campaign_id>/download-html')
 def download_campaign_html(campaign_id):
@@ -2266,109 +2142,84 @@ def download_campaign_html(campaign_id):
     if not campaign:
         return "Campaign not found", 404
     
-    from flask import make_response
+    # Rendered once per campaign version and sent with download headers
+    entry = email_cache.rendered_email('download', campaign, generate_email_html_content)
+    return email_cache.email_response(entry, download_name=f'campaign_{campaign_id}.html')
+
+@app.route('/campaign/<campaign_id>/personalize', methods=['POST'])
+def campaign_personalize(campaign_id):
+    """Render the campaign for every client in a past client segment (background job)"""
+    from jobs import submit_job
+    from email_batch import personalized_emails_job, OUTPUT_FORMATS
+    from file_catalog import list_catalog_files
     
-    # Generate the email HTML
-    email_html = generate_email_html_content(campaign)
+    campaign = get_campaign(campaign_id)
+    if not campaign:
+        return "Campaign not found", 404
     
-    # Create response with download headers
-    response = make_response(email_html)
-    response.headers['Content-Type'] = 'text/html; charset=utf-8'
-    response.headers['Content-Disposition'] = f'attachment; filename=campaign_{campaign_id}.html'
+    segment = datastore.get_item('past_clients', request.form.get('segment_id', ''))
+    if not segment:
+        return f'<script>alert("Choose a past client segment first"); window.location.href="/campaign/{campaign_id}";</script>'
     
-    return response
-
-@app.route('/campaign/new', methods=['GET', 'POST'])
+    output_format = request.form.get('format', 'zip')
+    if output_format not in OUTPUT_FORMATS:
+        output_format = 'zip'
+    
+    # Default to every uploaded client data file
+    selected_files = request.form.getlist('selected_files') or [f['key'] for f in list_catalog_files()['files']]
+    if not selected_files:
+        return f'<script>alert("No client data files uploaded yet"); window.location.href="/campaign/{campaign_id}";</script>'
+    
+    job_id = submit_job(personalized_emails_job, {
+        'campaign_id': campaign_id,
+        'segment_id': segment['id'],
+        'selected_files': selected_files,
+        'format': output_format
+    })
+    return job_progress_page(job_id, f'Personalizing {campaign["name"]} for {segment["name"]}',
+                             f'/campaign/{campaign_id}/personalized/{job_id}')
+
+@app.route('/campaign/<campaign_id>/personalized/<job_id>')
+def campaign_personalized_download(campaign_id, job_id):
+    """Download the emails written by a personalize job"""
+    from flask import send_file
+    from jobs import get_job
+    
+    job = get_job(job_id)
+    # Only serve files written by a personalize job for this campaign
+    if job is None or job['handler'] != 'email_batch.personalized_emails_job':
+        return "Job not found", 404
+    if job['status'] != 'done':
+        return redirect(f'/campaign/{campaign_id}')
+    if job['result'].get('campaign_id') != campaign_id:
+        return "Job not found", 404
+    if not os.path.exists(job['result']['path']):
+        return redirect(f'/campaign/{campaign_id}')
+    
+    return send_file(job['result']['path'], as_attachment=True, download_name=job['result']['filename'])
+
+@app.route('/campaign/new', methods=['GET', 'POST'])
 def campaign_new():
     # Get segment from query param for pre-selection
     default_segment = request.args.get('segment', 'general')
     
     if request.method == 'POST':
-        campaigns = load_campaigns()
+        from campaign_builder import create_campaign
         
-        # Generate campaign ID from name
-        campaign_name = request.form.get('name', '')
-        campaign_id = campaign_name.lower().replace(' ', '-').replace('_', '-')
+        new_campaign = create_campaign(request.form)
         
         # Check if ID already exists
-        if any(c['id'] == campaign_id for c in campaigns):
+        if new_campaign is None:
             return '<script>alert("Campaign ID already exists. Please use a different name."); window.history.back();</script>'
         
-        new_campaign = {
-            'id': campaign_id,
-            'name': campaign_name,
-            'segment': request.form.get('segment', 'general'),
-            'status': request.form.get('status', 'draft'),
-            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'subject': request.form.get('subject', ''),
-            'headline': request.form.get('headline', ''),
-            'subheadline': request.form.get('subheadline', ''),
-            'body_headline': request.form.get('body_headline', ''),
-            'cta_text': request.form.get('cta_text', 'Get Started'),
-            'body_copy': request.form.get('body_copy', ''),
-            'form_config': {
-                'show_callout': True,  # Always show callout box
-                'callout_title': request.form.get('callout_title', ''),
-                'callout_main_text': request.form.get('callout_main_text', ''),
-                'callout_subtitle': request.form.get('callout_subtitle', ''),
-                'cta_agent_message': request.form.get('cta_agent_message', ''),
-                'cta_tagline': request.form.get('cta_tagline', ''),
-                'cta_button_text': request.form.get('cta_button_text', 'GET MY EQUITY PLAN'),
-                'cta_agent_photo': request.form.get('cta_agent_photo', ''),
-                'q1_text': request.form.get('q1_text', ''),
-                'q1_subtitle': request.form.get('q1_subtitle', ''),
-                'q1_opt1_label': request.form.get('q1_opt1_label', ''),
-                'q1_opt1_desc': request.form.get('q1_opt1_desc', ''),
-                'q1_opt2_label': request.form.get('q1_opt2_label', ''),
-                'q1_opt2_desc': request.form.get('q1_opt2_desc', ''),
-                'q1_opt3_label': request.form.get('q1_opt3_label', ''),
-                'q1_opt3_desc': request.form.get('q1_opt3_desc', ''),
-                'q1_opt4_label': request.form.get('q1_opt4_label', ''),
-                'q1_opt4_desc': request.form.get('q1_opt4_desc', ''),
-                'q2_text': request.form.get('q2_text', ''),
-                'q2_subtitle': request.form.get('q2_subtitle', ''),
-                'q2_opt1': request.form.get('q2_opt1', ''),
-                'q2_opt2': request.form.get('q2_opt2', ''),
-                'q2_opt3': request.form.get('q2_opt3', ''),
-                'q2_opt4': request.form.get('q2_opt4', ''),
-                'q3_text': request.form.get('q3_text', ''),
-                'q3_subtitle': request.form.get('q3_subtitle', ''),
-                'q3_opt1': request.form.get('q3_opt1', ''),
-                'q3_opt2': request.form.get('q3_opt2', ''),
-                'q3_opt3': request.form.get('q3_opt3', ''),
-                'q3_opt4': request.form.get('q3_opt4', '')
-            },
-            'form_fields': {
-                'email': True,
-                'firstName': True,
-                'lastName': True,
-                'phoneNumber': True,
-                'equity_priority': True,
-                'goals': True,
-                'wantsReport': True,
-                'wantsExpert': True
-            },
-            'colors': {
-                'primary': '#004237',
-                'accent': '#fcbfa7',
-                'background': '#f7f3e5'
-            }
-        }
-        
-        campaigns.append(new_campaign)
-        save_campaigns(campaigns)
+        campaign_id = new_campaign['id']
         return f'<script>alert("Campaign created successfully!"); window.location.href="/campaign/{campaign_id}/preview";</script>'
     
     # Load behavioral audiences from database
     behavioral_audiences = load_behavioral_audiences()
     
     # Load past client segments
-    try:
-        with open('past_clients.json', 'r') as f:
-            past_client_segments = json.load(f)
-    except:
-        past_client_segments = []
+    past_client_segments = load_past_clients()
     
     # Load template and replace placeholders
     with open('templates/campaign_new_complete.html', 'r') as f:
@@ -2410,18 +2261,17 @@ def campaign_new():
 def segments_dashboard():
     segments = load_segments()
     campaigns = load_campaigns()
-    submissions = load_submissions()
+    submission_totals = datastore.segment_submission_stats()
     
     # Calculate stats per segment
     segment_stats = {}
     for segment in segments:
         segment_id = segment['id']
         segment_campaigns = [c for c in campaigns if c.get('segment') == segment_id]
-        segment_submissions = [s for s in submissions if any(c['id'] == s.get('campaign_id') for c in segment_campaigns)]
         
         segment_stats[segment_id] = {
             'campaigns': len(segment_campaigns),
-            'submissions': len(segment_submissions),
+            'submissions': submission_totals.get(segment_id, datastore.empty_stats())['total'],
             'active_campaigns': sum(1 for c in segment_campaigns if c.get('status') == 'active')
         }
     
@@ -2528,9 +2378,8 @@ def campaign_delete(campaign_id):
     if campaign_id == 'home-equity-2025':
         return '<script>alert("Cannot delete the initial template campaign."); window.location.href="/campaigns";</script>'
     
-    campaigns = load_campaigns()
-    campaigns = [c for c in campaigns if c['id'] != campaign_id]
-    save_campaigns(campaigns)
+    datastore.delete_item('campaigns', campaign_id)
+    email_cache.invalidate_campaign(campaign_id)
     return '<script>alert("Campaign deleted successfully!"); window.location.href="/campaigns";</script>'
 
 @app.route('/segments/<segment_id>')
@@ -2539,13 +2388,12 @@ def segment_campaigns(segment_id):
     if not segment:
         return "Segment not found", 404
     
-    campaigns = load_campaigns()
-    segment_campaigns = [c for c in campaigns if c.get('segment') == segment_id]
-    submissions = load_submissions()
+    segment_campaigns = datastore.find_items('campaigns', segment=segment_id)
+    campaign_stats = datastore.campaign_submission_stats()
     
     campaigns_html = ""
     for campaign in segment_campaigns:
-        campaign_submissions = [s for s in submissions if s.get('campaign_id') == campaign['id']]
+        stats = campaign_stats.get(campaign['id'], datastore.empty_stats())
         status_badge = f'<span style="background: {"#004237" if campaign["status"] == "active" else "#fcbfa7"}; color: white; padding: 4px 12px; border-radius: 12px; font-size: 11px; text-transform: uppercase; font-weight: 600;">{campaign["status"]}</span>'
         
         campaigns_html += f"""
@@ -2572,11 +2420,11 @@ def segment_campaigns(segment_id):
             <div style="display: grid; grid-template-columns: repeat(2, 1fr); gap: 15px; margin-bottom: 15px;">
                 <div style="background: #f7f3e5; padding: 15px; border-radius: 8px;">
                     <div style="color: #999; font-size: 11px; text-transform: uppercase; margin-bottom: 4px;">Total Submissions</div>
-                    <div style="color: #004237; font-size: 24px; font-weight: 700;">{len(campaign_submissions)}</div>
+                    <div style="color: #004237; font-size: 24px; font-weight: 700;">{stats['total']}</div>
                 </div>
                 <div style="background: #f7f3e5; padding: 15px; border-radius: 8px;">
                     <div style="color: #999; font-size: 11px; text-transform: uppercase; margin-bottom: 4px;">Pending</div>
-                    <div style="color: #fcbfa7; font-size: 24px; font-weight: 700;">{sum(1 for s in campaign_submissions if s.get('status') == 'pending')}</div>
+                    <div style="color: #fcbfa7; font-size: 24px; font-weight: 700;">{stats['pending']}</div>
                 </div>
             </div>
             
@@ -2676,7 +2524,7 @@ def segment_edit(segment_id):
                 segments[i]['name'] = request.form.get('name', seg['name'])
                 segments[i]['description'] = request.form.get('description', seg['description'])
                 segments[i]['color'] = request.form.get('color', seg['color'])
-                save_segments(segments)
+                datastore.update_item('segments', segments[i])
                 return '<script>alert("Segment updated successfully!"); window.location.href="/segments";</script>'
         return "Segment not found", 404
     
@@ -2782,12 +2630,10 @@ def segment_edit(segment_id):
 @app.route('/segments/new', methods=['GET', 'POST'])
 def segment_new():
     if request.method == 'POST':
-        segments = load_segments()
-        
         segment_name = request.form.get('name', '')
         segment_id = segment_name.lower().replace(' ', '-')
         
-        if any(s['id'] == segment_id for s in segments):
+        if get_segment(segment_id):
             return '<script>alert("Segment ID already exists."); window.history.back();</script>'
         
         new_segment = {
@@ -2798,8 +2644,7 @@ def segment_new():
             'icon': '$'
         }
         
-        segments.append(new_segment)
-        save_segments(segments)
+        datastore.insert_item('segments', new_segment)
         return '<script>alert("Segment created successfully!"); window.location.href="/segments";</script>'
     
     return '''<!DOCTYPE html>
@@ -2922,17 +2767,35 @@ def check_campaign_exists():
 
 @app.route('/api/generate-campaign', methods=['POST'])
 def api_generate_campaign():
-    """API endpoint to generate campaign content using AI"""
+    """API endpoint to generate campaign content using AI (JSON, or server-sent events with "stream": true)"""
     data = request.json
     segment_id = data.get('segment_id')
     campaign_name = data.get('campaign_name', '')
     custom_prompt = data.get('custom_prompt', '')
+    regenerate = bool(data.get('regenerate'))
     
     if not segment_id:
         return jsonify({"error": "segment_id is required"}), 400
     
-    # Generate content using AI
-    content = generate_campaign_content(segment_id, campaign_name, custom_prompt)
+    # Streaming mode: server-sent events with each field as soon as it's written
+    if data.get('stream'):
+        def events():
+            for event in stream_campaign_content(segment_id, campaign_name, custom_prompt, regenerate=regenerate):
+                if event[0] == 'text':
+                    body = {"text": event[1]}
+                elif event[0] == 'field':
+                    body = {"name": event[1], "value": event[2]}
+                elif event[0] == 'done':
+                    body = event[1]
+                else:
+                    body = {"error": event[1]}
+                yield f"event: {event[0]}\ndata: {json.dumps(body)}\n\n"
+        
+        return Response(stream_with_context(events()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    
+    # Generate content using AI (cached unless a new version is asked for)
+    content = generate_campaign_content(segment_id, campaign_name, custom_prompt, regenerate=regenerate)
     
     if "error" in content:
         return jsonify(content), 500
@@ -2998,12 +2861,7 @@ def edit_audience(audience_id):
 @app.route('/audiences/<audience_id>/delete')
 def delete_audience(audience_id):
     """Delete a behavioral audience"""
-    audiences = load_behavioral_audiences()
-    audiences = [a for a in audiences if a['id'] != audience_id]
-    
-    # Save updated list
-    with open('behavioral_audiences.json', 'w') as f:
-        json.dump(audiences, f, indent=2)
+    datastore.delete_item('audiences', audience_id)
     
     return redirect('/audiences')
 
@@ -3014,37 +2872,30 @@ def api_update_audience():
         data = request.json
         audience_id = data.get('audience_id')
         
-        audiences = load_behavioral_audiences()
-        
         # Find and update the audience
-        for i, aud in enumerate(audiences):
-            if aud['id'] == audience_id:
-                # Update fields
-                aud['audience_name'] = data.get('audience_name', aud['audience_name'])
-                aud['segment_summary'] = data.get('segment_summary', aud.get('segment_summary', ''))
-                
-                # Update demographics if provided
-                if 'demographics' in data:
-                    aud['demographics'] = data['demographics']
-                
-                # Update psychographics if provided
-                if 'psychographics' in data:
-                    aud['psychographics'] = data['psychographics']
-                
-                # Update behavior if provided
-                if 'behavior' in data:
-                    aud['behavior'] = data['behavior']
-                
-                # Update communication style if provided
-                if 'communication_style' in data:
-                    aud['communication_style'] = data['communication_style']
-                
-                audiences[i] = aud
-                break
-        
-        # Save updated list
-        with open('behavioral_audiences.json', 'w') as f:
-            json.dump(audiences, f, indent=2)
+        aud = datastore.get_item('audiences', audience_id)
+        if aud:
+            # Update fields
+            aud['audience_name'] = data.get('audience_name', aud['audience_name'])
+            aud['segment_summary'] = data.get('segment_summary', aud.get('segment_summary', ''))
+            
+            # Update demographics if provided
+            if 'demographics' in data:
+                aud['demographics'] = data['demographics']
+            
+            # Update psychographics if provided
+            if 'psychographics' in data:
+                aud['psychographics'] = data['psychographics']
+            
+            # Update behavior if provided
+            if 'behavior' in data:
+                aud['behavior'] = data['behavior']
+            
+            # Update communication style if provided
+            if 'communication_style' in data:
+                aud['communication_style'] = data['communication_style']
+            
+            datastore.update_item('audiences', aud)
         
         return jsonify({"success": True})
     
@@ -3060,339 +2911,17 @@ def audience_builder():
 @app.route('/audiences')
 def audiences_list():
     """List all audiences (static + behavioral)"""
-    segments = load_segments()
-    behavioral_audiences = load_behavioral_audiences()
-    
-    # Build static segments cards
-    static_cards = ""
-    for seg in segments:
-        static_cards += f"""
-        <div class="campaign-card">
-            <div class="campaign-header">
-                <h3>{seg['name']}</h3>
-                <span class="badge" style="background: {seg['color']}; color: white;">Static Segment</span>
-            </div>
-            <p style="color: #666; margin: 12px 0;">{seg['description']}</p>
-            <div style="display: flex; gap: 10px; flex-wrap: wrap; margin-top: 16px;">
-                <a href="/campaign/new?segment={seg['id']}" style="padding: 10px 20px; background: #004237; color: white; text-decoration: none; border-radius: 6px; font-size: 14px; font-weight: 600;">Generate Campaign</a>
-                <a href="/audiences/{seg['id']}/edit" style="padding: 10px 20px; background: #fcbfa7; color: #004237; text-decoration: none; border-radius: 6px; font-size: 14px; font-weight: 600;">Edit</a>
-                <button onclick="if(confirm('Delete this audience?')) {{ fetch('/api/delete-audience', {{ method: 'POST', headers: {{ 'Content-Type': 'application/json' }}, body: JSON.stringify({{ audience_id: '{seg['id']}' }}) }}).then(() => location.reload()); }}" style="padding: 10px 20px; background: #dc3545; color: white; border: none; border-radius: 6px; font-size: 14px; font-weight: 600; cursor: pointer;">Delete</button>
-            </div>
-        </div>
-        """
-    
-    # Build behavioral audiences cards
-    behavioral_cards = ""
-    for aud in behavioral_audiences:
-        behavioral_cards += f"""
-        <div class="campaign-card">
-            <div class="campaign-header">
-                <h3>{aud['audience_name']}</h3>
-                <span class="badge" style="background: #fcbfa7; color: #004237;">Behavioral Audience</span>
-            </div>
-            <p style="color: #666; margin: 12px 0;">{aud.get('segment_summary', 'Custom behavioral audience')}</p>
-            <div style="display: flex; gap: 10px; flex-wrap: wrap; margin-top: 16px;">
-                <a href="/campaign/new?segment={aud['id']}" style="padding: 10px 20px; background: #004237; color: white; text-decoration: none; border-radius: 6px; font-size: 14px; font-weight: 600;">Generate Campaign</a>
-                <a href="/audiences/{aud['id']}/edit" style="padding: 10px 20px; background: #fcbfa7; color: #004237; text-decoration: none; border-radius: 6px; font-size: 14px; font-weight: 600;">Edit</a>
-                <a href="/audiences/{aud['id']}/delete" onclick="return confirm('Are you sure you want to delete this audience?')" style="padding: 10px 20px; background: #dc3545; color: white; text-decoration: none; border-radius: 6px; font-size: 14px; font-weight: 600;">Delete</a>
-            </div>
-        </div>
-        """
-    
-    return f"""<!DOCTYPE html>
-<html>
-<head>
-    <title>Audiences - The Keyes Company</title>
-    <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Arial, sans-serif;
-            background: #f7f3e5;
-            padding: 40px 20px;
-        }}
-        .container {{ max-width: 1200px; margin: 0 auto; }}
-        .header {{
-            background: linear-gradient(135deg, #004237 0%, #003329 100%);
-            color: white;
-            padding: 30px 40px;
-            border-radius: 12px;
-            margin-bottom: 30px;
-            box-shadow: 0 4px 12px rgba(0,0,0,0.15);
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-        }}
-        .header h1 {{ font-size: 32px; }}
-        .header p {{ margin-top: 8px; opacity: 0.9; }}
-        .tabs {{
-            display: flex;
-            gap: 10px;
-            margin-bottom: 30px;
-            border-bottom: 2px solid #e0e0e0;
-        }}
-        .tab {{
-            padding: 12px 24px;
-            background: transparent;
-            color: #666;
-            text-decoration: none;
-            border-bottom: 3px solid transparent;
-            font-weight: 600;
-            transition: all 0.3s;
-            cursor: pointer;
-        }}
-        .tab:hover {{ color: #004237; }}
-        .tab.active {{
-            color: #004237;
-            border-bottom-color: #fcbfa7;
-        }}
-        .btn-create {{
-            background: #fcbfa7;
-            color: #004237;
-            padding: 12px 24px;
-            border-radius: 8px;
-            text-decoration: none;
-            font-weight: 600;
-            font-size: 15px;
-            transition: all 0.3s;
-        }}
-        .btn-create:hover {{ background: #fda67a; }}
-        .section-title {{
-            font-size: 20px;
-            color: #004237;
-            margin: 30px 0 15px 0;
-            font-weight: 600;
-        }}
-        .campaign-card {{
-            background: white;
-            border-radius: 12px;
-            padding: 24px;
-            margin-bottom: 16px;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.08);
-            transition: all 0.3s;
-        }}
-        .campaign-card:hover {{ box-shadow: 0 4px 16px rgba(0,0,0,0.12); transform: translateY(-2px); }}
-        .campaign-header {{
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 12px;
-        }}
-        .campaign-header h3 {{ color: #004237; font-size: 20px; }}
-        .badge {{
-            padding: 6px 12px;
-            border-radius: 6px;
-            font-size: 12px;
-            font-weight: 600;
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <div style="display: flex; align-items: center; gap: 20px;">
-                <a href="/" style="color: white; text-decoration: none; font-size: 24px; opacity: 0.8; transition: opacity 0.3s;" onmouseover="this.style.opacity='1'" onmouseout="this.style.opacity='0.8'">←</a>
-                <div>
-                    <h1>Audiences</h1>
-                    <p>Manage your static segments and behavioral audiences</p>
-                </div>
-            </div>
-            <a href="/audiences/new" class="btn-create">+ Create New Audience</a>
-        </div>
-        
-        <div class="tabs">
-            <a href="/audiences" class="tab active">All Audiences</a>
-            <a href="/audiences/past-clients" class="tab">Past Client</a>
-        </div>
-        
-        <h2 class="section-title">Static Segments</h2>
-        {static_cards}
-        
-        <h2 class="section-title">Behavioral Audiences</h2>
-        {behavioral_cards if behavioral_cards else '<p style="text-align: center; color: #999; padding: 40px; background: white; border-radius: 12px;">No behavioral audiences yet. <a href="/audiences/new" style="color: #004237; font-weight: 600;">Create your first one!</a></p>'}
-    </div>
-</body>
-</html>
-"""
+    return render_template(
+        'audiences.html',
+        segments=load_segments(),
+        behavioral_audiences=load_behavioral_audiences()
+    )
 
 
 @app.route('/audiences/past-clients')
 def past_clients():
     """Past Client page with 10 unified segments"""
-    from storage import list_files_in_spaces
-    
-    # Load past client segments
-    with open('past_clients.json', 'r') as f:
-        segments = json.load(f)
-    
-    # Get uploaded files from Spaces
-    files = list_files_in_spaces()
-    
-    # Build files table
-    files_html = ""
-    for file in files:
-        size_mb = file['size'] / (1024 * 1024)
-        date = file['last_modified'].strftime('%Y-%m-%d %H:%M')
-        files_html += f'''
-        <tr>
-            <td><input type="checkbox" name="selected_files" value="{file['key']}" class="file-checkbox"></td>
-            <td>{file['filename']}</td>
-            <td>{size_mb:.2f} MB</td>
-            <td>{date}</td>
-        </tr>
-        '''
-    
-    if not files_html:
-        files_html = '<tr><td colspan="4" style="text-align: center; color: #999; padding: 20px;">No files uploaded yet. Upload a CSV file above to get started.</td></tr>'
-    
-    # Build segment cards
-    segment_cards = ""
-    for seg in segments:
-        # Handle subtiers for Equity Comfort Tiers
-        subtiers_html = ""
-        if 'subtiers' in seg:
-            subtiers_html = '<div style="margin-top: 16px; padding: 16px; background: #f9f9f9; border-radius: 8px;">'
-            subtiers_html += '<p style="font-size: 13px; font-weight: 600; color: #004237; margin-bottom: 12px;">Sub-Tiers:</p>'
-            for subtier in seg['subtiers']:
-                subtiers_html += f'<div style="display: flex; align-items: center; gap: 10px; margin-bottom: 8px;"><div style="width: 12px; height: 12px; border-radius: 50%; background: {subtier["color"]}"></div><span style="font-size: 13px; color: #666;"><strong>{subtier["name"]}:</strong> {subtier["formula"]}</span></div>'
-            subtiers_html += '</div>'
-        
-        segment_cards += f"""
-        <div class="campaign-card">
-            <div class="campaign-header">
-                <div style="display: flex; align-items: center; gap: 12px;">
-                    <div style="width: 20px; height: 20px; border-radius: 4px; background: {seg['color']}"></div>
-                    <h3>{seg['name']}</h3>
-                </div>
-                <span class="badge" style="background: {seg['color']}; color: white;">Count: {seg['count']}</span>
-            </div>
-            <p style="color: #666; margin: 12px 0; line-height: 1.6;">{seg['description']}</p>
-            <div style="background: #f7f3e5; padding: 12px; border-radius: 6px; margin: 12px 0;">
-                <p style="font-size: 13px; color: #666; font-family: 'Courier New', monospace;"><strong>Formula:</strong> {seg['formula']}</p>
-            </div>
-            {subtiers_html}
-            <div style="display: flex; gap: 10px; flex-wrap: wrap; margin-top: 16px;">
-                <a href="/campaign/new?segment={seg['id']}" style="padding: 10px 20px; background: #004237; color: white; text-decoration: none; border-radius: 6px; font-size: 14px; font-weight: 600;">Generate Campaign</a>
-                <a href="/audiences/past-clients/{seg['id']}/analytics" style="padding: 10px 20px; background: #fcbfa7; color: #004237; text-decoration: none; border-radius: 6px; font-size: 14px; font-weight: 600;">View Analytics</a>
-                <a href="/audiences/past-clients/{seg['id']}/edit" style="padding: 10px 20px; background: #006652; color: white; text-decoration: none; border-radius: 6px; font-size: 14px; font-weight: 600;">Edit Segment</a>
-            </div>
-        </div>
-        """
-    
-    return f"""<!DOCTYPE html>
-<html>
-<head>
-    <title>Past Client Segments - The Keyes Company</title>
-    <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Arial, sans-serif;
-            background: #f7f3e5;
-            padding: 40px 20px;
-        }}
-        .container {{ max-width: 1200px; margin: 0 auto; }}
-        .header {{
-            background: linear-gradient(135deg, #004237 0%, #003329 100%);
-            color: white;
-            padding: 30px 40px;
-            border-radius: 12px;
-            margin-bottom: 30px;
-            box-shadow: 0 4px 12px rgba(0,0,0,0.15);
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-        }}
-        .header h1 {{ font-size: 32px; }}
-        .header p {{ margin-top: 8px; opacity: 0.9; }}
-        .tabs {{
-            display: flex;
-            gap: 10px;
-            margin-bottom: 30px;
-            border-bottom: 2px solid #e0e0e0;
-        }}
-        .tab {{
-            padding: 12px 24px;
-            background: transparent;
-            color: #666;
-            text-decoration: none;
-            border-bottom: 3px solid transparent;
-            font-weight: 600;
-            transition: all 0.3s;
-            cursor: pointer;
-        }}
-        .tab:hover {{ color: #004237; }}
-        .tab.active {{
-            color: #004237;
-            border-bottom-color: #fcbfa7;
-        }}
-        .campaign-card {{
-            background: white;
-            border-radius: 12px;
-            padding: 24px;
-            margin-bottom: 16px;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.08);
-            transition: all 0.3s;
-        }}
-        .campaign-card:hover {{ box-shadow: 0 4px 16px rgba(0,0,0,0.12); transform: translateY(-2px); }}
-        .campaign-header {{
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 12px;
-        }}
-        .campaign-header h3 {{ color: #004237; font-size: 20px; }}
-        .badge {{
-            padding: 6px 12px;
-            border-radius: 6px;
-            font-size: 12px;
-            font-weight: 600;
-        }}
-        .info-box {{
-            background: #fefbf9;
-            padding: 20px;
-            border-radius: 12px;
-            margin-bottom: 30px;
-            color: #004237;
-            border: 2px solid #f0e6d8;
-        }}
-        .info-box h3 {{ margin-bottom: 8px; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <div style="display: flex; align-items: center; gap: 20px;">
-                <a href="/" style="color: white; text-decoration: none; font-size: 24px; opacity: 0.8; transition: opacity 0.3s;" onmouseover="this.style.opacity='1'" onmouseout="this.style.opacity='0.8'">←</a>
-                <div>
-                    <h1>Past Client Segments</h1>
-                    <p>10 unified segments for targeting past clients with precision</p>
-                </div>
-            </div>
-        </div>
-        
-        <div class="tabs">
-            <a href="/audiences" class="tab">All Audiences</a>
-            <a href="/audiences/past-clients" class="tab active">Past Client</a>
-        </div>
-        
-        <div class="info-box">
-            <h3>File Management</h3>
-            <p style="margin-bottom: 16px;">Upload client data files to use for segment calculations. Manage file selection when editing or creating segments.</p>
-            
-            <form action="/admin/upload-files" method="post" enctype="multipart/form-data" style="margin-bottom: 20px;" onsubmit="document.getElementById('uploadBtn').disabled=true; document.getElementById('uploadBtn').innerText='Uploading...'; return true;">
-                <input type="file" name="files" accept=".csv,.xlsx,.xls" multiple required style="padding: 8px; border: 2px solid #004237; border-radius: 6px; background: white;">
-                <button type="submit" id="uploadBtn" style="padding: 10px 24px; background: #004237; color: white; border: none; border-radius: 6px; font-weight: 600; cursor: pointer; margin-left: 10px;">Upload Files</button>
-            </form>
-            
-            <div style="margin-top: 16px;">
-                <a href="/audiences/past-clients/new" style="padding: 10px 24px; background: #fcbfa7; color: #004237; text-decoration: none; border-radius: 6px; font-weight: 600; display: inline-block;">Create New Segment</a>
-            </div>
-        </div>
-        
-        {segment_cards}
-    </div>
-</body>
-</html>
-"""
+    return render_template('past_clients.html', segments=load_past_clients())
 
 
 
@@ -3403,34 +2932,26 @@ def fix_segment_ids():
 
 @app.route('/admin/debug-segments')
 def debug_segments():
-    """Debug route to see what's in past_clients.json"""
+    """Debug route to see the stored past client segments"""
     import json
-    import os
     
     output = "<h1>Debug: Past Client Segments</h1>"
     
-    # Check if file exists
-    if os.path.exists('past_clients.json'):
-        output += "<p style='color: green;'>✓ past_clients.json EXISTS</p>"
+    try:
+        segments = load_past_clients()
         
-        try:
-            with open('past_clients.json', 'r') as f:
-                segments = json.load(f)
-            
-            output += f"<p><strong>Total segments:</strong> {len(segments)}</p>"
-            output += "<table border='1' cellpadding='10'><tr><th>ID</th><th>Name</th><th>Description</th><th>Formula</th><th>Count</th></tr>"
-            
-            for seg in segments:
-                output += f"<tr><td>{seg.get('id', 'NO ID')}</td><td>{seg.get('name', 'NO NAME')}</td><td>{seg.get('description', 'NO DESC')}</td><td>{seg.get('formula', 'NO FORMULA')}</td><td>{seg.get('count', 0)}</td></tr>"
-            
-            output += "</table>"
-            
-            output += "<h2>Raw JSON:</h2><pre>" + json.dumps(segments, indent=2) + "</pre>"
-            
-        except Exception as e:
-            output += f"<p style='color: red;'>ERROR reading file: {str(e)}</p>"
-    else:
-        output += "<p style='color: red;'>✗ past_clients.json DOES NOT EXIST</p>"
+        output += f"<p><strong>Total segments:</strong> {len(segments)}</p>"
+        output += "<table border='1' cellpadding='10'><tr><th>ID</th><th>Name</th><th>Description</th><th>Formula</th><th>Count</th></tr>"
+        
+        for seg in segments:
+            output += f"<tr><td>{seg.get('id', 'NO ID')}</td><td>{seg.get('name', 'NO NAME')}</td><td>{seg.get('description', 'NO DESC')}</td><td>{seg.get('formula', 'NO FORMULA')}</td><td>{seg.get('count', 0)}</td></tr>"
+        
+        output += "</table>"
+        
+        output += "<h2>Raw JSON:</h2><pre>" + json.dumps(segments, indent=2) + "</pre>"
+        
+    except Exception as e:
+        output += f"<p style='color: red;'>ERROR reading segments: {str(e)}</p>"
     
     output += "<br><a href='/audiences/past-clients'>← Back to Past Clients</a>"
     
@@ -3463,9 +2984,8 @@ def debug_segments():
 @app.route('/audiences/past-clients/new', methods=['GET', 'POST'])
 def create_past_client_segment():
     """Create a new past client segment"""
-    import json
     from formula_evaluator import validate_formula, get_available_fields
-    from storage import list_files_in_spaces
+    from file_catalog import list_catalog_files
     import uuid
     
     if request.method == 'POST':
@@ -3485,148 +3005,33 @@ def create_past_client_segment():
         if not validation['valid']:
             return f'<script>alert("Invalid formula: {validation["message"]}"); window.history.back();</script>'
         
-        # Load existing segments
-        with open('past_clients.json', 'r') as f:
-            segments = json.load(f)
-        
-        # Create new segment
-        new_segment = {
-            'id': str(uuid.uuid4())[:8],
-            'name': name,
-            'description': description,
-            'formula': formula,
-            'color': color,
-            'count': 0,
-            'selected_files': selected_files
-        }
-        
-        # Calculate count if files selected
-        if selected_files:
-            import pandas as pd
-            from storage import download_file_from_spaces
-            from formula_evaluator import evaluate_formula
-            import os
-            
-            try:
-                # Download and merge selected files
-                dfs = []
-                for file_key in selected_files:
-                    local_path = f'/tmp/{file_key.split("/")[-1]}'
-                    result = download_file_from_spaces(file_key, local_path)
-                    if result['success']:
-                        if local_path.endswith('.csv'):
-                            df = pd.read_csv(local_path)
-                        else:
-                            df = pd.read_excel(local_path)
-                        dfs.append(df)
-                        os.remove(local_path)
-                
-                merged_df = pd.concat(dfs, ignore_index=True)
-                
-                # Prepare data
-                if 'AGE' in merged_df.columns:
-                    merged_df['AGE'] = pd.to_numeric(merged_df['AGE'], errors='coerce')
-                if 'CURRENT_SALE_MTG_1_LOAN_AMOUNT' in merged_df.columns:
-                    merged_df['CURRENT_SALE_MTG_1_LOAN_AMOUNT'] = pd.to_numeric(merged_df['CURRENT_SALE_MTG_1_LOAN_AMOUNT'], errors='coerce').fillna(0)
-                if 'CURRENT_AVM_VALUE' in merged_df.columns:
-                    merged_df['CURRENT_AVM_VALUE'] = pd.to_numeric(merged_df['CURRENT_AVM_VALUE'], errors='coerce')
-                if 'CURRENT_SALE_MTG_1_INT_RATE' in merged_df.columns:
-                    merged_df['CURRENT_SALE_MTG_1_INT_RATE'] = pd.to_numeric(merged_df['CURRENT_SALE_MTG_1_INT_RATE'], errors='coerce')
-                if 'LENGTH_OF_RESIDENCE' in merged_df.columns:
-                    merged_df['LENGTH_OF_RESIDENCE'] = pd.to_numeric(merged_df['LENGTH_OF_RESIDENCE'], errors='coerce')
-                if 'SUM_BUILDING_SQFT' in merged_df.columns:
-                    merged_df['SUM_BUILDING_SQFT'] = pd.to_numeric(merged_df['SUM_BUILDING_SQFT'], errors='coerce')
-                
-                merged_df['EQUITY'] = merged_df['CURRENT_AVM_VALUE'] - merged_df['CURRENT_SALE_MTG_1_LOAN_AMOUNT']
-                merged_df['MEDIAN_HOME_PRICE'] = 500000
-                merged_df['MEDIAN_SQFT'] = 2000
-                if 'CURRENT_SALE_RECORDING_DATE' in merged_df.columns:
-                    merged_df['SALE_YEAR'] = pd.to_datetime(merged_df['CURRENT_SALE_RECORDING_DATE'], errors='coerce').dt.year
-                merged_df['EQUITY_COMFORT_SCORE'] = merged_df['EQUITY'] / merged_df['MEDIAN_HOME_PRICE']
-                
-                # Calculate count
-                count = evaluate_formula(merged_df, formula)
-                new_segment['count'] = count
-                
-                # Calculate analytics for AI generator
-                print(f"[ANALYTICS] Starting analytics calculation for {count} matching records")
-                # Filter to matching records only
-                if formula and count > 0:
-                    from formula_evaluator import parse_formula
-                    try:
-                        query = parse_formula(formula)
-                        print(f"[ANALYTICS] Parsed query: {query}")
-                        matching_df = merged_df.query(query)
-                        print(f"[ANALYTICS] Filtered to {len(matching_df)} records")
-                    except Exception as e:
-                        print(f"[ANALYTICS ERROR] Query failed: {e}")
-                        matching_df = merged_df
-                else:
-                    matching_df = merged_df
-                
-                # Age distribution
-                try:
-                    if 'AGE' in matching_df.columns:
-                        age_data = matching_df['AGE'].dropna()
-                        if len(age_data) > 0:
-                            new_segment['median_age'] = int(age_data.median())
-                            new_segment['age_distribution'] = {
-                                '25-34': int(((age_data >= 25) & (age_data < 35)).sum()),
-                                '35-44': int(((age_data >= 35) & (age_data < 45)).sum()),
-                                '45-54': int(((age_data >= 45) & (age_data < 55)).sum()),
-                                '55-64': int(((age_data >= 55) & (age_data < 65)).sum()),
-                                '65+': int((age_data >= 65).sum())
-                            }
-                            print(f"[ANALYTICS] ✓ Age: median={new_segment['median_age']}")
-                except Exception as e:
-                    print(f"[ANALYTICS ERROR] Age calculation failed: {e}")
-                
-                # Equity distribution
-                try:
-                    if 'EQUITY' in matching_df.columns:
-                        equity_data = matching_df['EQUITY'].dropna()
-                        if len(equity_data) > 0:
-                            new_segment['median_equity'] = int(equity_data.median())
-                            new_segment['equity_distribution'] = {
-                                '<100k': int((equity_data < 100000).sum()),
-                                '100k-250k': int(((equity_data >= 100000) & (equity_data < 250000)).sum()),
-                                '250k-500k': int(((equity_data >= 250000) & (equity_data < 500000)).sum()),
-                                '500k-1M': int(((equity_data >= 500000) & (equity_data < 1000000)).sum()),
-                                '1M+': int((equity_data >= 1000000).sum())
-                            }
-                            print(f"[ANALYTICS] ✓ Equity: median=${new_segment['median_equity']:,}")
-                except Exception as e:
-                    print(f"[ANALYTICS ERROR] Equity calculation failed: {e}")
-                
-                # Home value distribution
-                try:
-                    if 'CURRENT_AVM_VALUE' in matching_df.columns:
-                        value_data = matching_df['CURRENT_AVM_VALUE'].dropna()
-                        if len(value_data) > 0:
-                            new_segment['median_home_value'] = int(value_data.median())
-                            print(f"[ANALYTICS] ✓ Home value: ${new_segment['median_home_value']:,}")
-                except Exception as e:
-                    print(f"[ANALYTICS ERROR] Home value calculation failed: {e}")
-                
-                # Length of residence
-                try:
-                    if 'LENGTH_OF_RESIDENCE' in matching_df.columns:
-                        lor_data = matching_df['LENGTH_OF_RESIDENCE'].dropna()
-                        if len(lor_data) > 0:
-                            new_segment['median_length_of_residence'] = int(lor_data.median())
-                            print(f"[ANALYTICS] ✓ Length of residence: {new_segment['median_length_of_residence']} years")
-                except Exception as e:
-                    print(f"[ANALYTICS ERROR] Length of residence calculation failed: {e}")
-                
-            except Exception as e:
-                return f'<script>alert("Error calculating count: {str(e)}"); window.history.back();</script>'
-        
-        # Add to segments
-        segments.append(new_segment)
+        # Create new segment
+        new_segment = {
+            'id': str(uuid.uuid4())[:8],
+            'name': name,
+            'description': description,
+            'formula': formula,
+            'color': color,
+            'count': 0,
+            'selected_files': selected_files
+        }
         
         # Save
-        with open('past_clients.json', 'w') as f:
-            json.dump(segments, f, indent=2)
+        datastore.insert_item('past_clients', new_segment)
+        
+        # Count and analytics run in the job pool so large files never block a worker
+        if selected_files:
+            from jobs import submit_job
+            from segment_jobs import refresh_segment_job
+            
+            job_id = submit_job(refresh_segment_job, {'segment_id': new_segment['id'], 'selected_files': selected_files})
+            return job_progress_page(
+                job_id,
+                f'Calculating segment: {name}',
+                '/audiences/past-clients',
+                confirm_text='Would you like to generate a campaign for this segment now?',
+                confirm_url=f'/campaign/new?segment={new_segment["id"]}'
+            )
         
         # Ask user if they want to generate a campaign
         return f'''<script>
@@ -3638,7 +3043,7 @@ def create_past_client_segment():
         </script>'''
     
     # GET request - show creation form
-    files = list_files_in_spaces()
+    files = list_catalog_files()['files']
     fields = get_available_fields()
     
     # Build fields HTML
@@ -3808,20 +3213,18 @@ def create_past_client_segment():
 @app.route('/audiences/past-clients/<segment_id>/edit', methods=['GET', 'POST'])
 def edit_past_client_segment(segment_id):
     """Edit a past client segment formula"""
-    import json
     from formula_evaluator import validate_formula, get_available_fields
-    from storage import list_files_in_spaces
+    from file_catalog import list_catalog_files
     
     # Load segments
-    with open('past_clients.json', 'r') as f:
-        segments = json.load(f)
+    segments = load_past_clients()
     
     segment = next((s for s in segments if s['id'] == segment_id), None)
     if not segment:
         return "Segment not found", 404
     
     # Get uploaded files
-    files = list_files_in_spaces()
+    files = list_catalog_files()['files']
     
     # Get currently selected files for this segment (if stored)
     selected_file_keys = segment.get('selected_files', [])
@@ -3838,154 +3241,34 @@ def edit_past_client_segment(segment_id):
         if not validation['valid']:
             return f'<script>alert("Invalid formula: {validation["message"]}"); window.history.back();</script>'
         
-        # Update segment
-        segment['formula'] = new_formula
-        if new_name:
-            segment['name'] = new_name
-        if new_description:
-            segment['description'] = new_description
-        
-        # Then recalculate with selected files
         selected_files = request.form.getlist('selected_files')
+        
+        def apply_edit(seg):
+            seg['formula'] = new_formula
+            if new_name:
+                seg['name'] = new_name
+            if new_description:
+                seg['description'] = new_description
+            if selected_files:
+                # Store selected files in segment
+                seg['selected_files'] = selected_files
+        
+        try:
+            datastore.modify_item('past_clients', segment_id, apply_edit)
+        except KeyError:
+            return '<script>alert("Segment not found"); window.history.back();</script>'
+        except Exception as e:
+            return f'<script>alert("Error: {str(e)}"); window.history.back();</script>'
+        
+        # Then recalculate with selected files in the job pool
         if selected_files:
-            # Store selected files in segment
-            segment['selected_files'] = selected_files
-            
-            # Trigger recalculation
-            import pandas as pd
-            from storage import download_file_from_spaces
-            from formula_evaluator import evaluate_formula
-            import os
-            
-            try:
-                # Download and merge selected files
-                dfs = []
-                for file_key in selected_files:
-                    local_path = f'/tmp/{file_key.split("/")[-1]}'
-                    result = download_file_from_spaces(file_key, local_path)
-                    if result['success']:
-                        if local_path.endswith('.csv'):
-                            df = pd.read_csv(local_path)
-                        else:
-                            df = pd.read_excel(local_path)
-                        dfs.append(df)
-                        os.remove(local_path)
-                
-                merged_df = pd.concat(dfs, ignore_index=True)
-                
-                # Prepare data
-                if 'AGE' in merged_df.columns:
-                    merged_df['AGE'] = pd.to_numeric(merged_df['AGE'], errors='coerce')
-                if 'CURRENT_SALE_MTG_1_LOAN_AMOUNT' in merged_df.columns:
-                    merged_df['CURRENT_SALE_MTG_1_LOAN_AMOUNT'] = pd.to_numeric(merged_df['CURRENT_SALE_MTG_1_LOAN_AMOUNT'], errors='coerce').fillna(0)
-                if 'CURRENT_AVM_VALUE' in merged_df.columns:
-                    merged_df['CURRENT_AVM_VALUE'] = pd.to_numeric(merged_df['CURRENT_AVM_VALUE'], errors='coerce')
-                if 'CURRENT_SALE_MTG_1_INT_RATE' in merged_df.columns:
-                    merged_df['CURRENT_SALE_MTG_1_INT_RATE'] = pd.to_numeric(merged_df['CURRENT_SALE_MTG_1_INT_RATE'], errors='coerce')
-                if 'LENGTH_OF_RESIDENCE' in merged_df.columns:
-                    merged_df['LENGTH_OF_RESIDENCE'] = pd.to_numeric(merged_df['LENGTH_OF_RESIDENCE'], errors='coerce')
-                if 'SUM_BUILDING_SQFT' in merged_df.columns:
-                    merged_df['SUM_BUILDING_SQFT'] = pd.to_numeric(merged_df['SUM_BUILDING_SQFT'], errors='coerce')
-                
-                merged_df['EQUITY'] = merged_df['CURRENT_AVM_VALUE'] - merged_df['CURRENT_SALE_MTG_1_LOAN_AMOUNT']
-                merged_df['MEDIAN_HOME_PRICE'] = 500000
-                merged_df['MEDIAN_SQFT'] = 2000
-                if 'CURRENT_SALE_RECORDING_DATE' in merged_df.columns:
-                    merged_df['SALE_YEAR'] = pd.to_datetime(merged_df['CURRENT_SALE_RECORDING_DATE'], errors='coerce').dt.year
-                merged_df['EQUITY_COMFORT_SCORE'] = merged_df['EQUITY'] / merged_df['MEDIAN_HOME_PRICE']
-                
-                # Calculate count
-                formula = segment.get('formula', '')
-                if formula:
-                    count = evaluate_formula(merged_df, formula)
-                else:
-                    count = 0
-                segment['count'] = count
-                
-                # Calculate analytics for AI generator
-                print(f"[ANALYTICS] Starting analytics calculation for {count} matching records")
-                # Filter to matching records only
-                if formula and count > 0:
-                    from formula_evaluator import parse_formula
-                    try:
-                        query = parse_formula(formula)
-                        print(f"[ANALYTICS] Parsed query: {query}")
-                        matching_df = merged_df.query(query)
-                        print(f"[ANALYTICS] Filtered to {len(matching_df)} records")
-                    except Exception as e:
-                        print(f"[ANALYTICS ERROR] Query failed: {e}")
-                        matching_df = merged_df
-                else:
-                    matching_df = merged_df
-                
-                # Age distribution
-                try:
-                    if 'AGE' in matching_df.columns:
-                        age_data = matching_df['AGE'].dropna()
-                        if len(age_data) > 0:
-                            segment['median_age'] = int(age_data.median())
-                            segment['age_distribution'] = {
-                                '25-34': int(((age_data >= 25) & (age_data < 35)).sum()),
-                                '35-44': int(((age_data >= 35) & (age_data < 45)).sum()),
-                                '45-54': int(((age_data >= 45) & (age_data < 55)).sum()),
-                                '55-64': int(((age_data >= 55) & (age_data < 65)).sum()),
-                                '65+': int((age_data >= 65).sum())
-                            }
-                            print(f"[ANALYTICS] ✓ Age: median={segment['median_age']}")
-                except Exception as e:
-                    print(f"[ANALYTICS ERROR] Age calculation failed: {e}")
-                
-                # Equity distribution
-                try:
-                    if 'EQUITY' in matching_df.columns:
-                        equity_data = matching_df['EQUITY'].dropna()
-                        if len(equity_data) > 0:
-                            segment['median_equity'] = int(equity_data.median())
-                            segment['equity_distribution'] = {
-                                '<100k': int((equity_data < 100000).sum()),
-                                '100k-250k': int(((equity_data >= 100000) & (equity_data < 250000)).sum()),
-                                '250k-500k': int(((equity_data >= 250000) & (equity_data < 500000)).sum()),
-                                '500k-1M': int(((equity_data >= 500000) & (equity_data < 1000000)).sum()),
-                                '1M+': int((equity_data >= 1000000).sum())
-                            }
-                            print(f"[ANALYTICS] ✓ Equity: median=${segment['median_equity']:,}")
-                except Exception as e:
-                    print(f"[ANALYTICS ERROR] Equity calculation failed: {e}")
-                
-                # Home value distribution
-                try:
-                    if 'CURRENT_AVM_VALUE' in matching_df.columns:
-                        value_data = matching_df['CURRENT_AVM_VALUE'].dropna()
-                        if len(value_data) > 0:
-                            segment['median_home_value'] = int(value_data.median())
-                            print(f"[ANALYTICS] ✓ Home value: ${segment['median_home_value']:,}")
-                except Exception as e:
-                    print(f"[ANALYTICS ERROR] Home value calculation failed: {e}")
-                
-                # Length of residence
-                try:
-                    if 'LENGTH_OF_RESIDENCE' in matching_df.columns:
-                        lor_data = matching_df['LENGTH_OF_RESIDENCE'].dropna()
-                        if len(lor_data) > 0:
-                            segment['median_length_of_residence'] = int(lor_data.median())
-                            print(f"[ANALYTICS] ✓ Length of residence: {segment['median_length_of_residence']} years")
-                except Exception as e:
-                    print(f"[ANALYTICS ERROR] Length of residence calculation failed: {e}")
-                
-                # Save
-                with open('past_clients.json', 'w') as f:
-                    json.dump(segments, f, indent=2)
-                
-                return f'<script>alert("Segment saved and recalculated! Count: {count} from {len(merged_df)} records"); window.location.href="/audiences/past-clients";</script>'
-            
-            except Exception as e:
-                return f'<script>alert("Error: {str(e)}"); window.history.back();</script>'
-        else:
-            # No files selected, just save
-            with open('past_clients.json', 'w') as f:
-                json.dump(segments, f, indent=2)
+            from jobs import submit_job
+            from segment_jobs import refresh_segment_job
             
-            return '<script>alert("Segment saved successfully!"); window.location.href="/audiences/past-clients";</script>'
+            job_id = submit_job(refresh_segment_job, {'segment_id': segment_id, 'selected_files': selected_files})
+            return job_progress_page(job_id, f'Recalculating segment: {new_name or segment["name"]}', '/audiences/past-clients')
+        
+        return '<script>alert("Segment saved successfully!"); window.location.href="/audiences/past-clients";</script>'
     
     # GET request - show edit form
     fields = get_available_fields()
@@ -4180,12 +3463,9 @@ def edit_past_client_segment(segment_id):
 @app.route('/audiences/past-clients/<segment_id>/analytics')
 def past_client_analytics(segment_id):
     """Analytics page for a specific past client segment"""
-    import pandas as pd
-    import json
     
     # Load segment info
-    with open('past_clients.json', 'r') as f:
-        segments = json.load(f)
+    segments = load_past_clients()
     
     segment = next((s for s in segments if s['id'] == segment_id), None)
     if not segment:
@@ -4193,52 +3473,34 @@ def past_client_analytics(segment_id):
     
     # Load client data from selected files
     try:
-        from storage import download_file_from_spaces
-        from formula_evaluator import parse_formula
-        import os
+        from segment_index import load_segment_data
         
         selected_files = segment.get('selected_files', [])
         if not selected_files:
             return "No files selected for this segment. Please edit the segment and select files.", 400
         
-        # Download and merge selected files
-        dfs = []
-        for file_key in selected_files:
-            local_path = f'/tmp/{file_key.split("/")[-1]}'
-            result = download_file_from_spaces(file_key, local_path)
-            if result['success']:
-                if local_path.endswith('.csv'):
-                    file_df = pd.read_csv(local_path)
-                else:
-                    file_df = pd.read_excel(local_path)
-                dfs.append(file_df)
-                os.remove(local_path)
+        formula = segment.get('formula', '')
+        subtiers = [t for t in segment.get('subtiers', []) if t.get('formula')]
+        formulas = ([formula] if formula else []) + [t['formula'] for t in subtiers]
         
-        if not dfs:
-            return "Could not load any files for this segment", 500
+        # Load selected files plus segment/sub-tier bitmaps (evaluated once per file version)
+        df, masks = load_segment_data(selected_files, formulas)
         
-        df = pd.concat(dfs, ignore_index=True)
+        if df is None:
+            return "Could not load any files for this segment", 500
         
-        # Clean data
-        df['AGE'] = pd.to_numeric(df['AGE'], errors='coerce')
-        df['CURRENT_SALE_MTG_1_LOAN_AMOUNT'] = pd.to_numeric(df['CURRENT_SALE_MTG_1_LOAN_AMOUNT'], errors='coerce').fillna(0)
-        df['CURRENT_AVM_VALUE'] = pd.to_numeric(df['CURRENT_AVM_VALUE'], errors='coerce')
-        df['CURRENT_SALE_MTG_1_INT_RATE'] = pd.to_numeric(df['CURRENT_SALE_MTG_1_INT_RATE'], errors='coerce')
-        df['LENGTH_OF_RESIDENCE'] = pd.to_numeric(df['LENGTH_OF_RESIDENCE'], errors='coerce')
-        df['SUM_BUILDING_SQFT'] = pd.to_numeric(df['SUM_BUILDING_SQFT'], errors='coerce')
-        df['EQUITY'] = df['CURRENT_AVM_VALUE'] - df['CURRENT_SALE_MTG_1_LOAN_AMOUNT']
+        # Filter to segment using its bitmap
+        segment_mask = masks.get(formula) if formula else None
+        segment_df = df[segment_mask] if segment_mask is not None else df
         
-        # Filter to segment using formula
-        formula = segment.get('formula', '')
-        if formula:
-            try:
-                query = parse_formula(formula)
-                segment_df = df.query(query)
-            except Exception as e:
-                print(f"Error applying formula: {e}")
-                segment_df = df
-        else:
-            segment_df = df
+        # Sub-tier breakdown within the segment (bitwise AND of bitmaps)
+        subtier_counts = []
+        for subtier in subtiers:
+            subtier_mask = masks.get(subtier['formula'])
+            if subtier_mask is not None:
+                if segment_mask is not None:
+                    subtier_mask = subtier_mask & segment_mask
+                subtier_counts.append((subtier, int(subtier_mask.sum())))
         
         # Calculate analytics
         total_count = len(segment_df)
@@ -4279,6 +3541,10 @@ def past_client_analytics(segment_id):
     
     equity_chart_html = ''.join([f'<div style="margin-bottom: 12px;"><div style="display: flex; justify-content: space-between; margin-bottom: 4px;"><span style="font-size: 13px;">{range_name}</span><span style="font-size: 13px; font-weight: 600;">{count}</span></div><div style="width: 100%; height: 20px; background: #f0e6d8; border-radius: 4px; overflow: hidden;"><div style="width: {(count/total_count*100) if total_count > 0 else 0}%; height: 100%; background: {segment["color"]}"></div></div></div>' for range_name, count in equity_ranges.items()])
     
+    subtier_chart_html = ''.join([f'<div style="margin-bottom: 12px;"><div style="display: flex; justify-content: space-between; margin-bottom: 4px;"><span style="font-size: 13px;">{subtier["name"]}</span><span style="font-size: 13px; font-weight: 600;">{count}</span></div><div style="width: 100%; height: 20px; background: #f0e6d8; border-radius: 4px; overflow: hidden;"><div style="width: {(count/total_count*100) if total_count > 0 else 0}%; height: 100%; background: {subtier.get("color", "#004237")}"></div></div></div>' for subtier, count in subtier_counts])
+    if subtier_chart_html:
+        subtier_chart_html = f'<div class="chart-card"><h2>Sub-Tier Breakdown</h2>{subtier_chart_html}</div>'
+    
     return f"""<!DOCTYPE html>
 <html>
 <head>
@@ -4387,6 +3653,8 @@ def past_client_analytics(segment_id):
             {top_zips_html}
         </div>
         
+        {subtier_chart_html}
+        
         <div style="text-align: center; margin-top: 30px;">
             <a href="/campaign/new?segment={segment_id}" style="padding: 14px 32px; background: #004237; color: white; text-decoration: none; border-radius: 8px; font-size: 16px; font-weight: 600; display: inline-block;">Generate Campaign for This Segment</a>
         </div>
@@ -4397,112 +3665,37 @@ def past_client_analytics(segment_id):
 
 @app.route('/api/upload-client-data', methods=['POST'])
 def upload_client_data():
-    """Process uploaded client data CSV/Excel and calculate segment counts"""
+    """Store an uploaded client data CSV/Excel and calculate segment counts (background job)"""
+    import tempfile
+    spool_path = None
     try:
-        import pandas as pd
-        from datetime import datetime
-        from storage import upload_file_to_spaces
-        import io
+        from jobs import submit_job
+        from segment_jobs import ingest_upload_job
         
         client_file = request.files.get('client_file')
         if not client_file:
             return '<script>alert("No file uploaded"); window.location.href="/audiences/past-clients";</script>'
         
-        # Read file content once
+        # Spool the upload to disk once; the job uploads and parses it from this file and deletes it
         filename = client_file.filename
-        file_content = client_file.read()
-        
-        # Upload to DigitalOcean Spaces for secure storage
-        file_stream = io.BytesIO(file_content)
-        upload_result = upload_file_to_spaces(file_stream, filename)
-        
-        if not upload_result['success']:
-            return f'<script>alert("Upload failed: {upload_result["message"]}"); window.location.href="/audiences/past-clients";</script>'
-        
-        # Also save locally for processing (temporary)
-        filepath = f'uploaded_client_data.{filename.split(".")[-1]}'
-        with open(filepath, 'wb') as f:
-            f.write(file_content)
-        
-        # Read file based on extension
-        if filename.endswith('.csv'):
-            df = pd.read_csv(filepath)
-        else:
-            df = pd.read_excel(filepath)
-        
-        # Load past client segments
-        with open('past_clients.json', 'r') as f:
-            segments = json.load(f)
-        
-        # Clean and prepare data
-        # Convert numeric columns
-        if 'AGE' in df.columns:
-            df['AGE'] = pd.to_numeric(df['AGE'], errors='coerce')
-        if 'CURRENT_SALE_MTG_1_LOAN_AMOUNT' in df.columns:
-            df['CURRENT_SALE_MTG_1_LOAN_AMOUNT'] = pd.to_numeric(df['CURRENT_SALE_MTG_1_LOAN_AMOUNT'], errors='coerce').fillna(0)
-        if 'CURRENT_AVM_VALUE' in df.columns:
-            df['CURRENT_AVM_VALUE'] = pd.to_numeric(df['CURRENT_AVM_VALUE'], errors='coerce')
-        if 'CURRENT_SALE_MTG_1_INT_RATE' in df.columns:
-            df['CURRENT_SALE_MTG_1_INT_RATE'] = pd.to_numeric(df['CURRENT_SALE_MTG_1_INT_RATE'], errors='coerce')
-        if 'LENGTH_OF_RESIDENCE' in df.columns:
-            df['LENGTH_OF_RESIDENCE'] = pd.to_numeric(df['LENGTH_OF_RESIDENCE'], errors='coerce')
-        if 'SUM_BUILDING_SQFT' in df.columns:
-            df['SUM_BUILDING_SQFT'] = pd.to_numeric(df['SUM_BUILDING_SQFT'], errors='coerce')
-        
-        # Calculate equity
-        df['EQUITY'] = df['CURRENT_AVM_VALUE'] - df['CURRENT_SALE_MTG_1_LOAN_AMOUNT']
-        
-        # Load market data for median values
-        try:
-            market_df = pd.read_excel('market_data.xlsx')
-            # Create ZIP to median mapping if available
-            if 'ZIP' in df.columns and 'ZIP' in market_df.columns:
-                zip_medians = market_df.set_index('ZIP')['MedianHomePrice'].to_dict() if 'MedianHomePrice' in market_df.columns else {}
-                df['MEDIAN_HOME_PRICE'] = df['ZIP'].map(zip_medians)
-        except:
-            df['MEDIAN_HOME_PRICE'] = 500000  # Default fallback
-        
-        # Calculate counts for each segment using dynamic formula evaluation
-        from formula_evaluator import evaluate_formula
+        fd, spool_path = tempfile.mkstemp(suffix=os.path.splitext(filename)[1])
+        os.close(fd)
+        client_file.save(spool_path)
         
-        # Add calculated columns
-        df['MEDIAN_SQFT'] = 2000  # Default median SQFT
-        if 'CURRENT_SALE_RECORDING_DATE' in df.columns:
-            df['SALE_YEAR'] = pd.to_datetime(df['CURRENT_SALE_RECORDING_DATE'], errors='coerce').dt.year
-        df['EQUITY_COMFORT_SCORE'] = df['EQUITY'] / df['MEDIAN_HOME_PRICE']
-        
-        for seg in segments:
-            try:
-                formula = seg.get('formula', '')
-                if formula:
-                    count = evaluate_formula(df, formula)
-                else:
-                    count = 0
-                seg['count'] = count
-            except Exception as e:
-                print(f"Error calculating {seg['id']}: {e}")
-                import traceback
-                traceback.print_exc()
-                seg['count'] = 0
-        
-        # Save updated counts
-        with open('past_clients.json', 'w') as f:
-            json.dump(segments, f, indent=2)
-        
-        return '<script>alert("Client data processed successfully!"); window.location.href="/audiences/past-clients";</script>'
+        job_id = submit_job(ingest_upload_job, {'path': spool_path, 'filename': filename})
+        return job_progress_page(job_id, f'Processing {filename}', '/audiences/past-clients')
     
     except Exception as e:
+        if spool_path and os.path.exists(spool_path):
+            os.remove(spool_path)
         return f'<script>alert("Error processing file: {str(e)}"); window.location.href="/audiences/past-clients";</script>'
 
 @app.route('/api/recalculate-segment', methods=['POST'])
 def recalculate_segment():
     """Recalculate a single segment using selected files"""
     try:
-        import pandas as pd
-        from storage import download_file_from_spaces
-        from formula_evaluator import evaluate_formula
-        import json
-        import os
+        from jobs import submit_job
+        from segment_jobs import recalculate_segment_job
         
         segment_id = request.form.get('segment_id')
         selected_files = request.form.getlist('selected_files')
@@ -4510,70 +3703,17 @@ def recalculate_segment():
         if not segment_id or not selected_files:
             return '<script>alert("Missing segment ID or files"); window.location.href="/audiences/past-clients";</script>'
         
-        # Download and merge all selected files
-        dfs = []
-        for file_key in selected_files:
-            local_path = f'/tmp/{file_key.split("/")[-1]}'
-            result = download_file_from_spaces(file_key, local_path)
-            
-            if result['success']:
-                if local_path.endswith('.csv'):
-                    df = pd.read_csv(local_path)
-                else:
-                    df = pd.read_excel(local_path)
-                dfs.append(df)
-                os.remove(local_path)  # Clean up
-        
-        # Merge all dataframes
-        merged_df = pd.concat(dfs, ignore_index=True)
-        
-        # Prepare data (same as upload handler)
-        if 'AGE' in merged_df.columns:
-            merged_df['AGE'] = pd.to_numeric(merged_df['AGE'], errors='coerce')
-        if 'CURRENT_SALE_MTG_1_LOAN_AMOUNT' in merged_df.columns:
-            merged_df['CURRENT_SALE_MTG_1_LOAN_AMOUNT'] = pd.to_numeric(merged_df['CURRENT_SALE_MTG_1_LOAN_AMOUNT'], errors='coerce').fillna(0)
-        if 'CURRENT_AVM_VALUE' in merged_df.columns:
-            merged_df['CURRENT_AVM_VALUE'] = pd.to_numeric(merged_df['CURRENT_AVM_VALUE'], errors='coerce')
-        if 'CURRENT_SALE_MTG_1_INT_RATE' in merged_df.columns:
-            merged_df['CURRENT_SALE_MTG_1_INT_RATE'] = pd.to_numeric(merged_df['CURRENT_SALE_MTG_1_INT_RATE'], errors='coerce')
-        if 'LENGTH_OF_RESIDENCE' in merged_df.columns:
-            merged_df['LENGTH_OF_RESIDENCE'] = pd.to_numeric(merged_df['LENGTH_OF_RESIDENCE'], errors='coerce')
-        if 'SUM_BUILDING_SQFT' in merged_df.columns:
-            merged_df['SUM_BUILDING_SQFT'] = pd.to_numeric(merged_df['SUM_BUILDING_SQFT'], errors='coerce')
-        
-        merged_df['EQUITY'] = merged_df['CURRENT_AVM_VALUE'] - merged_df['CURRENT_SALE_MTG_1_LOAN_AMOUNT']
-        merged_df['MEDIAN_HOME_PRICE'] = 500000
-        merged_df['MEDIAN_SQFT'] = 2000
-        
-        if 'CURRENT_SALE_RECORDING_DATE' in merged_df.columns:
-            merged_df['SALE_YEAR'] = pd.to_datetime(merged_df['CURRENT_SALE_RECORDING_DATE'], errors='coerce').dt.year
-        merged_df['EQUITY_COMFORT_SCORE'] = merged_df['EQUITY'] / merged_df['MEDIAN_HOME_PRICE']
-        
         # Load segments
-        with open('past_clients.json', 'r') as f:
-            segments = json.load(f)
+        segments = load_past_clients()
         
         # Find and update only the specified segment
         segment = next((s for s in segments if s['id'] == segment_id), None)
         if not segment:
             return '<script>alert("Segment not found"); window.location.href="/audiences/past-clients";</script>'
         
-        # Calculate count for this segment only
-        try:
-            formula = segment.get('formula', '')
-            if formula:
-                count = evaluate_formula(merged_df, formula)
-            else:
-                count = 0
-            segment['count'] = count
-        except Exception as e:
-            return f'<script>alert("Error calculating segment: {str(e)}"); window.location.href="/audiences/past-clients";</script>'
-        
-        # Save updated segments
-        with open('past_clients.json', 'w') as f:
-            json.dump(segments, f, indent=2)
-        
-        return f'<script>alert("Segment \\"{segment["name"]}\\" recalculated! New count: {count} from {len(merged_df)} total records"); window.location.href="/audiences/past-clients";</script>'
+        # Count from the segment bitmap index in the job pool
+        job_id = submit_job(recalculate_segment_job, {'segment_id': segment_id, 'selected_files': selected_files})
+        return job_progress_page(job_id, f'Recalculating segment: {segment["name"]}', '/audiences/past-clients')
     
     except Exception as e:
         return f'<script>alert("Error: {str(e)}"); window.location.href="/audiences/past-clients";</script>'
@@ -4581,20 +3721,79 @@ def recalculate_segment():
 @app.route('/api/manage-files')
 def manage_files():
     """View and manage uploaded files in DigitalOcean Spaces"""
-    from storage import list_files_in_spaces, delete_file_from_spaces
+    from storage import delete_file_from_spaces
+    from client_data_cache import evict_client_file
+    from file_catalog import list_catalog_files, catalog_remove
     
     # Handle delete request
     if request.args.get('delete'):
         key = request.args.get('delete')
         result = delete_file_from_spaces(key)
+        if result['success']:
+            evict_client_file(key)
+            catalog_remove(key)
         return jsonify(result)
     
-    # List all uploaded files
-    files = list_files_in_spaces()
+    # List uploaded files from the catalog (optionally one page at a time)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = request.args.get('limit', type=int)
+    catalog = list_catalog_files(offset=offset, limit=limit)
+    
+    return jsonify({
+        'success': True,
+        'files': catalog['files'],
+        'total': catalog['total'],
+        'offset': offset
+    })
+
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """Poll a background job's progress"""
+    from jobs import get_job
+    
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    
+    return jsonify({'success': True, **job})
+
+@app.route('/api/segment-overlap')
+def segment_overlap_api():
+    """Count clients who belong to every given past client segment"""
+    from segment_index import segment_overlap
+    
+    segment_ids = request.args.getlist('segment')
+    if len(segment_ids) < 2:
+        return jsonify({'success': False, 'message': 'Pass at least two segment parameters'}), 400
+    
+    segments = {s['id']: s for s in load_past_clients()}
+    
+    missing = [sid for sid in segment_ids if sid not in segments]
+    if missing:
+        return jsonify({'success': False, 'message': f'Segment not found: {", ".join(missing)}'}), 404
+    
+    # Default to every file any of the segments was calculated from
+    selected_files = request.args.getlist('file')
+    if not selected_files:
+        for sid in segment_ids:
+            for key in segments[sid].get('selected_files', []):
+                if key not in selected_files:
+                    selected_files.append(key)
+    if not selected_files:
+        return jsonify({'success': False, 'message': 'No files selected for these segments'}), 400
+    
+    formulas = [segments[sid].get('formula', '') for sid in segment_ids]
+    result = segment_overlap(selected_files, formulas)
+    if result['count'] is None:
+        return jsonify({'success': False, 'message': 'One of the segment formulas could not be evaluated'}), 400
     
     return jsonify({
         'success': True,
-        'files': files
+        'segments': segment_ids,
+        'files': selected_files,
+        'total_records': result['rows'],
+        'segment_counts': {sid: result['counts'][segments[sid].get('formula', '')] for sid in segment_ids},
+        'overlap_count': result['count']
     })
 
 @app.route('/api/analyze-audience', methods=['POST'])
@@ -4707,7 +3906,7 @@ def preview_audience_campaign():
     try:
         # Generate campaign content using AI
         from ai_generator import generate_campaign_content
-        result = generate_campaign_content(audience_id)
+        result = generate_campaign_content(audience_id, regenerate=request.args.get('regenerate') == '1')
         return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -4808,222 +4007,30 @@ def admin_logout():
 @require_admin_password
 def admin_panel():
     """Admin panel for file and segment management"""
-    from storage import list_files_in_spaces
-    import json
-    
-    # Get uploaded files from Spaces
-    files = list_files_in_spaces()
-    
-    # Get current segments
-    with open('past_clients.json', 'r') as f:
-        segments = json.load(f)
-    
-    # Build files table
-    files_html = ""
-    for file in files:
-        size_mb = file['size'] / (1024 * 1024)
-        date = file['last_modified'].strftime('%Y-%m-%d %H:%M')
-        files_html += f"""
-        <tr>
-            <td><input type="checkbox" name="selected_files" value="{file['key']}" class="file-checkbox"></td>
-            <td>{file['filename']}</td>
-            <td>{size_mb:.2f} MB</td>
-            <td>{date}</td>
-            <td>
-                <button onclick="deleteFile('{file['key']}')" style="padding: 6px 12px; background: #dc3545; color: white; border: none; border-radius: 4px; cursor: pointer;">Delete</button>
-            </td>
-        </tr>
-        """
-    
-    if not files_html:
-        files_html = '<tr><td colspan="5" style="text-align: center; color: #999;">No files uploaded yet</td></tr>'
-    
-    # Build segments table
-    segments_html = ""
-    for seg in segments:
-        segments_html += f"""
-        <tr>
-            <td><strong>{seg['name']}</strong></td>
-            <td style="font-family: monospace; font-size: 12px;">{seg['formula']}</td>
-            <td>{seg.get('count', 0)}</td>
-            <td>
-                <a href="/audiences/past-clients/{seg['id']}/edit" style="padding: 6px 12px; background: #006652; color: white; text-decoration: none; border-radius: 4px; font-size: 13px;">Edit</a>
-                <button onclick="deleteSegment('{seg['id']}')" style="padding: 6px 12px; background: #dc3545; color: white; border: none; border-radius: 4px; cursor: pointer; margin-left: 8px;">Delete</button>
-            </td>
-        </tr>
-        """
-    
-    return f"""<!DOCTYPE html>
-<html>
-<head>
-    <title>Admin Panel - Keyes Campaign Manager</title>
-    <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Arial, sans-serif;
-            background: #f7f3e5;
-            padding: 40px 20px;
-        }}
-        .container {{ max-width: 1400px; margin: 0 auto; }}
-        .header {{
-            background: linear-gradient(135deg, #004237 0%, #003329 100%);
-            color: white;
-            padding: 30px 40px;
-            border-radius: 12px;
-            margin-bottom: 30px;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-        }}
-        .card {{
-            background: white;
-            border-radius: 12px;
-            padding: 30px;
-            margin-bottom: 24px;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.08);
-        }}
-        h2 {{ color: #004237; margin-bottom: 20px; }}
-        table {{
-            width: 100%;
-            border-collapse: collapse;
-        }}
-        th, td {{
-            padding: 12px;
-            text-align: left;
-            border-bottom: 1px solid #e0e0e0;
-        }}
-        th {{
-            background: #f7f3e5;
-            font-weight: 600;
-            color: #004237;
-        }}
-        .btn {{
-            padding: 12px 24px;
-            border: none;
-            border-radius: 8px;
-            font-size: 14px;
-            font-weight: 600;
-            cursor: pointer;
-            text-decoration: none;
-            display: inline-block;
-            transition: all 0.3s;
-        }}
-        .btn-primary {{ background: #004237; color: white; }}
-        .btn-primary:hover {{ background: #003329; }}
-        .btn-secondary {{ background: #fcbfa7; color: #004237; margin-left: 10px; }}
-        .btn-danger {{ background: #dc3545; color: white; margin-left: 10px; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <div>
-                <h1>Admin Panel</h1>
-                <p>Manage files and audience segments</p>
-            </div>
-            <div>
-                <a href="/" class="btn btn-secondary">Back to App</a>
-                <a href="/admin/logout" class="btn btn-danger">Logout</a>
-            </div>
-        </div>
-        
-        <!-- File Management -->
-        <div class="card">
-            <h2>📁 File Management</h2>
-            <div style="margin-bottom: 20px;">
-                <form action="/admin/upload-files" method="POST" enctype="multipart/form-data" style="display: inline-block;">
-                    <input type="file" name="files" multiple accept=".csv,.xlsx" style="margin-right: 10px;">
-                    <button type="submit" class="btn btn-primary">Upload Files</button>
-                </form>
-            </div>
-            
-            <form id="analyzeForm" action="/admin/analyze-selected" method="POST">
-                <table>
-                    <thead>
-                        <tr>
-                            <th width="50">Select</th>
-                            <th>Filename</th>
-                            <th width="120">Size</th>
-                            <th width="180">Upload Date</th>
-                            <th width="100">Actions</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-                        {files_html}
-                    </tbody>
-                </table>
-                
-                <div style="margin-top: 20px;">
-                    <button type="submit" class="btn btn-primary">Analyze Selected Files</button>
-                    <span style="margin-left: 16px; color: #666; font-size: 14px;">Select one or more files to merge and calculate segment counts</span>
-                </div>
-            </form>
-        </div>
-        
-        <!-- Segment Management -->
-        <div class="card">
-            <h2>👥 Segment Management</h2>
-            <div style="margin-bottom: 20px;">
-                <a href="/admin/create-segment" class="btn btn-primary">+ Create New Segment</a>
-            </div>
-            
-            <table>
-                <thead>
-                    <tr>
-                        <th>Segment Name</th>
-                        <th>Formula</th>
-                        <th width="100">Count</th>
-                        <th width="150">Actions</th>
-                    </tr>
-                </thead>
-                <tbody>
-                    {segments_html}
-                </tbody>
-            </table>
-        </div>
-    </div>
-    
-    <script>
-        function deleteFile(key) {{
-            if (confirm('Are you sure you want to delete this file?')) {{
-                fetch('/admin/delete-file?key=' + encodeURIComponent(key), {{method: 'POST'}})
-                    .then(r => r.json())
-                    .then(data => {{
-                        if (data.success) {{
-                            alert('File deleted successfully');
-                            window.location.reload();
-                        }} else {{
-                            alert('Error: ' + data.message);
-                        }}
-                    }});
-            }}
-        }}
-        
-        function deleteSegment(segmentId) {{
-            if (confirm('Are you sure you want to delete this segment?')) {{
-                fetch('/admin/delete-segment?id=' + segmentId, {{method: 'POST'}})
-                    .then(r => r.json())
-                    .then(data => {{
-                        if (data.success) {{
-                            alert('Segment deleted successfully');
-                            window.location.reload();
-                        }} else {{
-                            alert('Error: ' + data.message);
-                        }}
-                    }});
-            }}
-        }}
-    </script>
-</body>
-</html>
-"""
+    from file_catalog import list_catalog_files
+    
+    # Get one page of uploaded files from the local catalog
+    per_page = 50
+    page = max(request.args.get('page', 1, type=int), 1)
+    catalog = list_catalog_files(offset=(page - 1) * per_page, limit=per_page)
+    files = catalog['files']
+    total_pages = max((catalog['total'] + per_page - 1) // per_page, 1)
+    
+    return render_template(
+        'admin.html',
+        files=files,
+        page=page,
+        total_pages=total_pages,
+        total_files=catalog['total'],
+        segments=load_past_clients()
+    )
 
 @app.route('/admin/upload-files', methods=['POST'])
 @require_admin_password
 def admin_upload_files():
     """Upload multiple files to DigitalOcean Spaces"""
     from storage import upload_file_to_spaces
-    import io
+    from file_catalog import catalog_add
     
     files = request.files.getlist('files')
     if not files:
@@ -5032,10 +4039,10 @@ def admin_upload_files():
     uploaded_count = 0
     for file in files:
         if file.filename:
-            file_content = file.read()
-            file_stream = io.BytesIO(file_content)
-            result = upload_file_to_spaces(file_stream, file.filename)
+            # Stream straight from the request's spooled file (multipart for large files)
+            result = upload_file_to_spaces(file.stream, file.filename)
             if result['success']:
+                catalog_add(result['key'])
                 uploaded_count += 1
     
     return f'<script>alert("{uploaded_count} file(s) uploaded successfully"); window.location.href="/admin";</script>'
@@ -5045,26 +4052,23 @@ def admin_upload_files():
 def admin_delete_file():
     """Delete a file from DigitalOcean Spaces"""
     from storage import delete_file_from_spaces
+    from client_data_cache import evict_client_file
+    from file_catalog import catalog_remove
     
     key = request.args.get('key')
     result = delete_file_from_spaces(key)
+    if result['success']:
+        evict_client_file(key)
+        catalog_remove(key)
     return jsonify(result)
 
 @app.route('/admin/delete-segment', methods=['POST'])
 @require_admin_password
 def admin_delete_segment():
     """Delete a past client segment"""
-    import json
-    
     segment_id = request.args.get('id')
     
-    with open('past_clients.json', 'r') as f:
-        segments = json.load(f)
-    
-    segments = [s for s in segments if s['id'] != segment_id]
-    
-    with open('past_clients.json', 'w') as f:
-        json.dump(segments, f, indent=2)
+    datastore.delete_item('past_clients', segment_id)
     
     return jsonify({'success': True, 'message': 'Segment deleted'})
 
@@ -5072,7 +4076,6 @@ def admin_delete_segment():
 @require_admin_password
 def admin_create_segment():
     """Create a new past client segment"""
-    import json
     from formula_evaluator import validate_formula, get_available_fields
     
     if request.method == 'POST':
@@ -5091,8 +4094,7 @@ def admin_create_segment():
             return f'<script>alert("Invalid formula: {validation["message"]}"); window.history.back();</script>'
         
         # Load existing segments
-        with open('past_clients.json', 'r') as f:
-            segments = json.load(f)
+        segments = load_past_clients()
         
         # Check for duplicate ID
         if any(s['id'] == segment_id for s in segments):
@@ -5107,11 +4109,9 @@ def admin_create_segment():
             'color': color,
             'count': 0
         }
-        segments.append(new_segment)
         
         # Save
-        with open('past_clients.json', 'w') as f:
-            json.dump(segments, f, indent=2)
+        datastore.insert_item('past_clients', new_segment)
         
         return '<script>alert("Segment created successfully"); window.location.href="/admin";</script>'
     
@@ -5231,80 +4231,16 @@ def admin_create_segment():
 @require_admin_password
 def admin_analyze_selected():
     """Analyze selected files and calculate segment counts"""
-    from storage import download_file_from_spaces
-    from formula_evaluator import evaluate_formula
-    import pandas as pd
-    import json
-    import os
+    from jobs import submit_job
+    from segment_jobs import analyze_files_job
     
     selected_files = request.form.getlist('selected_files')
     if not selected_files:
         return '<script>alert("No files selected"); window.location.href="/admin";</script>'
     
-    try:
-        # Download and merge all selected files
-        dfs = []
-        for file_key in selected_files:
-            local_path = f'/tmp/{file_key.split("/")[-1]}'
-            result = download_file_from_spaces(file_key, local_path)
-            
-            if result['success']:
-                if local_path.endswith('.csv'):
-                    df = pd.read_csv(local_path)
-                else:
-                    df = pd.read_excel(local_path)
-                dfs.append(df)
-                os.remove(local_path)  # Clean up
-        
-        # Merge all dataframes
-        merged_df = pd.concat(dfs, ignore_index=True)
-        
-        # Prepare data (same as upload handler)
-        if 'AGE' in merged_df.columns:
-            merged_df['AGE'] = pd.to_numeric(merged_df['AGE'], errors='coerce')
-        if 'CURRENT_SALE_MTG_1_LOAN_AMOUNT' in merged_df.columns:
-            merged_df['CURRENT_SALE_MTG_1_LOAN_AMOUNT'] = pd.to_numeric(merged_df['CURRENT_SALE_MTG_1_LOAN_AMOUNT'], errors='coerce').fillna(0)
-        if 'CURRENT_AVM_VALUE' in merged_df.columns:
-            merged_df['CURRENT_AVM_VALUE'] = pd.to_numeric(merged_df['CURRENT_AVM_VALUE'], errors='coerce')
-        if 'CURRENT_SALE_MTG_1_INT_RATE' in merged_df.columns:
-            merged_df['CURRENT_SALE_MTG_1_INT_RATE'] = pd.to_numeric(merged_df['CURRENT_SALE_MTG_1_INT_RATE'], errors='coerce')
-        if 'LENGTH_OF_RESIDENCE' in merged_df.columns:
-            merged_df['LENGTH_OF_RESIDENCE'] = pd.to_numeric(merged_df['LENGTH_OF_RESIDENCE'], errors='coerce')
-        if 'SUM_BUILDING_SQFT' in merged_df.columns:
-            merged_df['SUM_BUILDING_SQFT'] = pd.to_numeric(merged_df['SUM_BUILDING_SQFT'], errors='coerce')
-        
-        merged_df['EQUITY'] = merged_df['CURRENT_AVM_VALUE'] - merged_df['CURRENT_SALE_MTG_1_LOAN_AMOUNT']
-        merged_df['MEDIAN_HOME_PRICE'] = 500000
-        merged_df['MEDIAN_SQFT'] = 2000
-        
-        if 'CURRENT_SALE_RECORDING_DATE' in merged_df.columns:
-            merged_df['SALE_YEAR'] = pd.to_datetime(merged_df['CURRENT_SALE_RECORDING_DATE'], errors='coerce').dt.year
-        merged_df['EQUITY_COMFORT_SCORE'] = merged_df['EQUITY'] / merged_df['MEDIAN_HOME_PRICE']
-        
-        # Calculate counts for all segments
-        with open('past_clients.json', 'r') as f:
-            segments = json.load(f)
-        
-        for seg in segments:
-            try:
-                formula = seg.get('formula', '')
-                if formula:
-                    count = evaluate_formula(merged_df, formula)
-                else:
-                    count = 0
-                seg['count'] = count
-            except Exception as e:
-                print(f"Error calculating {seg['id']}: {e}")
-                seg['count'] = 0
-        
-        # Save updated counts
-        with open('past_clients.json', 'w') as f:
-            json.dump(segments, f, indent=2)
-        
-        return f'<script>alert("Analysis complete! {len(merged_df)} total records processed from {len(selected_files)} file(s)"); window.location.href="/admin";</script>'
-    
-    except Exception as e:
-        return f'<script>alert("Error: {str(e)}"); window.location.href="/admin";</script>'
+    # Count every segment from the bitmap index in the job pool
+    job_id = submit_job(analyze_files_job, {'selected_files': selected_files})
+    return job_progress_page(job_id, f'Analyzing {len(selected_files)} file(s)', '/admin')
 
 
 if __name__ == '__main__':
@@ -4,34 +4,26 @@ Uses AI vision to analyze pixel tracking screenshots and demographic data
 to create targetable audience segments and campaign recommendations
 """
 
-import os
 import json
 import base64
-import requests
+
+import datastore
+from generation_cache import cached_generation
+from llm_client import chat_completion
 
 def call_openai(messages, model="gpt-4o-mini", temperature=0.7, max_tokens=2000):
-    api_key = os.environ.get("OPENAI_API_KEY")
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    """Chat completion through the shared client; raises llm_client.LLMError on failure"""
     data = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
-    response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=data, timeout=30)
-    response.raise_for_status()
-    return response.json()
-
-AUDIENCES_FILE = 'behavioral_audiences.json'
-
+    return chat_completion(data, timeout=30)
 
 def load_audiences():
     """Load saved behavioral audiences"""
-    if os.path.exists(AUDIENCES_FILE):
-        with open(AUDIENCES_FILE, 'r') as f:
-            return json.load(f)
-    return []
+    return datastore.load_items('audiences')
 
 
 def save_audiences(audiences):
-    """Save behavioral audiences to file"""
-    with open(AUDIENCES_FILE, 'w') as f:
-        json.dump(audiences, f, indent=2)
+    """Save behavioral audiences (only changed rows are written)"""
+    datastore.replace_items('audiences', audiences)
 
 
 def encode_image_to_base64(image_path):
@@ -248,8 +240,6 @@ def create_audience_card(audience_data, demographic_image_path, pixel_image_path
     Create a saved audience card with images and data
     Returns the audience ID
     """
-    audiences = load_audiences()
-    
     # Generate unique ID
     import time
     audience_id = f"audience_{int(time.time())}"
@@ -263,25 +253,23 @@ def create_audience_card(audience_data, demographic_image_path, pixel_image_path
         **audience_data
     }
     
-    audiences.append(audience_card)
-    save_audiences(audiences)
+    datastore.insert_item('audiences', audience_card)
     
     return audience_id
 
 
 def get_audience(audience_id):
     """Get a specific audience by ID"""
-    audiences = load_audiences()
-    for audience in audiences:
-        if audience['id'] == audience_id:
-            return audience
-    return None
+    return datastore.get_item('audiences', audience_id)
 
 
-def generate_campaign_for_audience(audience_id):
+def generate_campaign_for_audience(audience_id, regenerate=False):
     """
     Generate a campaign tailored to a behavioral audience
     Uses the audience data to create highly targeted content
+    
+    Repeat requests for an unchanged audience come from the generation
+    cache unless regenerate is set.
     """
     audience = get_audience(audience_id)
     if not audience:
@@ -390,18 +378,26 @@ Apply Harry Dry's 25 copywriting principles:
   "explanation": "Why this copy works for THIS specific audience based on their behavior and demographics"
 }}"""
 
-    response = call_openai(
-        messages=[{"role": "user", "content": prompt}], max_tokens=1500, temperature=0.8
-    )
-    
-    content = response['choices'][0]['message']['content'].strip()
+    request = {
+        "model": "gpt-4o-mini",
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": 1500,
+        "temperature": 0.8
+    }
     
-    # Remove markdown if present
-    if content.startswith('```'):
-        content = content.split('```')[1]
-        if content.startswith('json'):
-            content = content[4:]
-        content = content.strip()
+    def generate():
+        response = call_openai(**request)
+        
+        content = response['choices'][0]['message']['content'].strip()
+        
+        # Remove markdown if present
+        if content.startswith('```'):
+            content = content.split('```')[1]
+            if content.startswith('json'):
+                content = content[4:]
+            content = content.strip()
+        
+        return json.loads(content)
     
-    return json.loads(content)
+    return cached_generation(request, generate, refresh=regenerate)
 
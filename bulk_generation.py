@@ -0,0 +1,117 @@
+"""
+Bulk AI campaign generation across segments
+One job writes a draft campaign for each selected segment (the preset
+SEGMENT_PROFILES and past client segments). Generations run concurrently
+on a bounded thread pool, and every model call still waits its turn in the
+shared rate limiter. Each draft is saved as soon as it is generated and
+tagged with the batch ID, so running a batch again only generates the
+segments that are still missing
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import datastore
+from ai_generator import SEGMENT_PROFILES, generate_campaign_content
+from campaign_builder import create_campaign, generated_fields
+
+# Generations in flight per bulk job
+BULK_GENERATION_WORKERS = int(os.environ.get('BULK_GENERATION_WORKERS', 16))
+
+
+def segment_choices():
+    """
+    Segments a bulk run can target
+
+    Returns:
+        list: (segment_id, name) for the presets, then past client segments
+    """
+    choices = [(segment_id, profile['name']) for segment_id, profile in SEGMENT_PROFILES.items()]
+    choices += [(segment['id'], segment['name']) for segment in datastore.load_items('past_clients')]
+    return choices
+
+
+def batch_campaigns(batch_id):
+    """Campaigns created by a bulk batch, keyed by segment ID"""
+    return {campaign['segment']: campaign for campaign in datastore.load_items('campaigns')
+            if campaign.get('bulk_batch') == batch_id}
+
+
+def _save_draft(segment_id, segment_name, label, batch_id, content):
+    """Create the draft campaign for one segment under a free campaign ID"""
+    fields = generated_fields(content)
+    fields['segment'] = segment_id
+    fields['status'] = 'draft'
+    base_name = f'{segment_name} - {label}' if label else segment_name
+    number = 1
+    while True:
+        fields['name'] = base_name if number == 1 else f'{base_name} {number}'
+        campaign = create_campaign(fields, extra={'bulk_batch': batch_id})
+        if campaign is not None:
+            return campaign
+        number += 1
+
+
+def bulk_generation_job(payload, report):
+    """
+    Generate a draft campaign for every selected segment
+
+    Args:
+        payload: {'batch_id', 'segment_ids': [...], 'label': campaign name
+                  suffix, 'custom_prompt': optional instructions for every
+                  segment}
+        report: Progress callback from the job runner
+
+    Returns:
+        dict: {'created': [{'segment', 'campaign_id'}], 'failed':
+               [{'segment', 'error'}], 'message'}
+    """
+    batch_id = payload['batch_id']
+    segment_ids = payload['segment_ids']
+    label = payload.get('label', '')
+    custom_prompt = payload.get('custom_prompt', '')
+    names = dict(segment_choices())
+
+    # Drafts saved by an earlier run of this batch are kept
+    existing = batch_campaigns(batch_id)
+    created = [{'segment': segment_id, 'campaign_id': existing[segment_id]['id']}
+               for segment_id in segment_ids if segment_id in existing]
+    pending = [segment_id for segment_id in segment_ids if segment_id not in existing]
+    failed = []
+    total = len(segment_ids)
+    if created:
+        report(len(created) / total, f'{len(created)} of {total} campaigns already generated')
+
+    started = time.time()
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(BULK_GENERATION_WORKERS, len(pending))) as pool:
+            futures = {
+                pool.submit(generate_campaign_content, segment_id,
+                            names.get(segment_id, segment_id), custom_prompt): segment_id
+                for segment_id in pending
+            }
+            for future in as_completed(futures):
+                segment_id = futures[future]
+                try:
+                    content = future.result()
+                except Exception as e:
+                    content = {'error': str(e)}
+
+                if 'error' in content:
+                    print(f"[BULK GENERATION] {segment_id} failed: {content['error']}")
+                    failed.append({'segment': segment_id, 'error': content['error']})
+                else:
+                    campaign = _save_draft(segment_id, names.get(segment_id, segment_id), label, batch_id, content)
+                    created.append({'segment': segment_id, 'campaign_id': campaign['id']})
+
+                finished = len(created) + len(failed)
+                report(finished / total, f'Generated {len(created)} of {total} campaigns'
+                       + (f' ({len(failed)} failed)' if failed else ''))
+
+    print(f"[BULK GENERATION] Batch {batch_id}: {len(created)} created, {len(failed)} failed "
+          f"in {time.time() - started:.1f}s")
+
+    message = f'{len(created)} of {total} draft campaigns generated'
+    if failed:
+        message += f'; {len(failed)} failed - run the batch again to retry them'
+    return {'created': created, 'failed': failed, 'message': message}
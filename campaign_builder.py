@@ -0,0 +1,151 @@
+"""
+Campaign records built from the new-campaign form fields
+Shared by /campaign/new and bulk AI generation, so a campaign created
+either way has the same shape
+"""
+from datetime import datetime
+
+import datastore
+
+
+def campaign_id_for(name):
+    """Campaign ID derived from its name"""
+    return name.lower().replace(' ', '-').replace('_', '-')
+
+
+def build_campaign(fields):
+    """
+    Campaign dict from new-campaign form fields
+
+    Args:
+        fields: Mapping with .get (request.form or a dict) using the form's
+                field names (name, segment, status, subject, q1_text, ...)
+
+    Returns:
+        dict: The campaign, not yet saved
+    """
+    campaign_name = fields.get('name', '')
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return {
+        'id': campaign_id_for(campaign_name),
+        'name': campaign_name,
+        'segment': fields.get('segment', 'general'),
+        'status': fields.get('status', 'draft'),
+        'created_at': now,
+        'updated_at': now,
+        'subject': fields.get('subject', ''),
+        'headline': fields.get('headline', ''),
+        'subheadline': fields.get('subheadline', ''),
+        'body_headline': fields.get('body_headline', ''),
+        'cta_text': fields.get('cta_text', 'Get Started'),
+        'body_copy': fields.get('body_copy', ''),
+        'form_config': {
+            'show_callout': True,  # Always show callout box
+            'callout_title': fields.get('callout_title', ''),
+            'callout_main_text': fields.get('callout_main_text', ''),
+            'callout_subtitle': fields.get('callout_subtitle', ''),
+            'cta_agent_message': fields.get('cta_agent_message', ''),
+            'cta_tagline': fields.get('cta_tagline', ''),
+            'cta_button_text': fields.get('cta_button_text', 'GET MY EQUITY PLAN'),
+            'cta_agent_photo': fields.get('cta_agent_photo', ''),
+            'q1_text': fields.get('q1_text', ''),
+            'q1_subtitle': fields.get('q1_subtitle', ''),
+            'q1_opt1_label': fields.get('q1_opt1_label', ''),
+            'q1_opt1_desc': fields.get('q1_opt1_desc', ''),
+            'q1_opt2_label': fields.get('q1_opt2_label', ''),
+            'q1_opt2_desc': fields.get('q1_opt2_desc', ''),
+            'q1_opt3_label': fields.get('q1_opt3_label', ''),
+            'q1_opt3_desc': fields.get('q1_opt3_desc', ''),
+            'q1_opt4_label': fields.get('q1_opt4_label', ''),
+            'q1_opt4_desc': fields.get('q1_opt4_desc', ''),
+            'q2_text': fields.get('q2_text', ''),
+            'q2_subtitle': fields.get('q2_subtitle', ''),
+            'q2_opt1': fields.get('q2_opt1', ''),
+            'q2_opt2': fields.get('q2_opt2', ''),
+            'q2_opt3': fields.get('q2_opt3', ''),
+            'q2_opt4': fields.get('q2_opt4', ''),
+            'q3_text': fields.get('q3_text', ''),
+            'q3_subtitle': fields.get('q3_subtitle', ''),
+            'q3_opt1': fields.get('q3_opt1', ''),
+            'q3_opt2': fields.get('q3_opt2', ''),
+            'q3_opt3': fields.get('q3_opt3', ''),
+            'q3_opt4': fields.get('q3_opt4', '')
+        },
+        'form_fields': {
+            'email': True,
+            'firstName': True,
+            'lastName': True,
+            'phoneNumber': True,
+            'equity_priority': True,
+            'goals': True,
+            'wantsReport': True,
+            'wantsExpert': True
+        },
+        'colors': {
+            'primary': '#004237',
+            'accent': '#fcbfa7',
+            'background': '#f7f3e5'
+        }
+    }
+
+
+def create_campaign(fields, extra=None):
+    """
+    Build and save a campaign
+
+    Args:
+        fields: As build_campaign
+        extra: Optional keys stored on the campaign as well
+
+    Returns:
+        dict: The saved campaign, or None if its ID is already taken
+    """
+    campaign = build_campaign(fields)
+    campaign.update(extra or {})
+    if not datastore.insert_new_item('campaigns', campaign):
+        return None
+    return campaign
+
+
+def generated_fields(content):
+    """
+    New-campaign form fields filled from AI generated content
+    (the same mapping the form's Generate button applies)
+
+    Args:
+        content: Result of generate_campaign_content
+
+    Returns:
+        dict: Form field name -> value
+    """
+    fields = {
+        'subject': content.get('subject_line', ''),
+        'headline': content.get('headline', ''),
+        'subheadline': content.get('subheadline', ''),
+        'body_headline': content.get('body_headline', ''),
+        'body_copy': content.get('body_copy', ''),
+        'cta_agent_message': content.get('cta_agent_message', ''),
+        'cta_tagline': content.get('cta_tagline', ''),
+        'cta_button_text': content.get('cta_button_text') or 'GET MY EQUITY PLAN'
+    }
+
+    callout = content.get('callout_box') or {}
+    fields['callout_title'] = callout.get('title', '')
+    fields['callout_main_text'] = callout.get('main_text', '')
+    fields['callout_subtitle'] = callout.get('subtitle', '')
+
+    questions = content.get('form_questions') or []
+    if len(questions) >= 3:
+        for number, question in enumerate(questions[:3], start=1):
+            fields[f'q{number}_text'] = question.get('question', '')
+            fields[f'q{number}_subtitle'] = question.get('subtitle', '')
+            options = question.get('options') or []
+            if len(options) < 4:
+                continue
+            for index, option in enumerate(options[:4], start=1):
+                if number == 1:
+                    fields[f'q1_opt{index}_label'] = option.get('label', '')
+                    fields[f'q1_opt{index}_desc'] = option.get('description', '')
+                else:
+                    fields[f'q{number}_opt{index}'] = option.get('label', '')
+    return fields
@@ -0,0 +1,189 @@
+"""
+Shared client data preparation for past client segments
+Every route that counts or analyzes client data reads and prepares it here,
+so the typed frame is identical no matter which page built it
+"""
+import os
+import pandas as pd
+
+# Source columns converted to numbers (bad values become NaN)
+NUMERIC_COLUMNS = [
+    'AGE',
+    'CURRENT_SALE_MTG_1_LOAN_AMOUNT',
+    'CURRENT_AVM_VALUE',
+    'CURRENT_SALE_MTG_1_INT_RATE',
+    'LENGTH_OF_RESIDENCE',
+    'SUM_BUILDING_SQFT'
+]
+
+# Low-cardinality text columns held as pandas categoricals
+CATEGORICAL_COLUMNS = ['ZIP', 'CITY', 'STATE', 'EMPLOYMENT_STATUS']
+
+# Source columns prepare_client_data reads to build the derived columns
+PREPARE_COLUMNS = NUMERIC_COLUMNS + CATEGORICAL_COLUMNS + ['CURRENT_SALE_RECORDING_DATE']
+
+# Dtypes passed straight to the CSV/Excel reader
+CLIENT_DATA_DTYPES = {
+    **{col: 'float64' for col in NUMERIC_COLUMNS},
+    **{col: 'category' for col in CATEGORICAL_COLUMNS}
+}
+
+# Bump whenever prepare_client_data changes how derived columns are computed
+PREPARE_VERSION = 1
+
+# Rows parsed per batch when streaming large CSV files (multiple of 8 so
+# packed segment bitmaps of consecutive chunks concatenate cleanly)
+CHUNK_ROWS = int(os.environ.get('CLIENT_DATA_CHUNK_ROWS', 100000)) // 8 * 8 or 8
+
+DEFAULT_MEDIAN_HOME_PRICE = 500000
+DEFAULT_MEDIAN_SQFT = 2000
+MARKET_DATA_FILE = 'market_data.xlsx'
+
+_zip_median_cache = {}
+
+
+def read_client_data(path, usecols=None):
+    """
+    Read a client data file with the schema dtypes applied at parse time
+
+    Args:
+        path: Local path to a .csv or Excel file
+        usecols: Optional list of columns to keep (default: all, since
+                 formulas may reference raw CSV columns)
+
+    Returns:
+        DataFrame: Typed client data (derived columns not yet added)
+    """
+    reader = pd.read_csv if path.endswith('.csv') else pd.read_excel
+    dtype = {col: kind for col, kind in CLIENT_DATA_DTYPES.items()
+             if usecols is None or col in usecols}
+
+    try:
+        return reader(path, dtype=dtype, usecols=usecols)
+    except (ValueError, TypeError):
+        # A numeric column holds free text somewhere; read those columns
+        # as text and let prepare_client_data coerce them
+        dtype = {col: kind for col, kind in dtype.items() if kind == 'category'}
+        return reader(path, dtype=dtype, usecols=usecols)
+
+
+def _coerce_numeric(df):
+    """Convert schema numeric columns to float64 (bad values become NaN)"""
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns and df[col].dtype != 'float64':
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    return df
+
+
+def read_client_data_chunks(path, chunksize=CHUNK_ROWS):
+    """
+    Read a client data file in bounded batches
+
+    Args:
+        path: Local path to a .csv or Excel file
+        chunksize: Rows per batch for CSV files
+
+    Yields:
+        DataFrame: Typed chunks (derived columns not yet added). Excel
+                   workbooks cannot be parsed incrementally and are yielded
+                   as a single chunk.
+    """
+    if not path.endswith('.csv'):
+        yield _coerce_numeric(read_client_data(path))
+        return
+
+    # Numeric columns are coerced per chunk rather than via dtype= so one
+    # bad value deep in the file doesn't abort the stream
+    dtype = {col: 'category' for col in CATEGORICAL_COLUMNS}
+    for chunk in pd.read_csv(path, dtype=dtype, chunksize=chunksize):
+        yield _coerce_numeric(chunk)
+
+
+def _zip_median_prices():
+    """ZIP -> median home price from the optional market data workbook"""
+    if not os.path.exists(MARKET_DATA_FILE):
+        return {}
+
+    mtime = os.path.getmtime(MARKET_DATA_FILE)
+    if _zip_median_cache.get('mtime') != mtime:
+        try:
+            market_df = pd.read_excel(MARKET_DATA_FILE)
+            if 'ZIP' in market_df.columns and 'MedianHomePrice' in market_df.columns:
+                medians = market_df.set_index(market_df['ZIP'].astype(str))['MedianHomePrice'].to_dict()
+            else:
+                medians = {}
+        except Exception as e:
+            print(f"Error loading market data: {e}")
+            medians = {}
+        _zip_median_cache.update(mtime=mtime, medians=medians)
+
+    return _zip_median_cache['medians']
+
+
+def prepare_signature():
+    """
+    Identify the current derivation rules
+
+    Results computed from prepared frames (e.g. segment bitmaps) are only
+    reusable while this value is unchanged.
+
+    Returns:
+        str: Version plus market data modification time
+    """
+    mtime = os.path.getmtime(MARKET_DATA_FILE) if os.path.exists(MARKET_DATA_FILE) else 0
+    return f'{PREPARE_VERSION}:{mtime}'
+
+
+def prepare_client_data(df):
+    """
+    Coerce schema columns and add the derived columns segment formulas use
+
+    Adds EQUITY, MEDIAN_HOME_PRICE, MEDIAN_SQFT, SALE_YEAR and
+    EQUITY_COMFORT_SCORE. Missing source columns are added as empty so
+    every prepared frame has the same shape.
+
+    Args:
+        df: DataFrame from read_client_data (or a concat of several)
+
+    Returns:
+        DataFrame: The same frame, prepared in place
+    """
+    for col in NUMERIC_COLUMNS:
+        if col not in df.columns:
+            df[col] = float('nan')
+    _coerce_numeric(df)
+    df['CURRENT_SALE_MTG_1_LOAN_AMOUNT'] = df['CURRENT_SALE_MTG_1_LOAN_AMOUNT'].fillna(0)
+
+    # Concatenating files with different categories falls back to object
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(str).where(df[col].notna()).astype('category')
+
+    df['EQUITY'] = df['CURRENT_AVM_VALUE'] - df['CURRENT_SALE_MTG_1_LOAN_AMOUNT']
+
+    zip_medians = _zip_median_prices()
+    if zip_medians and 'ZIP' in df.columns:
+        median_price = df['ZIP'].astype(str).map(zip_medians).astype('float64')
+        df['MEDIAN_HOME_PRICE'] = median_price.fillna(DEFAULT_MEDIAN_HOME_PRICE)
+    else:
+        df['MEDIAN_HOME_PRICE'] = DEFAULT_MEDIAN_HOME_PRICE
+    df['MEDIAN_SQFT'] = DEFAULT_MEDIAN_SQFT
+
+    if 'CURRENT_SALE_RECORDING_DATE' in df.columns:
+        df['SALE_YEAR'] = pd.to_datetime(df['CURRENT_SALE_RECORDING_DATE'], errors='coerce').dt.year
+    df['EQUITY_COMFORT_SCORE'] = df['EQUITY'] / df['MEDIAN_HOME_PRICE']
+
+    return df
+
+
+def merge_client_data(dfs):
+    """
+    Concatenate per-file frames and prepare the result
+
+    Args:
+        dfs: List of DataFrames from read_client_data
+
+    Returns:
+        DataFrame: One prepared frame
+    """
+    return prepare_client_data(pd.concat(dfs, ignore_index=True))
@@ -0,0 +1,592 @@
+"""
+Local columnar cache for client data files stored in DigitalOcean Spaces
+Each object is downloaded and parsed once with the client data schema, saved
+as one NumPy .npy file per column, and memory-mapped on later requests.
+Text columns are stored as codes plus a dictionary of their distinct values
+(an offsets array into a UTF-8 blob) and come back as categoricals over the
+mapped codes, so a load never builds one Python string per cell
+"""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import pandas as pd
+
+from storage import download_file_from_spaces, download_many, get_file_metadata, get_files_metadata
+from client_data import read_client_data, NUMERIC_COLUMNS, CHUNK_ROWS
+from file_catalog import record_file_schema
+
+CACHE_DIR = os.environ.get('CLIENT_DATA_CACHE_DIR', '/tmp/client-data-cache')
+
+# Distinct values per text column that chunked writes deduplicate across
+# chunks; past this each chunk adds its own values, keeping memory flat
+CACHE_DICTIONARY_LIMIT = int(os.environ.get('CLIENT_DATA_CACHE_DICTIONARY_LIMIT', 20000))
+
+# Bump when the on-disk layout changes so stale entries are rebuilt
+CACHE_FORMAT_VERSION = 3
+
+
+def _key_dir(key):
+    """Directory holding every cached version of a Spaces key"""
+    return os.path.join(CACHE_DIR, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+
+def _entry_dir(key, etag):
+    """Directory for one (key, ETag) pair"""
+    return os.path.join(_key_dir(key), f'v{CACHE_FORMAT_VERSION}-{etag}')
+
+
+def _json_value(value):
+    """Keep JSON-native category values as-is, stringify anything else"""
+    if isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+# Marks dictionary entries that aren't strings; the JSON value follows it
+_TYPED_VALUE = '\x00'
+
+
+def _codes_dtype(size):
+    """The code dtype pandas uses for this many categories, so mapped codes are used as-is"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if size < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _dictionary_files(filename):
+    """Offsets and blob file names for a text column's dictionary"""
+    base = filename[:-len('.npy')]
+    return f'{base}.offsets.npy', f'{base}.blob'
+
+
+def _encode_values(values):
+    """Dictionary entries as UTF-8 byte strings"""
+    return [value.encode('utf-8') if isinstance(value, str)
+            else (_TYPED_VALUE + json.dumps(_json_value(value))).encode('utf-8')
+            for value in values]
+
+
+def _write_dictionary(directory, filename, values):
+    """Write a text column's distinct values as an offsets array and a blob"""
+    offsets_file, blob_file = _dictionary_files(filename)
+    encoded = _encode_values(values)
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    np.save(os.path.join(directory, offsets_file), offsets)
+    with open(os.path.join(directory, blob_file), 'wb') as f:
+        f.write(b''.join(encoded))
+
+
+def _read_dictionary(entry_dir, filename):
+    """A text column's distinct values, in code order"""
+    offsets_file, blob_file = _dictionary_files(filename)
+    bounds = np.load(os.path.join(entry_dir, offsets_file)).tolist()
+    with open(os.path.join(entry_dir, blob_file), 'rb') as f:
+        blob = f.read()
+    values = []
+    for start, end in zip(bounds, bounds[1:]):
+        text = blob[start:end].decode('utf-8')
+        values.append(json.loads(text[1:]) if text.startswith(_TYPED_VALUE) else text)
+    return values
+
+
+def _write_entry(df, entry_dir):
+    """Write a DataFrame as one .npy per column plus a manifest"""
+    os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+    staging_dir = tempfile.mkdtemp(dir=os.path.dirname(entry_dir), prefix='.staging-')
+
+    try:
+        columns = []
+        for i, name in enumerate(df.columns):
+            series = df[name]
+            filename = f'col_{i:04d}.npy'
+
+            if isinstance(series.dtype, pd.CategoricalDtype) or series.dtype == object:
+                # Strings are stored as codes into a dictionary so the column
+                # stays memory-mappable (object arrays are not)
+                if isinstance(series.dtype, pd.CategoricalDtype):
+                    kind, codes, categories = 'category', series.cat.codes.to_numpy(), series.cat.categories
+                else:
+                    kind = 'codes'
+                    codes, categories = pd.factorize(series, use_na_sentinel=True)
+                np.save(os.path.join(staging_dir, filename), codes.astype(_codes_dtype(len(categories))))
+                _write_dictionary(staging_dir, filename, categories)
+                columns.append({'name': name, 'file': filename, 'kind': kind})
+            else:
+                np.save(os.path.join(staging_dir, filename), series.to_numpy())
+                columns.append({'name': name, 'file': filename, 'kind': 'array', 'dtype': str(series.dtype)})
+
+        with open(os.path.join(staging_dir, 'manifest.json'), 'w') as f:
+            json.dump({'rows': len(df), 'columns': columns}, f)
+
+        try:
+            os.rename(staging_dir, entry_dir)
+        except OSError:
+            # Another worker finished the same entry first
+            shutil.rmtree(staging_dir, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+
+def _is_number_dtype(series):
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+
+def _has_text(series):
+    """True if a column holds values that aren't numbers"""
+    if _is_number_dtype(series):
+        return False
+    if pd.api.types.is_bool_dtype(series):
+        return bool(series.notna().any())
+    return bool((pd.to_numeric(series, errors='coerce').isna() & series.notna()).any())
+
+
+def _as_text(series):
+    """Numbers as the text a CSV reader keeps for a mixed column (123.0 -> '123')"""
+    return series.map(lambda v: f'{v:.0f}' if float(v).is_integer() else repr(float(v)), na_action='ignore')
+
+
+class CacheEntryWriter:
+    """
+    Build a cache entry from a stream of DataFrame chunks
+
+    Column files are appended to as chunks arrive, so the whole file never
+    has to be in memory. Schema numeric columns are always stored as
+    float64. Any other column that looks numeric in the first chunk is
+    stored as float64 only until a chunk holds text. It is then switched
+    to codes and its earlier rows rewritten as text, matching what a
+    full-file read would give. Names of switched columns collect in
+    self.retyped, since results computed on earlier chunks no longer apply.
+
+    Each chunk's text values are coded against that chunk's own distinct
+    values and appended to the column's on-disk dictionary. Values already
+    in the dictionary are reused while it is small (CACHE_DICTIONARY_LIMIT);
+    past that the column stops deduplicating across chunks, so memory
+    follows the chunk size rather than the file.
+    """
+
+    def __init__(self, key, etag):
+        self.key = key
+        self.etag = etag
+        self.entry_dir = _entry_dir(key, etag)
+        os.makedirs(os.path.dirname(self.entry_dir), exist_ok=True)
+        self.staging_dir = tempfile.mkdtemp(dir=os.path.dirname(self.entry_dir), prefix='.staging-')
+        self.columns = None
+        self.lookups = []
+        self.dictionary_sizes = []
+        self.blob_sizes = []
+        self.rows = 0
+        self.retyped = set()
+
+    def _raw_path(self, i):
+        return os.path.join(self.staging_dir, f'col_{i:04d}.raw')
+
+    def _ends_path(self, i):
+        return os.path.join(self.staging_dir, f'col_{i:04d}.ends.raw')
+
+    def append(self, chunk):
+        """
+        Append a chunk from read_client_data(..., chunksize=...)
+
+        Returns:
+            DataFrame: The chunk coerced to the stored column kinds; evaluate
+                       formulas on this so results match later cache reads
+        """
+        if self.columns is None:
+            self.columns = []
+            for i, name in enumerate(chunk.columns):
+                if isinstance(chunk[name].dtype, pd.CategoricalDtype):
+                    kind = 'category'
+                elif name in NUMERIC_COLUMNS or _is_number_dtype(chunk[name]):
+                    kind = 'float'
+                else:
+                    kind = 'codes'
+                self.columns.append({'name': name, 'file': f'col_{i:04d}.npy', 'kind': kind})
+                self.lookups.append({})
+                self.dictionary_sizes.append(0)
+                self.blob_sizes.append(0)
+
+        data = {}
+        for i, col in enumerate(self.columns):
+            series = chunk[col['name']] if col['name'] in chunk.columns else pd.Series(np.nan, index=chunk.index)
+            if col['kind'] == 'float' and col['name'] not in NUMERIC_COLUMNS and _has_text(series):
+                self._switch_to_codes(i)
+            if col['kind'] == 'float':
+                values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64)
+                data[col['name']] = values
+            else:
+                if col['kind'] == 'codes' and _is_number_dtype(series):
+                    series = _as_text(series)
+                values, chunk_codes, uniques = self._append_text(i, series)
+                data[col['name']] = pd.Categorical.from_codes(chunk_codes, pd.Index(uniques, dtype=object))
+            with open(self._raw_path(i), 'ab') as f:
+                values.tofile(f)
+
+        self.rows += len(chunk)
+        return pd.DataFrame(data, index=chunk.index)
+
+    def _append_text(self, i, series):
+        """
+        Code one chunk of a text column, adding its new values to the dictionary
+
+        Returns:
+            tuple: (int32 codes into the column dictionary, codes into
+                    uniques, the chunk's distinct values)
+        """
+        chunk_codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        uniques = np.asarray(uniques, dtype=object)
+        lookup = self.lookups[i]
+        mapping = np.full(len(uniques) + 1, -1, dtype=np.int32)
+        new_values = []
+        for j, value in enumerate(uniques):
+            code = lookup.get(value) if lookup is not None else None
+            if code is None:
+                code = self.dictionary_sizes[i] + len(new_values)
+                new_values.append(value)
+                if lookup is not None:
+                    lookup[value] = code
+            mapping[j] = code
+
+        encoded = _encode_values(new_values)
+        ends = self.blob_sizes[i] + np.cumsum([len(value) for value in encoded], dtype=np.int64)
+        with open(os.path.join(self.staging_dir, _dictionary_files(self.columns[i]['file'])[1]), 'ab') as f:
+            f.write(b''.join(encoded))
+        with open(self._ends_path(i), 'ab') as f:
+            ends.tofile(f)
+        if len(ends):
+            self.blob_sizes[i] = int(ends[-1])
+        self.dictionary_sizes[i] += len(new_values)
+
+        if lookup is not None and len(lookup) > CACHE_DICTIONARY_LIMIT:
+            print(f"[CACHE] {self.columns[i]['name']} has over {CACHE_DICTIONARY_LIMIT} distinct values; "
+                  f"no longer deduplicating across chunks")
+            self.lookups[i] = None
+        return mapping[chunk_codes], chunk_codes, uniques
+
+    def _switch_to_codes(self, i):
+        """Rewrite a provisional float column's rows so far as text codes"""
+        col = self.columns[i]
+        col['kind'] = 'codes'
+        path = self._raw_path(i)
+        with open(path, 'rb') as src, open(path + '.text', 'wb') as dst:
+            while True:
+                block = np.fromfile(src, dtype=np.float64, count=CHUNK_ROWS)
+                if not block.size:
+                    break
+                self._append_text(i, _as_text(pd.Series(block)))[0].tofile(dst)
+        os.replace(path + '.text', path)
+        self.retyped.add(col['name'])
+        print(f"[CACHE] {col['name']} holds text after {self.rows} rows; stored as text")
+
+    def _copy_raw(self, raw_path, out, dtype, start=0):
+        """Copy a raw appended file into a mapped .npy in bounded blocks, then delete it"""
+        with open(raw_path, 'rb') as f:
+            pos = start
+            while True:
+                block = np.fromfile(f, dtype=dtype, count=1 << 20)
+                if not block.size:
+                    break
+                out[pos:pos + len(block)] = block
+                pos += len(block)
+        out.flush()
+        os.remove(raw_path)
+
+    def finish(self, column_stats=None):
+        """
+        Convert the appended columns to .npy files and publish the entry
+
+        Args:
+            column_stats: Optional statistics stored with the file's catalog entry
+
+        Returns:
+            str: Cache entry directory, or None if it could not be written
+        """
+        try:
+            columns = []
+            for i, col in enumerate(self.columns or []):
+                if col['kind'] == 'float':
+                    out = np.lib.format.open_memmap(os.path.join(self.staging_dir, col['file']),
+                                                    mode='w+', dtype=np.float64, shape=(self.rows,))
+                    self._copy_raw(self._raw_path(i), out, np.float64)
+                    del out
+                    columns.append({'name': col['name'], 'file': col['file'], 'kind': 'array', 'dtype': 'float64'})
+                    continue
+
+                out = np.lib.format.open_memmap(os.path.join(self.staging_dir, col['file']), mode='w+',
+                                                dtype=_codes_dtype(self.dictionary_sizes[i]), shape=(self.rows,))
+                self._copy_raw(self._raw_path(i), out, np.int32)
+                del out
+                offsets = np.lib.format.open_memmap(
+                    os.path.join(self.staging_dir, _dictionary_files(col['file'])[0]),
+                    mode='w+', dtype=np.int64, shape=(self.dictionary_sizes[i] + 1,))
+                offsets[0] = 0
+                self._copy_raw(self._ends_path(i), offsets, np.int64, start=1)
+                del offsets
+                columns.append({'name': col['name'], 'file': col['file'], 'kind': col['kind']})
+
+            with open(os.path.join(self.staging_dir, 'manifest.json'), 'w') as f:
+                json.dump({'rows': self.rows, 'columns': columns}, f)
+
+            try:
+                os.rename(self.staging_dir, self.entry_dir)
+            except OSError:
+                shutil.rmtree(self.staging_dir, ignore_errors=True)
+            _prune_other_versions(self.key, self.entry_dir)
+            _record_schema(self.key, self.etag, self.entry_dir, column_stats)
+            return self.entry_dir
+        except Exception as e:
+            print(f"[CACHE] Could not cache {self.key}: {e}")
+            self.abort()
+            return None
+
+    def abort(self):
+        """Discard a partially written entry"""
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+
+def _read_entry(entry_dir, columns=None):
+    """Rebuild a DataFrame from memory-mapped column files"""
+    with open(os.path.join(entry_dir, 'manifest.json'), 'r') as f:
+        manifest = json.load(f)
+
+    data = {}
+    for col in manifest['columns']:
+        if columns is not None and col['name'] not in columns:
+            continue
+        # Copy-on-write mapping: pages are shared until a caller mutates them
+        values = np.load(os.path.join(entry_dir, col['file']), mmap_mode='c')
+        if col['kind'] in ('category', 'codes'):
+            categories = pd.Index(_read_dictionary(entry_dir, col['file']), dtype=object)
+            if not categories.is_unique:
+                # Chunks written after the dictionary limit can repeat a value
+                remap, categories = pd.factorize(categories)
+                values = np.append(remap, -1)[values].astype(_codes_dtype(len(categories)))
+            data[col['name']] = pd.Categorical.from_codes(values, categories)
+        else:
+            data[col['name']] = values
+
+    return pd.DataFrame(data, index=pd.RangeIndex(manifest['rows']), copy=False)
+
+
+def _record_schema(key, etag, entry_dir, column_stats=None):
+    """Publish a cache entry's row count and column types to the file catalog"""
+    try:
+        with open(os.path.join(entry_dir, 'manifest.json'), 'r') as f:
+            manifest = json.load(f)
+        types = {'category': 'category', 'codes': 'text'}
+        columns = []
+        for col in manifest['columns']:
+            kind = types.get(col['kind'])
+            if kind is None:
+                dtype = col.get('dtype', '')
+                kind = 'boolean' if dtype == 'bool' else 'datetime' if dtype.startswith('datetime') else 'number'
+            columns.append({'name': col['name'], 'type': kind})
+        record_file_schema(key, etag, manifest['rows'], columns, column_stats)
+    except Exception as e:
+        print(f"[CACHE] Could not record schema for {key}: {e}")
+
+
+def _prune_other_versions(key, keep_dir):
+    """Remove cache entries for older ETags of the same key"""
+    key_dir = _key_dir(key)
+    if not os.path.isdir(key_dir):
+        return
+    for name in os.listdir(key_dir):
+        path = os.path.join(key_dir, name)
+        if path != keep_dir and not name.startswith('.staging-'):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _store(key, etag, df):
+    """Write df as the cache entry for (key, etag); return its directory or None"""
+    entry_dir = _entry_dir(key, etag)
+    try:
+        _write_entry(df, entry_dir)
+        _prune_other_versions(key, entry_dir)
+        _record_schema(key, etag, entry_dir)
+        return entry_dir
+    except Exception as e:
+        print(f"[CACHE] Could not cache {key}: {e}")
+        return None
+
+
+def read_cache_entry(entry_dir, columns=None):
+    """
+    Load the DataFrame stored in a cache entry
+
+    Args:
+        entry_dir: Directory returned by resolve_cache_entry
+        columns: Optional collection of column names to load (others are
+                 skipped, names the file lacks are ignored)
+
+    Returns:
+        DataFrame: Typed client data backed by memory-mapped columns; text
+                   columns are categoricals over the mapped codes
+    """
+    return _read_entry(entry_dir, columns)
+
+
+def cache_entry_rows(entry_dir):
+    """Row count of a cache entry, read from its manifest"""
+    with open(os.path.join(entry_dir, 'manifest.json'), 'r') as f:
+        return json.load(f)['rows']
+
+
+def resolve_cache_entry(key):
+    """
+    Make sure the current version of a Spaces object is cached locally
+
+    Only a HEAD request is made when the cached ETag is still current.
+
+    Args:
+        key: File key in Spaces
+
+    Returns:
+        tuple: (entry_dir, df). entry_dir is None if the file could not be
+               cached; df is the freshly parsed frame on a cache miss and
+               None on a hit (load it with read_cache_entry). Both are None
+               if the file could not be loaded at all.
+    """
+    meta = get_file_metadata(key)
+    if not meta['success']:
+        print(f"[CACHE] {meta['message']}")
+        return None, None
+
+    entry_dir = _entry_dir(key, meta['etag'])
+    if os.path.exists(os.path.join(entry_dir, 'manifest.json')):
+        return entry_dir, None
+
+    # Cache miss - download to a private temp file and parse once
+    suffix = os.path.splitext(key)[1]
+    fd, local_path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    try:
+        result = download_file_from_spaces(key, local_path)
+        if not result['success']:
+            print(f"[CACHE] {result['message']}")
+            return None, None
+        df = read_client_data(local_path)
+    finally:
+        if os.path.exists(local_path):
+            os.remove(local_path)
+
+    return _store(key, meta['etag'], df), df
+
+
+def resolve_cache_entries(keys):
+    """
+    Make sure several Spaces objects are cached, fetching them concurrently
+
+    Metadata lookups and downloads of uncached files run in parallel; the
+    downloaded files are then parsed and cached one at a time so only one
+    parsed frame is held in memory.
+
+    Args:
+        keys: List of file keys in Spaces
+
+    Returns:
+        list: (entry_dir, df) per key, in order. df is only set when the
+              file loaded but could not be cached; both are None if the
+              file could not be loaded.
+    """
+    metas = get_files_metadata(keys)
+    results = {}
+    missing = []
+    for key, meta in metas.items():
+        if not meta['success']:
+            print(f"[CACHE] {meta['message']}")
+            results[key] = (None, None)
+        elif os.path.exists(os.path.join(_entry_dir(key, meta['etag']), 'manifest.json')):
+            results[key] = (_entry_dir(key, meta['etag']), None)
+        else:
+            missing.append(key)
+
+    if missing:
+        download_dir = tempfile.mkdtemp()
+        try:
+            downloads = download_many(missing, download_dir)
+            for key in missing:
+                if not downloads[key]['success']:
+                    print(f"[CACHE] {downloads[key]['message']}")
+                    results[key] = (None, None)
+                    continue
+                df = read_client_data(downloads[key]['path'])
+                os.remove(downloads[key]['path'])
+                entry_dir = _store(key, metas[key]['etag'], df)
+                results[key] = (entry_dir, None if entry_dir else df)
+        finally:
+            shutil.rmtree(download_dir, ignore_errors=True)
+
+    return [results[key] for key in keys]
+
+
+def cache_client_file(key, df):
+    """
+    Prime the cache with a frame that was just uploaded
+
+    Args:
+        key: File key in Spaces
+        df: Typed frame from read_client_data (before prepare_client_data)
+
+    Returns:
+        str: Cache entry directory, or None if it could not be cached
+    """
+    meta = get_file_metadata(key)
+    if not meta['success']:
+        print(f"[CACHE] {meta['message']}")
+        return None
+    return _store(key, meta['etag'], df)
+
+
+def load_client_file(key):
+    """
+    Load one client data file, using the local cache when the ETag matches
+
+    Args:
+        key: File key in Spaces
+
+    Returns:
+        DataFrame or None if the file could not be loaded
+    """
+    entry_dir, df = resolve_cache_entry(key)
+    if df is not None or entry_dir is None:
+        return df
+
+    try:
+        return read_cache_entry(entry_dir)
+    except Exception as e:
+        # Corrupt entry - drop it and fetch the object again
+        print(f"[CACHE] Discarding unreadable entry for {key}: {e}")
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        entry_dir, df = resolve_cache_entry(key)
+        return df
+
+
+def load_client_files(keys):
+    """
+    Load several client data files, skipping any that fail
+
+    Args:
+        keys: List of file keys in Spaces
+
+    Returns:
+        list: DataFrames in the same order as keys
+    """
+    dfs = []
+    for key in keys:
+        df = load_client_file(key)
+        if df is not None:
+            dfs.append(df)
+    return dfs
+
+
+def evict_client_file(key):
+    """Drop every cached version of a Spaces key"""
+    shutil.rmtree(_key_dir(key), ignore_errors=True)
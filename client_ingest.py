@@ -0,0 +1,116 @@
+"""
+Streaming ingestion for uploaded client data files
+Parses a spooled upload in bounded chunks and, in the same pass, fills the
+local column cache, the segment bitmap index, segment counts and column
+statistics, so memory stays flat regardless of file size
+"""
+import numpy as np
+
+from client_data import NUMERIC_COLUMNS, PREPARE_COLUMNS, CHUNK_ROWS, read_client_data_chunks, prepare_client_data
+from client_data_cache import CacheEntryWriter, read_cache_entry
+from formula_evaluator import formula_masks, formula_columns
+from segment_index import store_packed_bitmaps, add_formula_columns
+from storage import get_file_metadata
+
+
+def _update_stats(stats, df):
+    """
+    Fold one chunk into running per-column statistics
+
+    Takes the chunk before prepare_client_data fills in defaults, so the
+    stats describe the uploaded values; columns the file lacks are skipped.
+    """
+    for col in NUMERIC_COLUMNS:
+        if col not in df.columns:
+            continue
+        values = df[col].to_numpy(dtype=np.float64)
+        present = values[~np.isnan(values)]
+        col_stats = stats.setdefault(col, {'count': 0, 'nulls': 0, 'sum': 0.0, 'min': None, 'max': None})
+        col_stats['count'] += len(present)
+        col_stats['nulls'] += len(values) - len(present)
+        if len(present):
+            col_stats['sum'] += float(present.sum())
+            low, high = float(present.min()), float(present.max())
+            col_stats['min'] = low if col_stats['min'] is None else min(col_stats['min'], low)
+            col_stats['max'] = high if col_stats['max'] is None else max(col_stats['max'], high)
+
+
+def _finish_stats(stats):
+    """Replace running sums with means"""
+    for col_stats in stats.values():
+        total = col_stats.pop('sum')
+        col_stats['mean'] = total / col_stats['count'] if col_stats['count'] else None
+    return stats
+
+
+def ingest_client_file(path, key, formulas, chunksize=CHUNK_ROWS, progress=None):
+    """
+    Process an uploaded file that is already stored in Spaces
+
+    Args:
+        path: Local spool file holding the upload
+        key: File key the upload was stored under in Spaces
+        formulas: Segment formulas to count
+        chunksize: Rows per parsed batch
+        progress: Optional callback(rows) after each chunk
+
+    Returns:
+        dict: {'rows': int, 'counts': {formula: count or None if it failed},
+               'stats': {column: {count, nulls, min, max, mean}} of the
+               uploaded numeric columns,
+               'entry_dir': cache entry directory or None}
+    """
+    formulas = list(dict.fromkeys(formulas))
+    counts = {formula: 0 for formula in formulas}
+    packed = {formula: [] for formula in formulas}
+    stats = {}
+    rows = 0
+
+    meta = get_file_metadata(key)
+    if not meta['success']:
+        print(f"[INGEST] {meta['message']}")
+    writer = CacheEntryWriter(key, meta['etag']) if meta['success'] else None
+
+    try:
+        for chunk in read_client_data_chunks(path, chunksize):
+            if writer:
+                # Evaluate on the stored representation so later cache reads agree
+                chunk = writer.append(chunk)
+            _update_stats(stats, chunk)
+            df = prepare_client_data(chunk)
+            rows += len(df)
+            add_formula_columns(df, formulas)
+
+            for formula, mask in formula_masks(df, formulas).items():
+                if mask is None or packed[formula] is None:
+                    counts[formula] = None
+                    packed[formula] = None
+                else:
+                    counts[formula] += int(mask.sum())
+                    packed[formula].append(np.packbits(mask))
+            print(f"[INGEST] {rows} rows processed")
+            if progress:
+                progress(rows)
+    except Exception:
+        if writer:
+            writer.abort()
+        raise
+
+    stats = _finish_stats(stats)
+    entry_dir = writer.finish(column_stats=stats) if writer else None
+    if entry_dir and writer.retyped:
+        # Earlier chunks were evaluated while these columns still held numbers
+        stale = [formula for formula in formulas if formula_columns([formula]) & writer.retyped]
+        if stale:
+            df = read_cache_entry(entry_dir, set(PREPARE_COLUMNS) | formula_columns(stale))
+            df = add_formula_columns(prepare_client_data(df), stale)
+            for formula, mask in formula_masks(df, stale).items():
+                counts[formula] = int(mask.sum()) if mask is not None else None
+                packed[formula] = [np.packbits(mask)] if mask is not None else None
+    if entry_dir:
+        store_packed_bitmaps(entry_dir, {
+            formula: (np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint8)) if parts is not None else None
+            for formula, parts in packed.items()
+        })
+
+    return {'rows': rows, 'counts': counts, 'stats': stats, 'entry_dir': entry_dir}
@@ -0,0 +1,745 @@
+"""
+Embedded SQLite store for campaigns, submissions, segments, templates,
+audiences and past client segments
+Each collection is a table of JSON documents with indexed id, campaign_id,
+segment and status columns; submissions also keep a trigram full-text index
+of email and names for search. Writes touch single rows inside WAL transactions, so
+concurrent workers never rewrite (or clobber) a whole collection.
+"""
+import os
+import json
+import pickle
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+
+DATASTORE_DB = os.environ.get('DATASTORE_DB', 'keyes.db')
+
+# Collection -> JSON file imported the first time the collection is used
+COLLECTIONS = {
+    'submissions': 'submissions.json',
+    'campaigns': 'campaigns.json',
+    'segments': 'segments.json',
+    'templates': 'email_templates.json',
+    'audiences': 'behavioral_audiences.json',
+    'past_clients': 'past_clients.json'
+}
+
+# Collections listed newest first (new items are inserted at the front)
+NEWEST_FIRST = {'submissions'}
+
+INDEXED_FIELDS = ('campaign_id', 'segment', 'status')
+
+# Columns kept beside each JSON document, in the order _columns returns them
+_COLUMNS = ('id',) + INDEXED_FIELDS
+_ASSIGN_COLUMNS = ', '.join(f'{column} = ?' for column in _COLUMNS + ('data',))
+
+# Submission fields the search box matches, through a trigram index
+SEARCH_FIELDS = ('email', 'first_name', 'last_name')
+
+# Trigrams can't match shorter text, so shorter searches are not run
+SEARCH_MIN_CHARS = 3
+
+# Small collections read on most pages, held per process and reloaded only
+# when their version changes (submissions are always queried directly)
+CACHED_COLLECTIONS = {'campaigns', 'segments', 'templates', 'audiences', 'past_clients'}
+
+_local = threading.local()
+_ready = set()
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _connect():
+    """Per-thread connection (reopened after fork)"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid():
+        conn = sqlite3.connect(DATASTORE_DB, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+@contextmanager
+def _transaction(collection=None):
+    """
+    Write transaction; BEGIN IMMEDIATE takes the write lock up front
+
+    Args:
+        collection: Collection being written; cached collections get their
+                    version bumped when rows changed, so every process
+                    reloads its copy
+    """
+    collection = collection if collection in CACHED_COLLECTIONS else None
+    conn = _connect()
+    conn.execute('BEGIN IMMEDIATE')
+    changes = conn.total_changes
+    version = None
+    try:
+        yield conn
+        if collection and conn.total_changes != changes:
+            version = _bump_version(conn, collection)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    if version is not None:
+        _write_version(collection, version)
+
+
+def _bump_version(conn, collection):
+    """Increment a collection's version inside the current transaction"""
+    return conn.execute('''
+        INSERT INTO versions (collection, version) VALUES (?, 1)
+        ON CONFLICT (collection) DO UPDATE SET version = version + 1
+        RETURNING version
+    ''', (collection,)).fetchone()[0]
+
+
+def _version_path(collection):
+    return f'{DATASTORE_DB}.{collection}.version'
+
+
+def _write_version(collection, version):
+    """Publish a collection's version (written after commit, so readers never see it early)"""
+    with _cache_lock:
+        _cache.pop(collection, None)
+    path = _version_path(collection)
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(version))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"[DATASTORE] Error publishing {collection} version: {str(e)}")
+
+
+def _version_tag(collection):
+    """Identity of the current version file (replaced on every publish), or None"""
+    try:
+        st = os.stat(_version_path(collection))
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _cached(collection):
+    """
+    Per-process copy of a collection, indexed by id
+
+    Items are kept pickled so each caller gets its own copy to modify,
+    which is cheaper than re-parsing the JSON. The version file is checked
+    before the table is read, so a copy is never tagged newer than its data.
+
+    Returns:
+        dict: {'version', 'items': [pickled], 'by_id': {id: pickled}}
+    """
+    version = _version_tag(collection)
+    with _cache_lock:
+        entry = _cache.get(collection)
+    if entry and version is not None and entry['version'] == version:
+        return entry
+
+    rows = _connect().execute(f'SELECT id, data FROM {collection} ORDER BY {_order(collection)}').fetchall()
+    entry = {'version': version, 'items': [], 'by_id': {}}
+    for item_id, data in rows:
+        item = pickle.dumps(json.loads(data), pickle.HIGHEST_PROTOCOL)
+        entry['items'].append(item)
+        entry['by_id'].setdefault(item_id, item)
+    if version is not None:
+        with _cache_lock:
+            _cache[collection] = entry
+    return entry
+
+
+def _table(collection):
+    """Validated table name for a collection, creating/importing it on first use"""
+    if collection not in COLLECTIONS:
+        raise ValueError(f'Unknown collection: {collection}')
+    if (collection, os.getpid()) not in _ready:
+        _ensure_collection(collection)
+        _ready.add((collection, os.getpid()))
+    return collection
+
+
+def _ensure_collection(collection):
+    """
+    Create the table and import the legacy JSON file once
+
+    Runs in every process on first use, so it only bumps the collection
+    version when it imported rows (or no version was ever published);
+    otherwise other processes' cached copies stay valid.
+    """
+    version = None
+    with _transaction() as conn:
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {collection} (
+                pk INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT,
+                campaign_id TEXT,
+                segment TEXT,
+                status TEXT,
+                data TEXT NOT NULL
+            )
+        ''')
+        _add_indexed_columns(conn, collection)
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{collection}_id ON {collection} (id)')
+        for field in INDEXED_FIELDS:
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{collection}_{field} ON {collection} ({field})')
+        conn.execute('CREATE TABLE IF NOT EXISTS migrations (collection TEXT PRIMARY KEY)')
+        conn.execute('CREATE TABLE IF NOT EXISTS versions (collection TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+        if collection == 'submissions':
+            _ensure_submission_stats(conn)
+            _ensure_submission_search(conn)
+
+        imported = False
+        path = COLLECTIONS[collection]
+        if os.path.exists(path) and not conn.execute('SELECT 1 FROM migrations WHERE collection = ?',
+                                                     (collection,)).fetchone():
+            try:
+                with open(path, 'r') as f:
+                    items = json.load(f)
+            except json.JSONDecodeError:
+                items = []
+            # Stored oldest first so pk order is insertion order
+            if collection in NEWEST_FIRST:
+                items = list(reversed(items))
+            for item in items:
+                _insert(conn, collection, item)
+            _reserve_ids(conn, collection, items)
+            imported = bool(items)
+            print(f"[DATASTORE] Imported {len(items)} {collection} from {path}")
+        conn.execute('INSERT OR IGNORE INTO migrations (collection) VALUES (?)', (collection,))
+
+        if collection in CACHED_COLLECTIONS and (imported or _version_tag(collection) is None):
+            version = _bump_version(conn, collection)
+    if version is not None:
+        _write_version(collection, version)
+
+
+def _add_indexed_columns(conn, table):
+    """Add indexed columns missing from tables created before them, filled from the documents"""
+    existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+    for field in INDEXED_FIELDS:
+        if field not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {field} TEXT')
+            conn.execute(f"UPDATE {table} SET {field} = CAST(json_extract(data, '$.{field}') AS TEXT)")
+
+
+# Submission counts grouped by campaign, status and equity priority,
+# maintained by triggers so every write path keeps them current
+_STATS_KEY = """COALESCE({row}.campaign_id, ''), COALESCE(json_extract({row}.data, '$.status'), ''),
+    COALESCE(json_extract({row}.data, '$.equity_priority'), '')"""
+
+_STATS_ADD = f"""
+    INSERT INTO submission_stats (campaign_id, status, equity_priority, count, last_submission)
+    VALUES ({_STATS_KEY}, 1, json_extract({{row}}.data, '$.timestamp'))
+    ON CONFLICT (campaign_id, status, equity_priority) DO UPDATE SET
+        count = count + 1,
+        last_submission = MAX(COALESCE(last_submission, ''), COALESCE(excluded.last_submission, ''));
+"""
+
+_STATS_REMOVE = f"""
+    UPDATE submission_stats SET
+        count = count - 1,
+        last_submission = (
+            SELECT MAX(json_extract(data, '$.timestamp')) FROM submissions
+            WHERE campaign_id IS {{row}}.campaign_id
+              AND COALESCE(json_extract(data, '$.status'), '') = COALESCE(json_extract({{row}}.data, '$.status'), '')
+              AND COALESCE(json_extract(data, '$.equity_priority'), '') = COALESCE(json_extract({{row}}.data, '$.equity_priority'), '')
+        )
+    WHERE (campaign_id, status, equity_priority) = ({_STATS_KEY});
+    DELETE FROM submission_stats WHERE count <= 0;
+"""
+
+
+def _ensure_submission_stats(conn):
+    """Create the submission aggregate table and its triggers, backfilling existing rows once"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS submission_stats (
+            campaign_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            equity_priority TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            last_submission TEXT,
+            PRIMARY KEY (campaign_id, status, equity_priority)
+        )
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS submissions_stats_insert AFTER INSERT ON submissions BEGIN
+            {_STATS_ADD.format(row='NEW')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS submissions_stats_delete AFTER DELETE ON submissions BEGIN
+            {_STATS_REMOVE.format(row='OLD')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS submissions_stats_update AFTER UPDATE OF campaign_id, data ON submissions BEGIN
+            {_STATS_REMOVE.format(row='OLD')}
+            {_STATS_ADD.format(row='NEW')}
+        END
+    ''')
+
+    if conn.execute("SELECT 1 FROM migrations WHERE collection = 'submission_stats'").fetchone():
+        return
+    # Databases created before the aggregates existed
+    conn.execute(f'''
+        INSERT INTO submission_stats (campaign_id, status, equity_priority, count, last_submission)
+        SELECT {_STATS_KEY.format(row='submissions')}, COUNT(*), MAX(json_extract(data, '$.timestamp'))
+        FROM submissions GROUP BY 1, 2, 3
+    ''')
+    conn.execute("INSERT INTO migrations (collection) VALUES ('submission_stats')")
+
+
+_SEARCH_VALUES = ', '.join(f"json_extract({{row}}.data, '$.{field}')" for field in SEARCH_FIELDS)
+
+
+def _ensure_submission_search(conn):
+    """Create the submission search index and its triggers, backfilling existing rows once"""
+    conn.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS submissions_search
+        USING fts5({', '.join(SEARCH_FIELDS)}, tokenize = 'trigram')
+    ''')
+    columns = ', '.join(('rowid',) + SEARCH_FIELDS)
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS submissions_search_insert AFTER INSERT ON submissions BEGIN
+            INSERT INTO submissions_search ({columns}) VALUES (NEW.pk, {_SEARCH_VALUES.format(row='NEW')});
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS submissions_search_delete AFTER DELETE ON submissions BEGIN
+            DELETE FROM submissions_search WHERE rowid = OLD.pk;
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS submissions_search_update AFTER UPDATE OF data ON submissions BEGIN
+            DELETE FROM submissions_search WHERE rowid = OLD.pk;
+            INSERT INTO submissions_search ({columns}) VALUES (NEW.pk, {_SEARCH_VALUES.format(row='NEW')});
+        END
+    ''')
+
+    if conn.execute("SELECT 1 FROM migrations WHERE collection = 'submissions_search'").fetchone():
+        return
+    # Databases created before the search index existed
+    conn.execute(f'''
+        INSERT INTO submissions_search ({columns})
+        SELECT pk, {_SEARCH_VALUES.format(row='submissions')} FROM submissions
+    ''')
+    conn.execute("INSERT INTO migrations (collection) VALUES ('submissions_search')")
+
+
+def _reserve_ids(conn, table, items):
+    """Move the autoincrement sequence past imported numeric ids so append_item never reuses one"""
+    numeric_ids = [item['id'] for item in items if isinstance(item.get('id'), int)]
+    if not numeric_ids:
+        return
+    conn.execute('UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?', (max(numeric_ids), table))
+
+
+def _key(value):
+    return None if value is None else str(value)
+
+
+def _columns(item):
+    return tuple(_key(item.get(column)) for column in _COLUMNS)
+
+
+def _insert(conn, table, item):
+    conn.execute(
+        f'INSERT INTO {table} ({", ".join(_COLUMNS)}, data) VALUES ({", ".join("?" * (len(_COLUMNS) + 1))})',
+        _columns(item) + (json.dumps(item),)
+    )
+
+
+def _order(collection):
+    return 'pk DESC' if collection in NEWEST_FIRST else 'pk'
+
+
+def load_items(collection):
+    """
+    Load every item in a collection
+
+    Args:
+        collection: Name from COLLECTIONS
+
+    Returns:
+        list: Items in the collection's display order
+    """
+    table = _table(collection)
+    if collection in CACHED_COLLECTIONS:
+        return [pickle.loads(item) for item in _cached(collection)['items']]
+    rows = _connect().execute(f'SELECT data FROM {table} ORDER BY {_order(collection)}').fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+
+def get_item(collection, item_id):
+    """Item with the given id (cached or indexed lookup), or None"""
+    table = _table(collection)
+    if collection in CACHED_COLLECTIONS:
+        item = _cached(collection)['by_id'].get(_key(item_id))
+        return pickle.loads(item) if item else None
+    row = _connect().execute(f'SELECT data FROM {table} WHERE id = ? ORDER BY pk LIMIT 1', (_key(item_id),)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def find_items(collection, **filters):
+    """
+    Items matching indexed fields
+
+    Args:
+        collection: Name from COLLECTIONS
+        **filters: campaign_id=..., segment=... and/or status=...
+
+    Returns:
+        list: Matching items in display order
+    """
+    table = _table(collection)
+    if set(filters) - set(INDEXED_FIELDS):
+        raise ValueError(f'Can only filter on {", ".join(INDEXED_FIELDS)}')
+    where = ' AND '.join(f'{field} = ?' for field in filters) or '1 = 1'
+    rows = _connect().execute(
+        f'SELECT data FROM {table} WHERE {where} ORDER BY {_order(collection)}',
+        tuple(_key(value) for value in filters.values())
+    ).fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+
+def _filter_sql(filters, between, search=None):
+    """WHERE clauses and parameters for iter_items filters (search applies to submissions)"""
+    clauses, params = [], []
+    for field, value in (filters or {}).items():
+        if field in INDEXED_FIELDS:
+            clauses.append(f'{field} = ?')
+            params.append(_key(value))
+        else:
+            clauses.append('json_extract(data, ?) = ?')
+            params.extend(['$.' + field, value])
+    if between:
+        field, low, high = between
+        if low is not None:
+            clauses.append('json_extract(data, ?) >= ?')
+            params.extend(['$.' + field, low])
+        if high is not None:
+            clauses.append('json_extract(data, ?) <= ?')
+            params.extend(['$.' + field, high])
+    if search:
+        # Quoted, the text is one phrase: a case-insensitive substring for the trigram tokenizer
+        clauses.append('pk IN (SELECT rowid FROM submissions_search WHERE submissions_search MATCH ?)')
+        params.append('"' + search.replace('"', '""') + '"')
+    return clauses, params
+
+
+def iter_items(collection, filters=None, between=None, search=None, cursor=None, limit=None,
+               reverse=False, batch_size=500):
+    """
+    Stream items in display order, fetched in keyset batches
+
+    Only one batch is held at a time, and no read cursor stays open between
+    batches, so callers can stream any number of rows in constant memory.
+
+    Args:
+        collection: Name from COLLECTIONS
+        filters: {field: value} equality filters; campaign_id, segment and
+                 status use their index, other fields match the stored
+                 document
+        between: Optional (field, low, high) inclusive range on a document
+                 field; either bound may be None
+        search: Optional text matched case-insensitively anywhere in a
+                submission's SEARCH_FIELDS, through the search index; must
+                be at least SEARCH_MIN_CHARS long
+        cursor: Position returned with an earlier item; iteration resumes
+                after it
+        limit: Maximum number of items (None for all)
+        reverse: Iterate opposite to display order
+        batch_size: Rows fetched per query
+
+    Yields:
+        tuple: (cursor, item)
+    """
+    table = _table(collection)
+    if search and (collection != 'submissions' or len(search) < SEARCH_MIN_CHARS):
+        raise ValueError(f'Search needs submissions and at least {SEARCH_MIN_CHARS} characters')
+    clauses, params = _filter_sql(filters, between, search)
+    descending = (collection in NEWEST_FIRST) != reverse
+    order = 'pk DESC' if descending else 'pk'
+    remaining = limit
+
+    while remaining is None or remaining > 0:
+        page_clauses = list(clauses)
+        if cursor is not None:
+            page_clauses.append('pk < ?' if descending else 'pk > ?')
+        where = ' AND '.join(page_clauses) or '1 = 1'
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        rows = _connect().execute(
+            f'SELECT pk, data FROM {table} WHERE {where} ORDER BY {order} LIMIT ?',
+            tuple(params) + ((cursor,) if cursor is not None else ()) + (size,)
+        ).fetchall()
+
+        for pk, data in rows:
+            yield pk, json.loads(data)
+        if len(rows) < size:
+            return
+        cursor = rows[-1][0]
+        if remaining is not None:
+            remaining -= len(rows)
+
+
+def count_items(collection):
+    """Number of items in a collection"""
+    table = _table(collection)
+    return _connect().execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+def insert_item(collection, item):
+    """Add one item (at the front for newest-first collections)"""
+    table = _table(collection)
+    with _transaction(table) as conn:
+        _insert(conn, table, item)
+
+
+def insert_new_item(collection, item):
+    """
+    Add one item unless its id is already taken
+
+    The check runs inside the insert transaction, so two processes adding
+    the same id can't both succeed.
+
+    Returns:
+        bool: True if the item was added
+    """
+    table = _table(collection)
+    with _transaction(table) as conn:
+        if conn.execute(f'SELECT 1 FROM {table} WHERE id = ?', (_key(item['id']),)).fetchone():
+            return False
+        _insert(conn, table, item)
+    return True
+
+
+def append_item(collection, item):
+    """
+    Add one item under the next id from the collection's sequence
+
+    Ids come from the table's autoincrement counter inside the insert
+    transaction, so they are unique and increasing across processes.
+
+    Args:
+        collection: Name from COLLECTIONS
+        item: Item without an id; its 'id' is set in place
+
+    Returns:
+        int: The new id
+    """
+    table = _table(collection)
+    with _transaction(table) as conn:
+        # The write lock is held, so no other process can take this id
+        item['id'] = conn.execute(
+            'SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), 0) + 1', (table,)
+        ).fetchone()[0]
+        conn.execute(
+            f'INSERT INTO {table} (pk, {", ".join(_COLUMNS)}, data) VALUES ({", ".join("?" * (len(_COLUMNS) + 2))})',
+            (item['id'],) + _columns(item) + (json.dumps(item),)
+        )
+    return item['id']
+
+
+def update_item(collection, item):
+    """
+    Replace the stored item that has item['id']
+
+    Returns:
+        bool: True if an item was updated
+    """
+    table = _table(collection)
+    with _transaction(table) as conn:
+        cursor = conn.execute(
+            f'UPDATE {table} SET {_ASSIGN_COLUMNS} WHERE id = ?',
+            _columns(item) + (json.dumps(item), _key(item.get('id')))
+        )
+    return cursor.rowcount > 0
+
+
+def modify_item(collection, item_id, mutate):
+    """
+    Read-modify-write one item in a transaction
+
+    Args:
+        collection: Name from COLLECTIONS
+        item_id: Id of the item to change
+        mutate: Function(item) that changes the item in place; its return
+                value is passed back
+
+    Returns:
+        Whatever mutate returned
+
+    Raises:
+        KeyError: If no item has that id
+    """
+    table = _table(collection)
+    with _transaction(table) as conn:
+        row = conn.execute(f'SELECT pk, data FROM {table} WHERE id = ? ORDER BY pk LIMIT 1', (_key(item_id),)).fetchone()
+        if row is None:
+            raise KeyError(item_id)
+        item = json.loads(row[1])
+        result = mutate(item)
+        conn.execute(f'UPDATE {table} SET {_ASSIGN_COLUMNS} WHERE pk = ?',
+                     _columns(item) + (json.dumps(item), row[0]))
+    return result
+
+
+def delete_item(collection, item_id):
+    """
+    Remove the item with the given id
+
+    Returns:
+        bool: True if an item was deleted
+    """
+    table = _table(collection)
+    with _transaction(table) as conn:
+        cursor = conn.execute(f'DELETE FROM {table} WHERE id = ?', (_key(item_id),))
+    return cursor.rowcount > 0
+
+
+def _write_changes(conn, table, items):
+    """Bring the table in line with items, writing only rows that changed"""
+    existing = {}
+    for pk, item_id, data in conn.execute(f'SELECT pk, id, data FROM {table}'):
+        existing.setdefault(item_id, []).append((pk, data))
+
+    new_items = []
+    for item in items:
+        matches = existing.get(_key(item.get('id')))
+        if matches:
+            pk, data = matches.pop(0)
+            encoded = json.dumps(item)
+            if encoded != data:
+                conn.execute(f'UPDATE {table} SET {_ASSIGN_COLUMNS} WHERE pk = ?',
+                             _columns(item) + (encoded, pk))
+        else:
+            new_items.append(item)
+
+    for matches in existing.values():
+        for pk, _ in matches:
+            conn.execute(f'DELETE FROM {table} WHERE pk = ?', (pk,))
+    return new_items
+
+
+def replace_items(collection, items):
+    """
+    Save a whole collection (compatibility for callers holding the full list)
+
+    Only rows that changed are written. New items go at the end (or the
+    front for newest-first collections); existing items keep their position.
+
+    Args:
+        collection: Name from COLLECTIONS
+        items: Full list of items
+    """
+    table = _table(collection)
+    with _transaction(table) as conn:
+        new_items = _write_changes(conn, table, items)
+        if collection in NEWEST_FIRST:
+            new_items = list(reversed(new_items))
+        for item in new_items:
+            _insert(conn, table, item)
+
+
+def update_items(collection, mutate):
+    """
+    Read-modify-write a collection in one transaction
+
+    Args:
+        collection: Name from COLLECTIONS
+        mutate: Function(items) that changes the list in place; its return
+                value is passed back
+
+    Returns:
+        Whatever mutate returned
+    """
+    table = _table(collection)
+    with _transaction(table) as conn:
+        rows = conn.execute(f'SELECT data FROM {table} ORDER BY {_order(collection)}').fetchall()
+        items = [json.loads(row[0]) for row in rows]
+        result = mutate(items)
+        new_items = _write_changes(conn, table, items)
+        if collection in NEWEST_FIRST:
+            new_items = list(reversed(new_items))
+        for item in new_items:
+            _insert(conn, table, item)
+    return result
+
+
+def empty_stats():
+    """Submission stats for a campaign or segment with no submissions"""
+    return {'total': 0, 'pending': 0, 'priorities': {}, 'last_submission': None}
+
+
+def _fold_stats(rows):
+    """Combine (group, status, equity_priority, count, last_submission) rows into stats per group"""
+    stats = {}
+    for group, status, priority, count, last in rows:
+        entry = stats.setdefault(group, empty_stats())
+        entry['total'] += count
+        if status == 'pending':
+            entry['pending'] += count
+        if priority:
+            entry['priorities'][priority] = entry['priorities'].get(priority, 0) + count
+        if last and (entry['last_submission'] is None or last > entry['last_submission']):
+            entry['last_submission'] = last
+    return stats
+
+
+def submission_statuses():
+    """Distinct submission statuses, from the aggregate table"""
+    _table('submissions')
+    rows = _connect().execute("SELECT DISTINCT status FROM submission_stats WHERE status != '' ORDER BY status").fetchall()
+    return [row[0] for row in rows]
+
+
+def submission_stats():
+    """
+    Totals across every submission, read from the aggregate table
+
+    Returns:
+        dict: {'total', 'pending', 'priorities': {priority: count},
+               'last_submission': timestamp or None}
+    """
+    _table('submissions')
+    rows = _connect().execute(
+        "SELECT '', status, equity_priority, count, last_submission FROM submission_stats"
+    ).fetchall()
+    return _fold_stats(rows).get('', empty_stats())
+
+
+def campaign_submission_stats():
+    """
+    Submission stats per campaign, read from the aggregate table
+
+    Returns:
+        dict: {campaign_id: stats like submission_stats()}
+    """
+    _table('submissions')
+    rows = _connect().execute(
+        'SELECT campaign_id, status, equity_priority, count, last_submission FROM submission_stats'
+    ).fetchall()
+    return _fold_stats(rows)
+
+
+def segment_submission_stats():
+    """
+    Submission stats per segment, through each campaign's segment
+
+    Returns:
+        dict: {segment_id: stats like submission_stats()}
+    """
+    _table('submissions')
+    _table('campaigns')
+    rows = _connect().execute('''
+        SELECT c.segment, s.status, s.equity_priority, s.count, s.last_submission
+        FROM submission_stats s JOIN campaigns c ON c.id = s.campaign_id
+    ''').fetchall()
+    return _fold_stats(rows)
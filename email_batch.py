@@ -0,0 +1,279 @@
+"""
+Personalized campaign emails for every client in a past client segment
+The campaign email is rendered once and split on its merge tags into a
+format string; each recipient's document is then a single str.format call
+with values from their client data row. Chunks of recipients are rendered
+in worker processes and written in order to a zip (one .html file per
+recipient) or a JSONL file
+"""
+import os
+import re
+import json
+import html
+import time
+import zipfile
+import tempfile
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import datastore
+from html_generator import generate_email_html_content
+from segment_index import load_segment_data
+
+# Where finished batches are written
+EMAIL_BATCH_DIR = os.environ.get('EMAIL_BATCH_DIR', os.path.join(tempfile.gettempdir(), 'keyes-email-batches'))
+
+# Finished batches are deleted after this long
+EMAIL_BATCH_KEEP_SECONDS = int(os.environ.get('EMAIL_BATCH_KEEP_SECONDS', 24 * 3600))
+
+# Render processes per batch; 1 renders in the calling process
+EMAIL_RENDER_WORKERS = int(os.environ.get('EMAIL_RENDER_WORKERS', os.cpu_count() or 1))
+
+# Recipients per chunk handed to a render process
+EMAIL_RENDER_CHUNK = int(os.environ.get('EMAIL_RENDER_CHUNK', 2000))
+
+# HubSpot-style merge tags, e.g. {{contact.firstname}} or {{ contact.EQUITY }}
+MERGE_TAG = re.compile(r'\{\{\s*contact\.([A-Za-z0-9_]+)\s*\}\}')
+
+# Merge tag names (lower case) and the client data column that fills them;
+# any other tag is looked up as the upper-cased column name
+MERGE_FIELDS = {
+    'firstname': 'FIRSTNAME',
+    'lastname': 'LASTNAME',
+    'email': 'EMAIL1',
+    'phone': 'PHONE1',
+    'address': 'ADDRESS1',
+    'city': 'CITY',
+    'state': 'STATE',
+    'zip': 'ZIP',
+    'equity': 'EQUITY',
+    'home_value': 'CURRENT_AVM_VALUE'
+}
+
+# Columns shown as whole dollars
+MONEY_COLUMNS = {'EQUITY', 'CURRENT_AVM_VALUE', 'CURRENT_SALE_MTG_1_LOAN_AMOUNT'}
+
+# Columns every JSONL record carries, whether or not the email uses them
+RECIPIENT_COLUMNS = ('EMAIL1', 'FIRSTNAME', 'LASTNAME')
+
+OUTPUT_FORMATS = ('zip', 'jsonl')
+
+
+def compile_email_template(email_html):
+    """
+    Split rendered email HTML into static text and merge fields
+
+    Args:
+        email_html: Email HTML containing {{contact.*}} merge tags
+
+    Returns:
+        dict: {'template': str.format template with one positional field
+               per merge tag, 'columns': client data column for each field,
+               'tags': the merge tag text for each field}
+    """
+    template = []
+    columns = []
+    tags = []
+    position = 0
+    for match in MERGE_TAG.finditer(email_html):
+        template.append(email_html[position:match.start()].replace('{', '{{').replace('}', '}}'))
+        template.append('{%d}' % len(columns))
+        columns.append(MERGE_FIELDS.get(match.group(1).lower(), match.group(1).upper()))
+        tags.append(match.group(0))
+        position = match.end()
+    template.append(email_html[position:].replace('{', '{{').replace('}', '}}'))
+    return {'template': ''.join(template), 'columns': columns, 'tags': tags}
+
+
+def _column_values(df, column):
+    """Display strings for one column, HTML-escaped; missing values are blank"""
+    values = df[column]
+    if column in MONEY_COLUMNS:
+        values = pd.to_numeric(values, errors='coerce')
+        return ['' if pd.isna(v) else f'${v:,.0f}' for v in values]
+    if pd.api.types.is_float_dtype(values):
+        # Whole numbers read as floats (e.g. AGE) shouldn't render as 67.0
+        return ['' if pd.isna(v) else (f'{v:.0f}' if float(v).is_integer() else str(v)) for v in values]
+    return ['' if pd.isna(v) else html.escape(str(v)) for v in values]
+
+
+def _recipient_rows(df, compiled):
+    """
+    Per-recipient tuples: the merge values, then the RECIPIENT_COLUMNS
+
+    Tags for columns the client data doesn't have are kept as they are, so
+    a downstream tool can still fill them.
+    """
+    fields = list(zip(compiled['columns'], compiled['tags'])) + [(column, '') for column in RECIPIENT_COLUMNS]
+    values = {}
+    for column, tag in fields:
+        if (column, tag) not in values:
+            values[column, tag] = _column_values(df, column) if column in df.columns else [tag] * len(df)
+    return list(zip(*[values[field] for field in fields])) if len(df) else []
+
+
+def _file_name(index, email):
+    slug = re.sub(r'[^A-Za-z0-9@._-]+', '_', html.unescape(email))[:80] or 'recipient'
+    return f'{index:06d}_{slug}.html'
+
+
+def _render_chunk(template, fields, output_format, start, rows):
+    """
+    Render one chunk of recipients (runs in a render process)
+
+    Returns:
+        bytes for jsonl (the chunk's lines), or a list of (filename, bytes)
+        for zip
+    """
+    if output_format == 'jsonl':
+        lines = []
+        for offset, row in enumerate(rows):
+            email, first_name, last_name = (html.unescape(v) for v in row[fields:])
+            lines.append(json.dumps({
+                'index': start + offset,
+                'email': email,
+                'first_name': first_name,
+                'last_name': last_name,
+                'html': template.format(*row[:fields])
+            }))
+        return ('\n'.join(lines) + '\n').encode('utf-8') if lines else b''
+
+    return [(_file_name(start + offset, row[fields]), template.format(*row[:fields]).encode('utf-8'))
+            for offset, row in enumerate(rows)]
+
+
+def _rendered_chunks(compiled, output_format, rows, workers):
+    """Rendered chunks in order, keeping at most a few chunks in flight per worker"""
+    args = [(compiled['template'], len(compiled['columns']), output_format, start, rows[start:start + EMAIL_RENDER_CHUNK])
+            for start in range(0, len(rows), EMAIL_RENDER_CHUNK)]
+    if workers <= 1 or len(args) <= 1:
+        for chunk_args in args:
+            yield _render_chunk(*chunk_args)
+        return
+
+    # spawn: render processes never inherit sockets or SQLite handles
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        pending = deque()
+        for chunk_args in args:
+            pending.append(pool.submit(_render_chunk, *chunk_args))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def render_personalized_emails(campaign, df, output_path, output_format='zip', progress=None, workers=None):
+    """
+    Write one personalized email per row of client data
+
+    Args:
+        campaign: Campaign dict
+        df: Client data rows to address (prepared frame)
+        output_path: File to write
+        output_format: 'zip' or 'jsonl'
+        progress: Optional callback(done, total) after each chunk
+        workers: Render processes (default EMAIL_RENDER_WORKERS)
+
+    Returns:
+        int: Number of emails written
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f'Unknown output format: {output_format}')
+
+    compiled = compile_email_template(generate_email_html_content(campaign))
+    rows = _recipient_rows(df, compiled)
+    chunks = _rendered_chunks(compiled, output_format, rows,
+                              EMAIL_RENDER_WORKERS if workers is None else workers)
+
+    done = 0
+    partial_path = output_path + '.partial'
+    try:
+        if output_format == 'jsonl':
+            with open(partial_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    done = min(done + EMAIL_RENDER_CHUNK, len(rows))
+                    if progress:
+                        progress(done, len(rows))
+        else:
+            with zipfile.ZipFile(partial_path, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+                for chunk in chunks:
+                    for name, body in chunk:
+                        archive.writestr(name, body)
+                    done += len(chunk)
+                    if progress:
+                        progress(done, len(rows))
+        os.replace(partial_path, output_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+    return len(rows)
+
+
+def _prune_batches():
+    """Delete batches older than EMAIL_BATCH_KEEP_SECONDS"""
+    cutoff = time.time() - EMAIL_BATCH_KEEP_SECONDS
+    for name in os.listdir(EMAIL_BATCH_DIR):
+        path = os.path.join(EMAIL_BATCH_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def personalized_emails_job(payload, report):
+    """
+    Render a campaign for every client in a past client segment
+
+    Args:
+        payload: {'campaign_id', 'segment_id', 'selected_files': [keys],
+                  'format': 'zip' or 'jsonl'}
+        report: Progress callback from the job runner
+
+    Returns:
+        dict: {'campaign_id', 'count', 'path', 'filename', 'message'}
+    """
+    campaign = datastore.get_item('campaigns', payload['campaign_id'])
+    if campaign is None:
+        raise ValueError('Campaign not found')
+    segment = datastore.get_item('past_clients', payload['segment_id'])
+    if segment is None:
+        raise ValueError('Segment not found')
+    formula = segment.get('formula', '')
+    output_format = payload.get('format', 'zip')
+
+    def loading(done, total):
+        report(done / total * 0.3, f'Loading files ({done}/{total} files)')
+
+    df, masks = load_segment_data(payload['selected_files'], [formula] if formula else [], progress=loading)
+    if df is None:
+        raise ValueError('Could not load any of the selected files')
+    if formula:
+        mask = masks.get(formula)
+        if mask is None:
+            raise ValueError(f'Formula could not be evaluated: {formula}')
+        df = df[mask]
+
+    def rendering(done, total):
+        report(0.3 + done / total * 0.7, f'Rendering emails ({done}/{total})')
+
+    os.makedirs(EMAIL_BATCH_DIR, exist_ok=True)
+    _prune_batches()
+    started = time.time()
+    path = os.path.join(EMAIL_BATCH_DIR, f"{campaign['id']}_{segment['id']}_{int(started)}.{output_format}")
+    count = render_personalized_emails(campaign, df, path, output_format, progress=rendering)
+    print(f"[EMAIL BATCH] {count} emails for {campaign['id']} / {segment['id']} in {time.time() - started:.1f}s")
+
+    return {
+        'campaign_id': campaign['id'],
+        'count': count,
+        'path': path,
+        'filename': f"{campaign['id']}_{segment['id']}.{output_format}",
+        'message': f'{count} personalized emails rendered for "{segment["name"]}"'
+    }
@@ -0,0 +1,122 @@
+"""
+In-memory cache of rendered campaign emails
+Preview, generate-email and download build the full email HTML from the
+campaign's form_config. Each worker keeps the latest render per campaign,
+keyed by a hash of the campaign record, together with compressed variants,
+so repeat requests are answered from memory or with a 304
+"""
+import os
+import gzip
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import request, make_response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Renders kept per worker before the least recently used is dropped
+EMAIL_CACHE_ENTRIES = int(os.environ.get('EMAIL_CACHE_ENTRIES', 128))
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = 1024
+
+_renders = OrderedDict()
+_lock = threading.Lock()
+
+
+def campaign_version(campaign):
+    """Hash of a campaign record; changes whenever any field of it does"""
+    content = json.dumps(campaign, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha1(content).hexdigest()
+
+
+def _compress(body):
+    if len(body) < MIN_COMPRESS_BYTES:
+        return None, None
+    return gzip.compress(body, compresslevel=6), brotli.compress(body) if brotli else None
+
+
+def rendered_email(kind, campaign, render):
+    """
+    Rendered HTML for a campaign, built once per version of the campaign
+
+    Args:
+        kind: Which rendering this is ('preview', 'email', 'download')
+        campaign: Campaign dict
+        render: Function taking the campaign and returning its HTML
+
+    Returns:
+        dict: {'etag', 'body': bytes, 'gzip': bytes or None, 'br': bytes or None}
+    """
+    key = (kind, campaign['id'])
+    version = campaign_version(campaign)
+    with _lock:
+        entry = _renders.get(key)
+        if entry and entry['version'] == version:
+            _renders.move_to_end(key)
+            return entry
+
+    body = render(campaign).encode('utf-8')
+    gzipped, brotlied = _compress(body)
+    entry = {'version': version, 'etag': f'{kind}-{version}', 'body': body, 'gzip': gzipped, 'br': brotlied}
+
+    with _lock:
+        _renders[key] = entry
+        _renders.move_to_end(key)
+        while len(_renders) > EMAIL_CACHE_ENTRIES:
+            _renders.popitem(last=False)
+    return entry
+
+
+def invalidate_campaign(campaign_id):
+    """Drop this worker's renders of a campaign"""
+    with _lock:
+        for key in [key for key in _renders if key[1] == campaign_id]:
+            del _renders[key]
+
+
+def clear():
+    """Drop all of this worker's renders"""
+    with _lock:
+        _renders.clear()
+
+
+def email_response(entry, download_name=None):
+    """
+    Response for a cached render, honouring If-None-Match and Accept-Encoding
+
+    Args:
+        entry: Result of rendered_email
+        download_name: Send as an attachment with this filename
+
+    Returns:
+        Response: 200 with the (possibly compressed) HTML, or 304
+    """
+    encoding = None
+    if entry['br'] and request.accept_encodings['br']:
+        encoding = 'br'
+    elif entry['gzip'] and request.accept_encodings['gzip']:
+        encoding = 'gzip'
+    # Each encoding is a different representation, so it gets its own tag
+    etag = f"{entry['etag']}-{encoding}" if encoding else entry['etag']
+
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(entry[encoding] if encoding else entry['body'])
+        response.headers['Content-Type'] = 'text/html; charset=utf-8'
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if download_name:
+            response.headers['Content-Disposition'] = f'attachment; filename={download_name}'
+
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Browsers keep the copy but check back, so edits show up immediately
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,184 @@
+"""
+Local stand-in for the OpenAI chat completions API
+Answers POST /v1/chat/completions with a canned campaign after a chosen
+latency (spread over the chunks when the request asks to stream), and can
+inject rate limits and server errors, so generation, retries, streaming and
+throughput can be exercised without an API key or network.
+
+    python fake_openai.py --port 8765 --latency 2 --rate-limit 0.2
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake python app.py
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CANNED_CAMPAIGN = {
+    'campaign_name': 'Spring Equity Check-In',
+    'subject_line': '{{contact.firstname}}, your home gained more than you think',
+    'preview_text': 'A two-minute look at your equity',
+    'headline': 'Your Home Has Been Working For You',
+    'subheadline': 'See what your equity could do next',
+    'body_copy': 'You bought at the right time.\n\nPrices in your neighborhood have moved, and so has your equity. '
+                 'We can show you exactly where you stand in one short call.',
+    'cta_button_text': 'GET MY EQUITY PLAN',
+    'cta_agent_message': 'A Keyes advisor will reach out within one business day.',
+    'cta_tagline': 'No pressure. Just numbers.',
+    'callout_box': {'title': 'Average equity', 'main_text': '$412K', 'subtitle': 'for owners of 10+ years'},
+    'form_questions': [
+        {'question': 'How important is reaching the high end of your equity?', 'subtitle': '', 'type': 'radio',
+         'options': [{'label': 'Very important', 'description': 'I want every dollar'},
+                     {'label': 'Speed matters more', 'description': 'I need to move quickly'},
+                     {'label': 'Both', 'description': 'Best price in a reasonable time'},
+                     {'label': 'Just curious', 'description': 'No plans yet'}]},
+        {'question': "What's your next move?", 'subtitle': '(Select all that apply)', 'type': 'checkbox',
+         'options': [{'label': 'Downsize'}, {'label': 'Upgrade'}, {'label': 'Relocate'}, {'label': 'Invest'}]},
+        {'question': 'Would you like us to:', 'subtitle': '', 'type': 'radio',
+         'options': [{'label': 'Send me a detailed equity report'}, {'label': 'Have a Keyes expert contact me'},
+                     {'label': 'Both'}, {'label': 'Neither for now'}]}
+    ],
+    'testimonial': 'They priced it right and we closed in three weeks.',
+    'explanation': 'Canned response from fake_openai.py.'
+}
+
+# Characters of content per streamed chunk (roughly a few tokens)
+STREAM_CHUNK_CHARS = 16
+
+
+class FakeOpenAI:
+    """Behaviour and counters shared by the request handlers"""
+
+    def __init__(self, latency=0.5, jitter=0.0, rate_limit=0.0, error_rate=0.0, retry_after=1.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, 'ok': 0, '429': 0, '500': 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+
+def _make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body, headers=None):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_stream(self, request, content):
+            """Server-sent chunks of content, evenly spaced over the latency"""
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            pieces = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+            chunk_id = f'chatcmpl-fake-{fake.counts["requests"]}'
+            for piece in pieces:
+                time.sleep(fake.latency / len(pieces))
+                self.wfile.write(b'data: ' + json.dumps({
+                    'id': chunk_id,
+                    'object': 'chat.completion.chunk',
+                    'model': request.get('model', 'fake'),
+                    'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]
+                }).encode('utf-8') + b'\n\n')
+                self.wfile.flush()
+            if (request.get('stream_options') or {}).get('include_usage'):
+                self.wfile.write(b'data: ' + json.dumps({
+                    'id': chunk_id, 'object': 'chat.completion.chunk', 'choices': [],
+                    'usage': {'prompt_tokens': 0, 'completion_tokens': len(content) // 4,
+                              'total_tokens': len(content) // 4}
+                }).encode('utf-8') + b'\n\n')
+            self.wfile.write(b'data: [DONE]\n\n')
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            fake.count('requests')
+            if not self.path.endswith('/chat/completions'):
+                self._send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+                return
+
+            roll = random.random()
+            if roll < fake.rate_limit:
+                fake.count('429')
+                self._send_json(429, {'error': {'message': 'Rate limit reached', 'type': 'requests'}},
+                                {'Retry-After': f'{fake.retry_after:g}'})
+                return
+            if roll < fake.rate_limit + fake.error_rate:
+                time.sleep(max(fake.latency + random.uniform(-fake.jitter, fake.jitter), 0))
+                fake.count('500')
+                self._send_json(500, {'error': {'message': 'The server had an error', 'type': 'server_error'}})
+                return
+
+            fake.count('ok')
+            content = json.dumps(CANNED_CAMPAIGN, indent=2)
+            if request.get('stream'):
+                self._send_stream(request, content)
+                return
+            time.sleep(max(fake.latency + random.uniform(-fake.jitter, fake.jitter), 0))
+            self._send_json(200, {
+                'id': f'chatcmpl-fake-{fake.counts["requests"]}',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': request.get('model', 'fake'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': len(content) // 4, 'total_tokens': len(content) // 4}
+            })
+
+    return Handler
+
+
+def serve(port=8765, **behaviour):
+    """
+    Start the fake API on a background thread
+
+    Args:
+        port: Port on 127.0.0.1 (0 picks a free one)
+        **behaviour: latency, jitter, rate_limit, error_rate, retry_after
+
+    Returns:
+        tuple: (server, FakeOpenAI); base URL is
+               f'http://127.0.0.1:{server.server_port}/v1', stop with server.shutdown()
+    """
+    fake = FakeOpenAI(**behaviour)
+    server = ThreadingHTTPServer(('127.0.0.1', port), _make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, fake
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake OpenAI chat completions server')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help='seconds per completion')
+    parser.add_argument('--jitter', type=float, default=0.0, help='+/- seconds added to latency')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='fraction of requests answered 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered 500')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After sent with 429s')
+    args = parser.parse_args()
+
+    server, fake = serve(args.port, latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit,
+                         error_rate=args.error_rate, retry_after=args.retry_after)
+    print(f'Fake OpenAI listening on http://127.0.0.1:{server.server_port}/v1')
+    try:
+        while True:
+            time.sleep(10)
+            print(f'[FAKE OPENAI] {fake.counts}')
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,177 @@
+"""
+Local catalog of client data files stored in DigitalOcean Spaces
+Listing pages page through this SQLite table instead of listing the bucket
+on every render. Uploads and deletes update it incrementally; a full
+paginated listing reconciles it every CATALOG_SYNC_SECONDS.
+"""
+import os
+import json
+import time
+import sqlite3
+from datetime import datetime
+
+from storage import scan_files_in_spaces, get_file_metadata
+
+FILE_CATALOG_DB = os.environ.get('FILE_CATALOG_DB', 'file_catalog.db')
+
+# How stale the catalog may get before the bucket is re-listed
+CATALOG_SYNC_SECONDS = int(os.environ.get('CATALOG_SYNC_SECONDS', 300))
+
+
+def _connect():
+    """Open the catalog database (created on first use)"""
+    conn = sqlite3.connect(FILE_CATALOG_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS files (
+            key TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            etag TEXT,
+            last_modified TEXT NOT NULL,
+            row_count INTEGER,
+            columns TEXT,
+            column_stats TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_files_last_modified ON files (last_modified)')
+    conn.execute('CREATE TABLE IF NOT EXISTS catalog_sync (prefix TEXT PRIMARY KEY, synced_at REAL NOT NULL)')
+    return conn
+
+
+def _upsert(conn, key, size, etag, last_modified):
+    """Insert or refresh a file row; row stats are kept only while the ETag is unchanged"""
+    conn.execute('''
+        INSERT INTO files (key, filename, size, etag, last_modified) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(key) DO UPDATE SET
+            size = excluded.size,
+            last_modified = excluded.last_modified,
+            row_count = CASE WHEN files.etag = excluded.etag THEN files.row_count END,
+            columns = CASE WHEN files.etag = excluded.etag THEN files.columns END,
+            column_stats = CASE WHEN files.etag = excluded.etag THEN files.column_stats END,
+            etag = excluded.etag
+    ''', (key, key.split('/')[-1], size, etag, last_modified.isoformat()))
+
+
+def _row_to_file(row):
+    return {
+        'key': row['key'],
+        'size': row['size'],
+        'last_modified': datetime.fromisoformat(row['last_modified']),
+        'filename': row['filename'],
+        'etag': row['etag'],
+        'rows': row['row_count'],
+        'columns': json.loads(row['columns']) if row['columns'] else None,
+        'column_stats': json.loads(row['column_stats']) if row['column_stats'] else None
+    }
+
+
+def sync_catalog(prefix='client-data/', force=False):
+    """
+    Reconcile the catalog with a full (paginated) bucket listing
+
+    Args:
+        prefix: Folder prefix to sync
+        force: Re-list even if the last sync is recent
+    """
+    with _connect() as conn:
+        row = conn.execute('SELECT synced_at FROM catalog_sync WHERE prefix = ?', (prefix,)).fetchone()
+    if not force and row and time.time() - row['synced_at'] < CATALOG_SYNC_SECONDS:
+        return
+
+    result = scan_files_in_spaces(prefix)
+    if not result['success']:
+        # Keep serving the catalog as it is rather than emptying it
+        print(f"[CATALOG] {result['message']}")
+        return
+    files = result['files']
+
+    end = prefix + '\uffff'
+    with _connect() as conn:
+        for f in files:
+            _upsert(conn, f['key'], f['size'], f['etag'], f['last_modified'])
+        listed = {f['key'] for f in files}
+        stored = [r['key'] for r in conn.execute('SELECT key FROM files WHERE key >= ? AND key < ?', (prefix, end))]
+        conn.executemany('DELETE FROM files WHERE key = ?', [(key,) for key in stored if key not in listed])
+        conn.execute('INSERT OR REPLACE INTO catalog_sync (prefix, synced_at) VALUES (?, ?)', (prefix, time.time()))
+
+
+def list_catalog_files(prefix='client-data/', offset=0, limit=None):
+    """
+    Page through cataloged files, newest first
+
+    Args:
+        prefix: Folder prefix to filter files
+        offset: Number of files to skip
+        limit: Page size (None for all)
+
+    Returns:
+        dict: {'files': list like list_files_in_spaces plus etag/rows/columns,
+               'total': int}
+    """
+    sync_catalog(prefix)
+
+    end = prefix + '\uffff'
+    with _connect() as conn:
+        total = conn.execute('SELECT COUNT(*) FROM files WHERE key >= ? AND key < ?', (prefix, end)).fetchone()[0]
+        rows = conn.execute(
+            'SELECT * FROM files WHERE key >= ? AND key < ? ORDER BY last_modified DESC, key DESC LIMIT ? OFFSET ?',
+            (prefix, end, -1 if limit is None else limit, offset)
+        ).fetchall()
+
+    return {'files': [_row_to_file(row) for row in rows], 'total': total}
+
+
+def get_catalog_file(key):
+    """Catalog entry for one key, or None"""
+    with _connect() as conn:
+        row = conn.execute('SELECT * FROM files WHERE key = ?', (key,)).fetchone()
+    return _row_to_file(row) if row else None
+
+
+def catalog_add(key):
+    """
+    Record a file that was just uploaded
+
+    Args:
+        key: File key in Spaces
+
+    Returns:
+        bool: True if the file was cataloged
+    """
+    meta = get_file_metadata(key)
+    if not meta['success']:
+        print(f"[CATALOG] {meta['message']}")
+        return False
+    with _connect() as conn:
+        _upsert(conn, key, meta['size'], meta['etag'], meta['last_modified'])
+    return True
+
+
+def catalog_remove(key):
+    """Forget a file that was deleted"""
+    with _connect() as conn:
+        conn.execute('DELETE FROM files WHERE key = ?', (key,))
+
+
+def record_file_schema(key, etag, rows, columns, column_stats=None):
+    """
+    Attach parsed row count and column schema to a cataloged file
+
+    Ignored if the file isn't cataloged or has since changed (ETag differs).
+
+    Args:
+        key: File key in Spaces
+        etag: ETag of the version that was parsed
+        rows: Number of data rows
+        columns: List of {'name', 'type'} dicts
+        column_stats: Optional {column: {count, nulls, min, max, mean}}
+    """
+    with _connect() as conn:
+        if column_stats is None:
+            conn.execute('UPDATE files SET row_count = ?, columns = ? WHERE key = ? AND etag = ?',
+                         (rows, json.dumps(columns), key, etag))
+        else:
+            conn.execute('UPDATE files SET row_count = ?, columns = ?, column_stats = ? WHERE key = ? AND etag = ?',
+                         (rows, json.dumps(columns), json.dumps(column_stats), key, etag))
@@ -1,9 +1,13 @@
 """
 Formula evaluator for past client segments
-Converts human-readable formulas to pandas queries
+Converts human-readable formulas to pandas queries, and compiles them into
+cached expression trees that evaluate straight to boolean masks
 """
-import pandas as pd
+import operator
 import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
 
 # Column name mapping from formula syntax to actual CSV columns
 COLUMN_MAPPING = {
@@ -21,6 +25,7 @@ COLUMN_MAPPING = {
     'MedianHomePrice': 'MEDIAN_HOME_PRICE'
 }
 
+@lru_cache(maxsize=512)
 def parse_formula(formula_str):
     """
     Convert human-readable formula to pandas-compatible query
@@ -69,6 +74,425 @@ def parse_formula(formula_str):
     
     return query
 
+class FormulaSyntaxError(ValueError):
+    """Raised when a formula cannot be compiled"""
+
+
+# Token pattern: numbers, quoted strings, identifiers, operators, parentheses
+_TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        (?P<number>\d+\.\d*|\.\d+|\d+)
+      | (?P<string>'[^']*'|"[^"]*")
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<op>==|!=|>=|<=|≠|≥|≤|[=<>()+\-*/&|~,\[\]])
+    )""", re.VERBOSE)
+
+_KEYWORDS = {'and', 'or', 'not', 'between', 'in', 'true', 'false'}
+
+_COMPARISONS = {
+    '==': operator.eq, '=': operator.eq,
+    '!=': operator.ne, '≠': operator.ne,
+    '>=': operator.ge, '≥': operator.ge,
+    '<=': operator.le, '≤': operator.le,
+    '>': operator.gt,
+    '<': operator.lt
+}
+
+_ARITHMETIC = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv
+}
+
+
+def _tokenize(formula_str):
+    """Split a formula into (kind, value) tokens"""
+    tokens = []
+    pos = 0
+    text = formula_str.strip()
+    while pos < len(text):
+        match = _TOKEN_PATTERN.match(text, pos)
+        if not match or match.end() == pos:
+            raise FormulaSyntaxError(f"Unexpected character {text[pos:].strip()[:1]!r} at position {pos}")
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'name' and value.lower() in _KEYWORDS:
+            kind, value = 'keyword', value.lower()
+        tokens.append((kind, value))
+    return tokens
+
+
+def _canonical(terms):
+    """Order and/or operands so 'A and B' and 'B and A' share one tree"""
+    return tuple(sorted(terms, key=repr))
+
+
+class _Parser:
+    """
+    Recursive-descent parser producing a tuple expression tree
+
+    Precedence follows pandas.query: or/| < and/& < not/~ < comparison
+    < +,- < *,/ < unary minus. Nodes are plain tuples so identical
+    sub-expressions compare (and hash) equal.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def accept(self, *values):
+        kind, value = self.peek()
+        if kind in ('op', 'keyword') and value in values:
+            self.pos += 1
+            return value
+        return None
+
+    def expect(self, value):
+        if not self.accept(value):
+            raise FormulaSyntaxError(f"Expected {value!r} but found {self.peek()[1]!r}")
+
+    def parse(self):
+        if not self.tokens:
+            raise FormulaSyntaxError('Formula cannot be empty')
+        node = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise FormulaSyntaxError(f"Unexpected {self.peek()[1]!r}")
+        return node
+
+    def parse_or(self):
+        terms = [self.parse_and()]
+        while self.accept('or', '|'):
+            terms.append(self.parse_and())
+        return terms[0] if len(terms) == 1 else ('or',) + _canonical(terms)
+
+    def parse_and(self):
+        terms = [self.parse_not()]
+        while self.accept('and', '&'):
+            terms.append(self.parse_not())
+        return terms[0] if len(terms) == 1 else ('and',) + _canonical(terms)
+
+    def parse_not(self):
+        if self.accept('not', '~'):
+            return ('not', self.parse_not())
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        left = self.parse_sum()
+
+        if self.accept('between'):
+            low = self.parse_sum()
+            self.expect('and')
+            high = self.parse_sum()
+            return ('and', ('cmp', '>=', left, low), ('cmp', '<=', left, high))
+
+        negate = bool(self.accept('not'))
+        if self.accept('in'):
+            return ('in', left, self.parse_list(), negate)
+        if negate:
+            raise FormulaSyntaxError("Expected 'in' after 'not'")
+
+        # Chained comparisons (a < b < c) expand to (a < b) and (b < c)
+        terms = []
+        while True:
+            op = self.accept(*_COMPARISONS)
+            if not op:
+                break
+            right = self.parse_sum()
+            terms.append(('cmp', '==' if op == '=' else op, left, right))
+            left = right
+        if not terms:
+            return left
+        return terms[0] if len(terms) == 1 else ('and',) + tuple(terms)
+
+    def parse_list(self):
+        self.expect('[')
+        values = []
+        if not self.accept(']'):
+            while True:
+                node = self.parse_atom()
+                if node[0] != 'const':
+                    raise FormulaSyntaxError("'in' lists may only contain literals")
+                values.append(node[1])
+                if self.accept(']'):
+                    break
+                self.expect(',')
+        return tuple(values)
+
+    def parse_sum(self):
+        node = self.parse_product()
+        while True:
+            op = self.accept('+', '-')
+            if not op:
+                return node
+            node = ('arith', op, node, self.parse_product())
+
+    def parse_product(self):
+        node = self.parse_unary()
+        while True:
+            op = self.accept('*', '/')
+            if not op:
+                return node
+            node = ('arith', op, node, self.parse_unary())
+
+    def parse_unary(self):
+        if self.accept('-'):
+            node = self.parse_unary()
+            if node[0] == 'const':
+                return ('const', -node[1])
+            return ('neg', node)
+        return self.parse_atom()
+
+    def parse_atom(self):
+        if self.accept('('):
+            node = self.parse_or()
+            self.expect(')')
+            return node
+
+        kind, value = self.peek()
+        if kind is None:
+            raise FormulaSyntaxError('Unexpected end of formula')
+        self.pos += 1
+
+        if kind == 'number':
+            return ('const', float(value) if '.' in value else int(value))
+        if kind == 'string':
+            return ('const', value[1:-1])
+        if kind == 'keyword' and value in ('true', 'false'):
+            return ('const', value == 'true')
+        if kind == 'name':
+            return ('col', COLUMN_MAPPING.get(value, value))
+        raise FormulaSyntaxError(f"Unexpected {value!r}")
+
+
+@lru_cache(maxsize=512)
+def compile_formula(formula_str):
+    """
+    Compile a human-readable formula into a cached expression tree
+
+    Args:
+        formula_str: Human-readable formula string
+
+    Returns:
+        tuple: Expression tree understood by formula_mask
+
+    Raises:
+        FormulaSyntaxError: If the formula cannot be parsed
+    """
+    return _Parser(_tokenize(formula_str)).parse()
+
+
+def formula_columns(formulas):
+    """
+    Columns referenced by formulas (ones that fail to compile are skipped)
+
+    Args:
+        formulas: Iterable of human-readable formula strings
+
+    Returns:
+        set: Column names
+    """
+    columns = set()
+
+    def walk(node):
+        if node[0] == 'col':
+            columns.add(node[1])
+        for child in node[1:]:
+            if isinstance(child, tuple) and child and isinstance(child[0], str):
+                walk(child)
+
+    for formula_str in formulas:
+        try:
+            walk(compile_formula(formula_str))
+        except FormulaSyntaxError:
+            pass
+    return columns
+
+
+def _column(df, name):
+    """Numeric columns as raw arrays, everything else as a Series"""
+    if name not in df.columns:
+        raise KeyError(f"name '{name}' is not defined")
+    series = df[name]
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        return series.to_numpy()
+    return series
+
+
+def _is_number(value):
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+
+
+def _is_text(value):
+    """True for a text column (categorical or object Series)"""
+    return (isinstance(value, pd.Series) and not pd.api.types.is_numeric_dtype(value.dtype)
+            and not pd.api.types.is_bool_dtype(value.dtype))
+
+
+def _as_numbers(series):
+    """
+    A text column read as numbers, for comparing it with a numeric literal
+
+    ZIP is stored as text, so ZIP = 33065 compares the ZIP values as
+    numbers; text that isn't a number never matches.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = pd.to_numeric(pd.Series(series.cat.categories, dtype=object), errors='coerce')
+        return np.append(categories.to_numpy(dtype=np.float64), np.nan)[series.cat.codes.to_numpy()]
+    return pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64)
+
+
+def _decoded(value):
+    """Categorical Series as plain values, for comparisons other than (in)equality"""
+    if isinstance(value, pd.Series) and isinstance(value.dtype, pd.CategoricalDtype):
+        return value.astype(object)
+    return value
+
+
+def _as_mask(value, length):
+    """Normalize a comparison result to a 1-D bool array"""
+    if np.ndim(value) == 0:
+        return np.full(length, bool(value))
+    return np.asarray(value, dtype=bool)
+
+
+def _evaluate(node, df, memo):
+    """Evaluate an expression tree node, reusing results stored in memo"""
+    if memo is not None and node in memo:
+        return memo[node]
+
+    kind = node[0]
+    if kind == 'const':
+        return node[1]
+    if kind == 'col':
+        result = _column(df, node[1])
+    elif kind == 'cmp':
+        left = _evaluate(node[2], df, memo)
+        right = _evaluate(node[3], df, memo)
+        if _is_text(left) and _is_number(right):
+            left = _as_numbers(left)
+        if _is_number(left) and _is_text(right):
+            right = _as_numbers(right)
+        # String literals need pandas comparison semantics
+        if isinstance(right, str) and isinstance(left, np.ndarray):
+            left = pd.Series(left)
+        if isinstance(left, str) and isinstance(right, np.ndarray):
+            right = pd.Series(right)
+        if node[1] not in ('==', '!='):
+            # Unordered categoricals (cached text columns) only support equality
+            left, right = _decoded(left), _decoded(right)
+        result = _as_mask(_COMPARISONS[node[1]](left, right), len(df))
+    elif kind == 'and':
+        result = _evaluate_bool(node[1], df, memo).copy()
+        for term in node[2:]:
+            result &= _evaluate_bool(term, df, memo)
+    elif kind == 'or':
+        result = _evaluate_bool(node[1], df, memo).copy()
+        for term in node[2:]:
+            result |= _evaluate_bool(term, df, memo)
+    elif kind == 'not':
+        result = ~_evaluate_bool(node[1], df, memo)
+    elif kind == 'in':
+        values = _evaluate(node[1], df, memo)
+        if _is_text(values) and node[2] and all(_is_number(value) for value in node[2]):
+            values = _as_numbers(values)
+        result = pd.Series(values).isin(node[2]).to_numpy()
+        if node[3]:
+            result = ~result
+    elif kind == 'arith':
+        left = _evaluate(node[2], df, memo)
+        right = _evaluate(node[3], df, memo)
+        result = _ARITHMETIC[node[1]](left, right)
+    elif kind == 'neg':
+        result = -_evaluate(node[1], df, memo)
+    else:
+        raise FormulaSyntaxError(f"Unknown expression node {kind!r}")
+
+    if memo is not None:
+        memo[node] = result
+    return result
+
+
+def _evaluate_bool(node, df, memo):
+    """Evaluate a node that must produce a boolean mask"""
+    value = _evaluate(node, df, memo)
+    if np.ndim(value) == 0:
+        if not isinstance(value, (bool, np.bool_)):
+            raise ValueError('Boolean expression expected')
+        return np.full(len(df), bool(value))
+    value = np.asarray(value)
+    if value.dtype != bool:
+        raise ValueError('Boolean expression expected')
+    return value
+
+
+def formula_mask(df, formula_str):
+    """
+    Evaluate a formula against a dataframe as a boolean row mask
+
+    Args:
+        df: Pandas DataFrame with client data
+        formula_str: Human-readable formula string
+
+    Returns:
+        numpy.ndarray: Boolean mask, one entry per row
+
+    Raises:
+        FormulaSyntaxError, KeyError, TypeError, ValueError on bad formulas
+    """
+    return _evaluate_bool(compile_formula(formula_str), df, None)
+
+
+def formula_masks(df, formulas):
+    """
+    Evaluate many formulas in one pass, computing shared predicates once
+
+    Every comparison (e.g. Age >= 65) and sub-expression is evaluated a
+    single time across all formulas, so N segments cost roughly one scan
+    per distinct predicate instead of N full evaluations.
+
+    Args:
+        df: Pandas DataFrame with client data
+        formulas: Iterable of human-readable formula strings
+
+    Returns:
+        dict: formula -> boolean mask (None if the formula failed).
+              Masks may be shared between formulas; do not modify them.
+    """
+    memo = {}
+    masks = {}
+    for formula_str in formulas:
+        if formula_str in masks:
+            continue
+        try:
+            masks[formula_str] = _evaluate_bool(compile_formula(formula_str), df, memo)
+        except Exception as e:
+            print(f"Error evaluating formula '{formula_str}': {str(e)}")
+            masks[formula_str] = None
+    return masks
+
+
+def evaluate_formulas(df, formulas):
+    """
+    Count matching rows for many formulas in one shared pass
+
+    Args:
+        df: Pandas DataFrame with client data
+        formulas: Iterable of human-readable formula strings
+
+    Returns:
+        dict: formula -> count of matching rows (0 if the formula failed)
+    """
+    return {
+        formula_str: int(mask.sum()) if mask is not None else 0
+        for formula_str, mask in formula_masks(df, formulas).items()
+    }
+
+
 def evaluate_formula(df, formula_str):
     """
     Evaluate a formula against a dataframe and return matching count
@@ -81,16 +505,10 @@ def evaluate_formula(df, formula_str):
         int: Count of rows matching the formula
     """
     try:
-        # Parse formula to pandas query
-        query = parse_formula(formula_str)
-        
-        # Evaluate query
-        result = df.query(query)
-        return len(result)
+        return int(formula_mask(df, formula_str).sum())
     
     except Exception as e:
         print(f"Error evaluating formula '{formula_str}': {str(e)}")
-        print(f"Parsed query: {query}")
         return 0
 
 def validate_formula(formula_str):
@@ -103,38 +521,29 @@ def validate_formula(formula_str):
     Returns:
         dict: {'valid': bool, 'message': str, 'parsed': str}
     """
-    try:
-        # Try to parse the formula
-        parsed = parse_formula(formula_str)
-        
-        # Check for common issues
-        if not parsed.strip():
-            return {
-                'valid': False,
-                'message': 'Formula cannot be empty',
-                'parsed': ''
-            }
-        
-        # Check for balanced parentheses
-        if parsed.count('(') != parsed.count(')'):
-            return {
-                'valid': False,
-                'message': 'Unbalanced parentheses',
-                'parsed': parsed
-            }
-        
+    parsed = parse_formula(formula_str)
+    if not parsed.strip():
         return {
-            'valid': True,
-            'message': 'Formula is valid',
-            'parsed': parsed
+            'valid': False,
+            'message': 'Formula cannot be empty',
+            'parsed': ''
         }
     
-    except Exception as e:
+    # Same compiler the segment counts use, so a formula that passes here can be evaluated
+    try:
+        compile_formula(formula_str)
+    except FormulaSyntaxError as e:
         return {
             'valid': False,
             'message': f'Syntax error: {str(e)}',
-            'parsed': ''
+            'parsed': parsed
         }
+    
+    return {
+        'valid': True,
+        'message': 'Formula is valid',
+        'parsed': parsed
+    }
 
 def get_available_fields():
     """
@@ -0,0 +1,149 @@
+"""
+Persistent cache of AI campaign generations
+Results are stored in SQLite under a hash of the full model request, so an
+unchanged profile, prompt, model and temperature is answered from disk.
+Identical requests that arrive while one is already running (in any worker)
+wait for that call instead of making their own
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import sqlite3
+
+GENERATION_CACHE_DB = os.environ.get('GENERATION_CACHE_DB', 'generation_cache.db')
+
+# How long a generation is reused
+GENERATION_CACHE_TTL = int(os.environ.get('GENERATION_CACHE_TTL', 7 * 24 * 3600))
+
+# A running call not finished after this long is assumed dead and taken over
+GENERATION_LEASE_SECONDS = int(os.environ.get('GENERATION_LEASE_SECONDS', 180))
+
+# How often waiting requests check for the shared result
+GENERATION_POLL_SECONDS = 0.25
+
+
+def _connect():
+    """Open the cache database (created on first use)"""
+    conn = sqlite3.connect(GENERATION_CACHE_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS generations (
+            key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+    # Failed calls are only kept to hand the error to requests that waited on them
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS failures (
+            key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS inflight (
+            key TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            started_at REAL NOT NULL
+        )
+    ''')
+    return conn
+
+
+def request_key(request):
+    """Hash of a model request (model, messages, temperature, ...)"""
+    content = json.dumps(request, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _lookup(conn, table, key, since):
+    row = conn.execute(f'SELECT result FROM {table} WHERE key = ? AND created_at >= ?', (key, since)).fetchone()
+    return json.loads(row['result']) if row else None
+
+
+def _claim(conn, key, owner):
+    """Become the one caller making this request; False if someone else is"""
+    now = time.time()
+    return conn.execute('''
+        INSERT INTO inflight (key, owner, started_at) VALUES (?, ?, ?)
+        ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, started_at = excluded.started_at
+        WHERE inflight.started_at < ?
+    ''', (key, owner, now, now - GENERATION_LEASE_SECONDS)).rowcount == 1
+
+
+def _finish(key, owner, result):
+    """Store the outcome and release the claim"""
+    now = time.time()
+    with _connect() as conn:
+        if result is not None:
+            table = 'failures' if 'error' in result else 'generations'
+            conn.execute(f'INSERT OR REPLACE INTO {table} (key, result, created_at) VALUES (?, ?, ?)',
+                         (key, json.dumps(result), now))
+        conn.execute('DELETE FROM inflight WHERE key = ? AND owner = ?', (key, owner))
+        conn.execute('DELETE FROM generations WHERE created_at < ?', (now - GENERATION_CACHE_TTL,))
+        conn.execute('DELETE FROM failures WHERE created_at < ?', (now - GENERATION_LEASE_SECONDS,))
+
+
+def cached_result(request):
+    """Stored result for a request within the TTL, or None"""
+    with _connect() as conn:
+        return _lookup(conn, 'generations', request_key(request), time.time() - GENERATION_CACHE_TTL)
+
+
+def store_result(request, result):
+    """Save a result produced outside cached_generation (e.g. a streamed call)"""
+    with _connect() as conn:
+        conn.execute('INSERT OR REPLACE INTO generations (key, result, created_at) VALUES (?, ?, ?)',
+                     (request_key(request), json.dumps(result), time.time()))
+
+
+def cached_generation(request, generate, refresh=False):
+    """
+    Result of a model request, generated at most once per TTL
+
+    Args:
+        request: JSON-serializable request sent to the model; its hash is
+                 the cache key, so every input that shapes the output
+                 (profile, custom prompt, model, temperature) must be in it
+        generate: Function returning the result dict. A dict with an
+                  'error' key is handed to anyone waiting but never reused.
+        refresh: Ignore a cached result and generate a new one (still
+                 shared with identical requests already waiting)
+
+    Returns:
+        dict: The cached or freshly generated result
+    """
+    key = request_key(request)
+    owner = uuid.uuid4().hex
+    started = time.time()
+
+    with _connect() as conn:
+        if not refresh:
+            cached = _lookup(conn, 'generations', key, started - GENERATION_CACHE_TTL)
+            if cached is not None:
+                return cached
+
+    while True:
+        with _connect() as conn:
+            claimed = _claim(conn, key, owner)
+            # A call that finished after we arrived answers this request too
+            shared = _lookup(conn, 'generations', key, started) or _lookup(conn, 'failures', key, started)
+            if shared is not None:
+                if claimed:
+                    conn.execute('DELETE FROM inflight WHERE key = ? AND owner = ?', (key, owner))
+                return shared
+
+        if claimed:
+            result = None
+            try:
+                result = generate()
+                return result
+            finally:
+                _finish(key, owner, result)
+
+        time.sleep(GENERATION_POLL_SECONDS)
+
@@ -0,0 +1,175 @@
+"""
+Background job runner for slow segment work
+Jobs are recorded in a SQLite table and executed by a process pool, so web
+workers return immediately and the browser polls /api/jobs/<id> for progress
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import importlib
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+JOBS_DB_FILE = os.environ.get('JOBS_DB', 'jobs.db')
+
+# Worker processes per web process; 0 runs jobs inline (local debugging)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+
+# Running jobs not updated for this long are treated as interrupted
+STALE_JOB_SECONDS = int(os.environ.get('STALE_JOB_SECONDS', 900))
+
+_executor = None
+
+
+def _connect():
+    """Open the jobs database (created on first use)"""
+    conn = sqlite3.connect(JOBS_DB_FILE, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            handler TEXT NOT NULL,
+            status TEXT NOT NULL,
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT NOT NULL DEFAULT '',
+            payload TEXT NOT NULL,
+            result TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, updated_at)')
+    return conn
+
+
+def _update(job_id, **fields):
+    """Update columns on a job row"""
+    fields['updated_at'] = time.time()
+    assignments = ', '.join(f'{name} = ?' for name in fields)
+    with _connect() as conn:
+        conn.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+
+def _get_executor():
+    """Process pool shared by every job submitted from this process"""
+    global _executor
+    if _executor is None:
+        # spawn: children never inherit web-worker sockets or SQLite handles
+        _executor = ProcessPoolExecutor(max_workers=JOB_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def _resolve_handler(path):
+    """Import 'module.function' inside the worker process"""
+    module_name, func_name = path.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def run_job(job_id):
+    """
+    Execute a queued job (runs inside a pool worker)
+
+    The job is claimed atomically, so it runs once even if several
+    processes try to pick it up.
+    """
+    with _connect() as conn:
+        claimed = conn.execute(
+            "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id)
+        ).rowcount
+        row = conn.execute('SELECT handler, payload FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    if not claimed or row is None:
+        return
+
+    def report(progress, message=''):
+        _update(job_id, progress=float(progress), message=message)
+
+    try:
+        handler = _resolve_handler(row['handler'])
+        result = handler(json.loads(row['payload']), report)
+        _update(job_id, status='done', progress=1.0,
+                message=(result or {}).get('message', 'Done'), result=json.dumps(result or {}))
+    except Exception as e:
+        traceback.print_exc()
+        _update(job_id, status='failed', message=str(e))
+
+
+def submit_job(handler, payload, unique=None):
+    """
+    Queue a job and start it in the background
+
+    Args:
+        handler: Module-level function (payload, report) -> result dict.
+                 report(progress, message) records progress (0.0 - 1.0).
+        payload: JSON-serializable dict passed to the handler
+        unique: Optional payload field; the job is refused while another
+                queued or running job of this handler has the same value
+
+    Returns:
+        str: Job ID to poll with get_job, or None if refused
+    """
+    job_id = uuid.uuid4().hex[:12]
+    now = time.time()
+    handler_path = f'{handler.__module__}.{handler.__name__}'
+    with _connect() as conn:
+        # The write lock makes the duplicate check and the insert one step
+        conn.execute('BEGIN IMMEDIATE')
+        if unique and conn.execute(
+            "SELECT 1 FROM jobs WHERE handler = ? AND status IN ('queued', 'running') AND updated_at > ?"
+            " AND json_extract(payload, '$.' || ?) = ?",
+            (handler_path, now - STALE_JOB_SECONDS, unique, payload[unique])
+        ).fetchone():
+            return None
+        conn.execute(
+            'INSERT INTO jobs (id, handler, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (job_id, handler_path, 'queued', json.dumps(payload), now, now)
+        )
+
+    global _executor
+    if JOB_WORKERS <= 0:
+        run_job(job_id)
+    else:
+        try:
+            _get_executor().submit(run_job, job_id)
+        except BrokenProcessPool:
+            # A worker was killed (e.g. out of memory) - start a fresh pool
+            _executor = None
+            _get_executor().submit(run_job, job_id)
+    return job_id
+
+
+def get_job(job_id):
+    """
+    Look up a job's status
+
+    Args:
+        job_id: ID returned by submit_job
+
+    Returns:
+        dict: {'id', 'handler', 'status', 'progress', 'message', 'result'} or None
+    """
+    with _connect() as conn:
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    if row is None:
+        return None
+
+    status = row['status']
+    if status in ('queued', 'running') and time.time() - row['updated_at'] > STALE_JOB_SECONDS:
+        # The process running it died (deploy, OOM, timeout)
+        _update(job_id, status='failed', message='Job was interrupted')
+        return get_job(job_id)
+
+    return {
+        'id': row['id'],
+        'handler': row['handler'],
+        'status': status,
+        'progress': row['progress'],
+        'message': row['message'],
+        'result': json.loads(row['result']) if row['result'] else None
+    }
@@ -0,0 +1,92 @@
+"""
+Incremental parser for a streamed JSON object
+Fed the model's reply piece by piece, it hands back each top-level field
+as soon as that field's value is complete, so a campaign's subject line
+can be shown while the rest is still being written
+"""
+import json
+
+
+class ObjectFieldParser:
+    """
+    Emits (key, value) for each top-level field of a JSON object
+
+    Usage:
+        parser = ObjectFieldParser()
+        for text in stream:
+            for key, value in parser.feed(text):
+                ...
+        result = parser.result()
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.position = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.key_start = None
+        self.key = None
+        self.value_start = None
+        self.fields = {}
+
+    def feed(self, text):
+        """
+        Add more of the reply
+
+        Args:
+            text: Next piece of the JSON text
+
+        Returns:
+            list: (key, value) for fields completed by this piece
+        """
+        self.buffer += text
+        completed = []
+        buffer = self.buffer
+        for i in range(self.position, len(buffer)):
+            c = buffer[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif c == '\\':
+                    self.escaped = True
+                elif c == '"':
+                    self.in_string = False
+                    if self.key_start is not None:
+                        self.key = json.loads(buffer[self.key_start:i + 1])
+                        self.key_start = None
+                continue
+
+            if c.isspace():
+                continue
+            if self.depth == 1:
+                if self.key is None and c == '"':
+                    self.key_start = i
+                elif self.key is not None and self.value_start is None and c != ':':
+                    self.value_start = i
+                elif c == ',' and self.value_start is not None:
+                    completed.append(self._finish(i))
+                    continue
+
+            if c == '"':
+                self.in_string = True
+            elif c in '{[':
+                self.depth += 1
+            elif c in '}]':
+                self.depth -= 1
+                if self.depth == 0 and self.value_start is not None:
+                    completed.append(self._finish(i))
+        self.position = len(buffer)
+        return completed
+
+    def _finish(self, end):
+        key = self.key
+        value = json.loads(self.buffer[self.value_start:end])
+        self.fields[key] = value
+        self.key = None
+        self.value_start = None
+        return key, value
+
+    def result(self):
+        """The whole object once the stream has ended"""
+        return json.loads(self.buffer)
@@ -0,0 +1,265 @@
+"""
+Shared HTTP client for OpenAI chat completions
+Every model call goes through one keep-alive session per process, retries
+rate limits and server errors with jittered exponential backoff (honouring
+Retry-After), and gives up at a per-call deadline. Replies can also be
+streamed as they are generated. Calls also wait their turn in the shared
+request and token buckets (rate_limiter.py), so all workers together stay
+under the provider's limits. Set OPENAI_BASE_URL to
+point at another endpoint, e.g. fake_openai.py for offline runs
+"""
+import os
+import json
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import rate_limiter
+
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL', 'https://api.openai.com/v1').rstrip('/')
+
+# Retries after the first attempt for retryable failures
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 4))
+
+# Backoff before retry n is random in [0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2**(n-1))]
+LLM_BACKOFF_BASE = float(os.environ.get('LLM_BACKOFF_BASE', 1.0))
+LLM_BACKOFF_MAX = float(os.environ.get('LLM_BACKOFF_MAX', 30.0))
+
+# Default overall time for one call, retries included
+LLM_DEADLINE_SECONDS = float(os.environ.get('LLM_DEADLINE_SECONDS', 120))
+
+# Open connections kept per process
+LLM_POOL_SIZE = int(os.environ.get('LLM_POOL_SIZE', 10))
+
+LLM_CONNECT_TIMEOUT = 10
+
+# Provider limits per model, shared by all workers
+LLM_RPM = int(os.environ.get('LLM_RPM', 500))
+LLM_TPM = int(os.environ.get('LLM_TPM', 200000))
+
+# Token estimate for an image input and for a reply without max_tokens
+IMAGE_TOKENS = 1000
+DEFAULT_COMPLETION_TOKENS = 1000
+
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+class LLMError(Exception):
+    """A model call failed; status is the last HTTP status (None if no response)"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def get_session():
+    """Pooled session for this process (recreated after a fork)"""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LLM_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session, _session_pid = session, os.getpid()
+        return _session
+
+
+def _retry_after(response):
+    """Server-requested wait in seconds, or None"""
+    if response is None:
+        return None
+    # OpenAI sends retry-after-ms alongside the standard header
+    value = response.headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            return None
+
+
+def _backoff(attempt, response):
+    """Seconds to wait before retry number attempt (1-based)"""
+    requested = _retry_after(response)
+    if requested is not None:
+        return min(requested, LLM_BACKOFF_MAX)
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+def estimate_tokens(payload):
+    """Rough prompt plus completion tokens for a request (4 characters per token)"""
+    characters = 0
+    images = 0
+    for message in payload.get('messages', []):
+        content = message.get('content') or ''
+        if isinstance(content, str):
+            characters += len(content)
+            continue
+        for part in content:
+            if part.get('type') == 'image_url':
+                images += 1
+            else:
+                characters += len(part.get('text', ''))
+    return characters // 4 + images * IMAGE_TOKENS + (payload.get('max_tokens') or DEFAULT_COMPLETION_TOKENS)
+
+
+def _rate_limits(payload, tokens):
+    """Bucket spec for rate_limiter: one request and the estimated tokens"""
+    model = payload.get('model', 'default')
+    return {
+        f'{model}:requests': (1, LLM_RPM, LLM_RPM / 60),
+        f'{model}:tokens': (tokens, LLM_TPM, LLM_TPM / 60)
+    }
+
+
+def _post(payload, timeout, deadline):
+    """
+    POST /chat/completions until a 200 arrives, retrying transient failures
+
+    Returns:
+        requests.Response: The successful response (body not yet read
+                           when the payload asks to stream)
+    """
+    api_key = os.environ.get('OPENAI_API_KEY')
+    if not api_key:
+        raise LLMError('OpenAI API key not configured')
+
+    headers = {'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'}
+    url = f'{OPENAI_BASE_URL}/chat/completions'
+    give_up_at = time.monotonic() + (LLM_DEADLINE_SECONDS if deadline is None else deadline)
+    limits = _rate_limits(payload, estimate_tokens(payload))
+    attempt = 0
+
+    while True:
+        waited = rate_limiter.acquire(limits, max_wait=give_up_at - time.monotonic())
+        if waited is None:
+            raise LLMError('Rate limit queue is longer than the deadline', 429)
+        if waited >= 1:
+            print(f"[LLM] Waited {waited:.1f}s for {payload.get('model', 'default')} rate limit")
+
+        remaining = give_up_at - time.monotonic()
+        if remaining <= 0:
+            # The request never went out; hand its reservation back
+            for name, (amount, capacity, _) in limits.items():
+                rate_limiter.refund(name, min(amount, capacity), capacity)
+            raise LLMError('Deadline exceeded')
+        response = None
+        refund = True
+        try:
+            response = get_session().post(url, headers=headers, json=payload, stream=bool(payload.get('stream')),
+                                          timeout=(min(LLM_CONNECT_TIMEOUT, remaining), min(timeout, remaining)))
+            if response.status_code == 200:
+                return response
+            error = LLMError(f'API error: {response.status_code} - {response.text}', response.status_code)
+            retryable = response.status_code in RETRY_STATUSES
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = LLMError(f'Request failed: {e}')
+            retryable = True
+            # A read timeout may still have been processed and billed upstream
+            refund = not isinstance(e, requests.ReadTimeout)
+
+        if refund:
+            # A failed attempt used none of its estimated tokens; the request slot stays spent
+            name = f"{payload.get('model', 'default')}:tokens"
+            amount, capacity, _ = limits[name]
+            rate_limiter.refund(name, min(amount, capacity), capacity)
+
+        attempt += 1
+        if not retryable or attempt > LLM_MAX_RETRIES:
+            raise error
+        delay = _backoff(attempt, response)
+        if time.monotonic() + delay >= give_up_at:
+            raise error
+        print(f"[LLM] {error.status or 'no response'} - retrying in {delay:.1f}s ({attempt}/{LLM_MAX_RETRIES})")
+        if error.status == 429:
+            # Hold every worker back, not just this call; the next acquire sleeps it off
+            rate_limiter.drain(limits, delay)
+        else:
+            time.sleep(delay)
+
+
+def _settle_tokens(payload, usage):
+    """Give the token bucket back the difference between estimate and actual usage"""
+    used = (usage or {}).get('total_tokens')
+    if used:
+        rate_limiter.refund(f"{payload.get('model', 'default')}:tokens", estimate_tokens(payload) - used, LLM_TPM)
+
+
+def chat_completion(payload, timeout=60, deadline=None):
+    """
+    POST /chat/completions, retrying transient failures
+
+    Args:
+        payload: Request body (model, messages, temperature, ...)
+        timeout: Seconds to wait for any single response
+        deadline: Seconds for the whole call, retries included
+                  (default LLM_DEADLINE_SECONDS)
+
+    Returns:
+        dict: Parsed response body
+
+    Raises:
+        LLMError: The call failed with a non-retryable error, ran out of
+                  retries or hit the deadline
+    """
+    body = _post(payload, timeout, deadline).json()
+    _settle_tokens(payload, body.get('usage'))
+    return body
+
+
+def stream_chat_completion(payload, timeout=60, deadline=None):
+    """
+    Streamed /chat/completions: yields the reply text as it is generated
+
+    Failures before the first chunk are retried like chat_completion;
+    once text is flowing a broken stream raises instead of starting over.
+
+    Args:
+        payload: Request body (stream is turned on here)
+        timeout: Seconds to wait for the response to start and between chunks
+        deadline: Seconds until the response starts, retries included
+
+    Yields:
+        str: Pieces of the assistant message content
+
+    Raises:
+        LLMError: As chat_completion, or the stream broke off
+    """
+    payload = dict(payload, stream=True, stream_options={'include_usage': True})
+    response = _post(payload, timeout, deadline)
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            data = line[5:].strip()
+            if data == '[DONE]':
+                break
+            chunk = json.loads(data)
+            if chunk.get('usage'):
+                _settle_tokens(payload, chunk['usage'])
+            for choice in chunk.get('choices') or []:
+                content = (choice.get('delta') or {}).get('content')
+                if content:
+                    yield content
+    except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+        raise LLMError(f'Stream interrupted: {e}')
+    finally:
+        response.close()
@@ -0,0 +1,119 @@
+"""
+Token buckets shared by every worker process
+Bucket levels live in SQLite, so requests-per-minute and tokens-per-minute
+limits hold across gunicorn workers and job processes. Callers reserve
+what they need up front and sleep off any shortfall, which queues them in
+arrival order instead of failing
+"""
+import os
+import time
+import sqlite3
+
+RATE_LIMIT_DB = os.environ.get('RATE_LIMIT_DB', 'rate_limits.db')
+
+
+def _connect():
+    """Open the bucket database (created on first use)"""
+    conn = sqlite3.connect(RATE_LIMIT_DB, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS buckets (
+            name TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    return conn
+
+
+def _levels(conn, limits, now):
+    """Current level of each bucket after refilling; new buckets start full"""
+    levels = {}
+    for name, (_, capacity, per_second) in limits.items():
+        row = conn.execute('SELECT tokens, updated_at FROM buckets WHERE name = ?', (name,)).fetchone()
+        levels[name] = capacity if row is None else min(capacity, row[0] + (now - row[1]) * per_second)
+    return levels
+
+
+def _store(conn, levels, now):
+    conn.executemany('INSERT OR REPLACE INTO buckets (name, tokens, updated_at) VALUES (?, ?, ?)',
+                     [(name, tokens, now) for name, tokens in levels.items()])
+
+
+def acquire(limits, max_wait=None):
+    """
+    Take from several buckets at once, waiting until they cover it
+
+    The amounts are reserved immediately (a bucket may go negative), so
+    later callers queue behind this one.
+
+    Args:
+        limits: {bucket name: (amount, capacity, refill per second)}
+        max_wait: Give up without reserving anything if the wait would be
+                  longer than this many seconds
+
+    Returns:
+        float: Seconds waited, or None if max_wait would be exceeded
+    """
+    conn = _connect()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        now = time.time()
+        levels = _levels(conn, limits, now)
+        wait = 0.0
+        for name, (amount, capacity, per_second) in limits.items():
+            # A single request larger than the bucket waits for a full bucket
+            levels[name] -= min(amount, capacity)
+            if levels[name] < 0:
+                wait = max(wait, -levels[name] / per_second)
+        if max_wait is not None and wait > max_wait:
+            conn.execute('ROLLBACK')
+            return None
+        _store(conn, levels, now)
+        conn.execute('COMMIT')
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+    if wait:
+        time.sleep(wait)
+    return wait
+
+
+def refund(name, amount, capacity):
+    """Return unused tokens to a bucket (a negative amount takes more)"""
+    conn = _connect()
+    try:
+        conn.execute('UPDATE buckets SET tokens = MIN(?, tokens + ?) WHERE name = ?', (capacity, amount, name))
+    finally:
+        conn.close()
+
+
+def drain(limits, seconds):
+    """
+    Empty buckets so that nobody gets through for the next few seconds
+
+    Used when the provider says we are over its limit anyway.
+
+    Args:
+        limits: {bucket name: (amount, capacity, refill per second)}
+        seconds: How long the buckets stay empty
+    """
+    conn = _connect()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        now = time.time()
+        levels = _levels(conn, limits, now)
+        for name, (_, _, per_second) in limits.items():
+            levels[name] = min(levels[name], -seconds * per_second)
+        _store(conn, levels, now)
+        conn.execute('COMMIT')
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
@@ -0,0 +1,260 @@
+"""
+Segment membership index for cached client data files
+Stores one packed bitmap of matching rows per (file ETag, formula) next to
+the cached columns, so counts, analytics and overlaps reuse it instead of
+re-evaluating formulas
+"""
+import os
+import hashlib
+import tempfile
+import numpy as np
+
+from client_data import PREPARE_COLUMNS, prepare_client_data, prepare_signature, merge_client_data
+from client_data_cache import resolve_cache_entries, read_cache_entry, cache_entry_rows
+from formula_evaluator import formula_masks, formula_columns
+
+INDEX_DIRNAME = 'segments'
+
+# Bump when the way bitmaps are evaluated changes, so stored ones are rebuilt
+INDEX_VERSION = 2
+
+# Number of set bits in every byte value, for popcounts over packed bitmaps
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _bitmap_path(entry_dir, formula):
+    """Bitmap file for a formula inside a cache entry"""
+    digest = hashlib.sha256(f'{INDEX_VERSION}|{prepare_signature()}|{formula}'.encode('utf-8')).hexdigest()
+    return os.path.join(entry_dir, INDEX_DIRNAME, f'{digest}.npy')
+
+
+def _save_bitmap(path, bits):
+    """Write a packed bitmap atomically"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, bits)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def popcount(bits):
+    """Count set bits in a packed bitmap"""
+    return int(_POPCOUNT[bits].sum(dtype=np.int64))
+
+
+def _failed_path(bitmap_path):
+    """Marker recording that a formula could not be evaluated on this file"""
+    return bitmap_path[:-len('.npy')] + '.failed'
+
+
+def add_formula_columns(df, formulas):
+    """
+    Add columns the formulas reference but this file lacks, as empty
+
+    Formulas are evaluated one file at a time; a column another selected
+    file has (e.g. SALE_YEAR, which needs CURRENT_SALE_RECORDING_DATE)
+    must not fail the formula here. The rows simply don't match, as they
+    wouldn't in the merged frame.
+
+    Returns:
+        DataFrame: The same frame, with the columns added in place
+    """
+    for column in formula_columns(formulas):
+        if column not in df.columns:
+            df[column] = np.nan
+    return df
+
+
+def store_packed_bitmaps(entry_dir, bitmaps):
+    """
+    Persist packed bitmaps for a cache entry
+
+    Args:
+        entry_dir: Cache entry directory
+        bitmaps: dict formula -> np.packbits output, or None for formulas
+                 that failed (recorded so they are not re-evaluated)
+    """
+    for formula, bits in bitmaps.items():
+        path = _bitmap_path(entry_dir, formula)
+        try:
+            if bits is None:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                open(_failed_path(path), 'w').close()
+            else:
+                _save_bitmap(path, bits)
+        except Exception as e:
+            print(f"[INDEX] Could not store bitmap for '{formula}': {e}")
+
+
+def store_segment_bitmaps(entry_dir, masks):
+    """
+    Persist boolean masks for a cache entry
+
+    Args:
+        entry_dir: Cache entry directory
+        masks: dict formula -> boolean mask, or None for formulas that
+               failed (recorded so they are not re-evaluated)
+    """
+    store_packed_bitmaps(entry_dir, {
+        formula: np.packbits(mask) if mask is not None else None
+        for formula, mask in masks.items()
+    })
+
+
+def _load_file(entry_dir, df, formulas, need_frame=False):
+    """
+    Packed bitmaps for one resolved file, computing and storing any that
+    are missing
+
+    Returns:
+        dict: {'rows': int, 'bitmaps': {formula: packed bits or None},
+               'df': typed frame or None} or None if the file failed to load
+    """
+    if entry_dir is None and df is None:
+        return None
+
+    bitmaps = {}
+    missing = []
+    for formula in formulas:
+        path = _bitmap_path(entry_dir, formula) if entry_dir else None
+        if path and os.path.exists(path):
+            bitmaps[formula] = np.load(path)
+        elif path and os.path.exists(_failed_path(path)):
+            bitmaps[formula] = None
+        else:
+            missing.append(formula)
+
+    if df is None and need_frame:
+        df = read_cache_entry(entry_dir)
+    elif df is None and missing:
+        # Only the columns the formulas can reach; names, emails etc. stay undecoded
+        df = read_cache_entry(entry_dir, set(PREPARE_COLUMNS) | formula_columns(missing))
+
+    if missing:
+        # Derived columns are added in place; the raw cached columns are untouched
+        masks = formula_masks(add_formula_columns(prepare_client_data(df), missing), missing)
+        if entry_dir:
+            store_segment_bitmaps(entry_dir, masks)
+        for formula, mask in masks.items():
+            bitmaps[formula] = np.packbits(mask) if mask is not None else None
+
+    rows = len(df) if df is not None else cache_entry_rows(entry_dir)
+    return {'rows': rows, 'bitmaps': bitmaps, 'df': df if need_frame else None}
+
+
+def segment_counts(keys, formulas, progress=None):
+    """
+    Count matching rows per formula across files without loading their data
+    when bitmaps already exist
+
+    Args:
+        keys: List of file keys in Spaces
+        formulas: List of formula strings
+        progress: Optional callback(files_done, files_total) after each file
+
+    Returns:
+        dict: {'rows': total rows loaded, 'files': files loaded,
+               'counts': {formula: count, or None if the formula failed}}
+    """
+    formulas = list(dict.fromkeys(formulas))
+    counts = {formula: 0 for formula in formulas}
+    rows = 0
+    files = 0
+
+    for i, resolved in enumerate(resolve_cache_entries(keys)):
+        loaded = _load_file(*resolved, formulas)
+        if progress:
+            progress(i + 1, len(keys))
+        if loaded is None:
+            continue
+        rows += loaded['rows']
+        files += 1
+        for formula, bits in loaded['bitmaps'].items():
+            if bits is None or counts[formula] is None:
+                counts[formula] = None
+            else:
+                counts[formula] += popcount(bits)
+
+    return {'rows': rows, 'files': files, 'counts': counts}
+
+
+def segment_overlap(keys, formulas):
+    """
+    Count rows matching every formula (bitwise AND of their bitmaps)
+
+    Args:
+        keys: List of file keys in Spaces
+        formulas: List of formula strings
+
+    Returns:
+        dict: {'rows': total rows, 'count': rows in all segments,
+               'counts': per-formula counts} - count is None if any formula failed
+    """
+    formulas = list(dict.fromkeys(formulas))
+    counts = {formula: 0 for formula in formulas}
+    overlap = 0
+    rows = 0
+
+    for resolved in resolve_cache_entries(keys):
+        loaded = _load_file(*resolved, formulas)
+        if loaded is None:
+            continue
+        rows += loaded['rows']
+        bitmaps = loaded['bitmaps']
+        if any(bits is None for bits in bitmaps.values()):
+            return {'rows': rows, 'count': None, 'counts': None}
+
+        combined = None
+        for formula, bits in bitmaps.items():
+            counts[formula] += popcount(bits)
+            combined = bits.copy() if combined is None else np.bitwise_and(combined, bits, out=combined)
+        if combined is not None:
+            overlap += popcount(combined)
+
+    return {'rows': rows, 'count': overlap, 'counts': counts}
+
+
+def load_segment_data(keys, formulas, progress=None):
+    """
+    Load the merged, prepared frame plus a boolean mask per formula
+
+    Args:
+        keys: List of file keys in Spaces
+        formulas: List of formula strings
+        progress: Optional callback(files_done, files_total) after each file
+
+    Returns:
+        tuple: (DataFrame, {formula: mask or None}) or (None, {}) if no
+               file could be loaded
+    """
+    formulas = list(dict.fromkeys(formulas))
+    frames = []
+    parts = {formula: [] for formula in formulas}
+
+    for i, resolved in enumerate(resolve_cache_entries(keys)):
+        loaded = _load_file(*resolved, formulas, need_frame=True)
+        if progress:
+            progress(i + 1, len(keys))
+        if loaded is None:
+            continue
+        frames.append(loaded['df'])
+        for formula, bits in loaded['bitmaps'].items():
+            if bits is None or parts[formula] is None:
+                parts[formula] = None
+            else:
+                parts[formula].append(np.unpackbits(bits, count=loaded['rows']).astype(bool))
+
+    if not frames:
+        return None, {}
+
+    df = merge_client_data(frames)
+    masks = {
+        formula: np.concatenate(chunks) if chunks is not None else None
+        for formula, chunks in parts.items()
+    }
+    return df, masks
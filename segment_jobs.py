@@ -0,0 +1,271 @@
+"""
+Past client segment work that runs in the background job pool
+Each job loads client files through the segment index, then writes its
+results into the past client segments in the datastore
+"""
+import os
+
+import datastore
+from segment_index import segment_counts, load_segment_data
+
+
+def update_past_clients(mutate):
+    """
+    Apply a change to the past client segments without losing concurrent updates
+
+    The segments are re-read and written back in one datastore transaction;
+    only segments that changed are rewritten.
+
+    Args:
+        mutate: Function(segments) that modifies the list in place; its
+                return value is passed back to the caller
+
+    Returns:
+        Whatever mutate returned
+    """
+    return datastore.update_items('past_clients', mutate)
+
+
+def segment_analytics(df, mask):
+    """
+    Summary statistics of a segment's matching records for the AI generator
+
+    Args:
+        df: Prepared client data frame
+        mask: Boolean mask of matching rows (None or empty uses all rows)
+
+    Returns:
+        dict: median_age, age_distribution, median_equity, equity_distribution,
+              median_home_value, median_length_of_residence (when available)
+    """
+    analytics = {}
+    matching_df = df[mask] if mask is not None and mask.any() else df
+    print(f"[ANALYTICS] Starting analytics calculation for {len(matching_df)} records")
+
+    # Age distribution
+    try:
+        if 'AGE' in matching_df.columns:
+            age_data = matching_df['AGE'].dropna()
+            if len(age_data) > 0:
+                analytics['median_age'] = int(age_data.median())
+                analytics['age_distribution'] = {
+                    '25-34': int(((age_data >= 25) & (age_data < 35)).sum()),
+                    '35-44': int(((age_data >= 35) & (age_data < 45)).sum()),
+                    '45-54': int(((age_data >= 45) & (age_data < 55)).sum()),
+                    '55-64': int(((age_data >= 55) & (age_data < 65)).sum()),
+                    '65+': int((age_data >= 65).sum())
+                }
+                print(f"[ANALYTICS] ✓ Age: median={analytics['median_age']}")
+    except Exception as e:
+        print(f"[ANALYTICS ERROR] Age calculation failed: {e}")
+
+    # Equity distribution
+    try:
+        if 'EQUITY' in matching_df.columns:
+            equity_data = matching_df['EQUITY'].dropna()
+            if len(equity_data) > 0:
+                analytics['median_equity'] = int(equity_data.median())
+                analytics['equity_distribution'] = {
+                    '<100k': int((equity_data < 100000).sum()),
+                    '100k-250k': int(((equity_data >= 100000) & (equity_data < 250000)).sum()),
+                    '250k-500k': int(((equity_data >= 250000) & (equity_data < 500000)).sum()),
+                    '500k-1M': int(((equity_data >= 500000) & (equity_data < 1000000)).sum()),
+                    '1M+': int((equity_data >= 1000000).sum())
+                }
+                print(f"[ANALYTICS] ✓ Equity: median=${analytics['median_equity']:,}")
+    except Exception as e:
+        print(f"[ANALYTICS ERROR] Equity calculation failed: {e}")
+
+    # Home value distribution
+    try:
+        if 'CURRENT_AVM_VALUE' in matching_df.columns:
+            value_data = matching_df['CURRENT_AVM_VALUE'].dropna()
+            if len(value_data) > 0:
+                analytics['median_home_value'] = int(value_data.median())
+                print(f"[ANALYTICS] ✓ Home value: ${analytics['median_home_value']:,}")
+    except Exception as e:
+        print(f"[ANALYTICS ERROR] Home value calculation failed: {e}")
+
+    # Length of residence
+    try:
+        if 'LENGTH_OF_RESIDENCE' in matching_df.columns:
+            lor_data = matching_df['LENGTH_OF_RESIDENCE'].dropna()
+            if len(lor_data) > 0:
+                analytics['median_length_of_residence'] = int(lor_data.median())
+                print(f"[ANALYTICS] ✓ Length of residence: {analytics['median_length_of_residence']} years")
+    except Exception as e:
+        print(f"[ANALYTICS ERROR] Length of residence calculation failed: {e}")
+
+    return analytics
+
+
+def _file_progress(report, label):
+    """Adapt report(progress, message) to the segment index file callback"""
+    def progress(done, total):
+        report(done / total * 0.9, f'{label} ({done}/{total} files)')
+    return progress
+
+
+def _get_segment(segment_id):
+    segment = datastore.get_item('past_clients', segment_id)
+    if segment is None:
+        raise ValueError('Segment not found')
+    return segment
+
+
+def _update_segment(segment_id, fields):
+    """Write fields into one stored segment"""
+    try:
+        datastore.modify_item('past_clients', segment_id, lambda seg: seg.update(fields))
+    except KeyError:
+        raise ValueError('Segment not found')
+
+
+def refresh_segment_job(payload, report):
+    """
+    Recalculate a segment's count and analytics from its selected files
+
+    Args:
+        payload: {'segment_id': str, 'selected_files': [keys]}
+        report: Progress callback from the job runner
+
+    Returns:
+        dict: {'count', 'rows', 'message'}
+    """
+    segment = _get_segment(payload['segment_id'])
+    formula = segment.get('formula', '')
+
+    merged_df, masks = load_segment_data(payload['selected_files'], [formula] if formula else [],
+                                         progress=_file_progress(report, 'Loading files'))
+    if merged_df is None:
+        raise ValueError('Could not load any of the selected files')
+    mask = masks.get(formula)
+
+    report(0.95, 'Calculating analytics')
+    count = int(mask.sum()) if mask is not None else 0
+    analytics = segment_analytics(merged_df, mask if formula else None)
+
+    _update_segment(payload['segment_id'], {'count': count, **analytics})
+    return {
+        'count': count,
+        'rows': len(merged_df),
+        'message': f'Segment saved and recalculated! Count: {count} from {len(merged_df)} records'
+    }
+
+
+def recalculate_segment_job(payload, report):
+    """
+    Recalculate one segment's count from the bitmap index
+
+    Args:
+        payload: {'segment_id': str, 'selected_files': [keys]}
+        report: Progress callback from the job runner
+
+    Returns:
+        dict: {'count', 'rows', 'message'}
+    """
+    segment = _get_segment(payload['segment_id'])
+    formula = segment.get('formula', '')
+
+    result = segment_counts(payload['selected_files'], [formula] if formula else [],
+                            progress=_file_progress(report, 'Counting'))
+    if not result['files']:
+        raise ValueError('could not load any of the selected files')
+    count = result['counts'].get(formula) or 0
+
+    _update_segment(payload['segment_id'], {'count': count})
+    return {
+        'count': count,
+        'rows': result['rows'],
+        'message': f'Segment "{segment["name"]}" recalculated! New count: {count} from {result["rows"]} total records'
+    }
+
+
+def ingest_upload_job(payload, report):
+    """
+    Store an uploaded client data file and count every segment in it
+
+    The file is uploaded to Spaces, then parsed once in chunks, which also
+    fills the column cache and segment index.
+
+    Args:
+        payload: {'path': spooled upload (deleted when the job ends),
+                  'filename': name it was uploaded as}
+        report: Progress callback from the job runner
+
+    Returns:
+        dict: {'key', 'rows', 'counts': {formula: count}, 'message'}
+    """
+    from client_ingest import ingest_client_file
+    from file_catalog import catalog_add
+    from storage import upload_file_to_spaces
+
+    path = payload['path']
+    filename = payload['filename']
+    try:
+        report(0.05, f'Uploading {filename}')
+        upload_result = upload_file_to_spaces(path, filename)
+        if not upload_result['success']:
+            raise ValueError(f'Upload failed: {upload_result["message"]}')
+        catalog_add(upload_result['key'])
+
+        def parsed(rows):
+            # Total rows aren't known until the end; creep towards the finish
+            report(min(0.3 + rows / (rows + 500000) * 0.6, 0.9), f'Processing {filename} ({rows:,} rows)')
+
+        segments = datastore.load_items('past_clients')
+        result = ingest_client_file(path, upload_result['key'],
+                                    [seg['formula'] for seg in segments if seg.get('formula')], progress=parsed)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+    counts = result['counts']
+    print(f"[INGEST] {filename}: {result['rows']} rows, column stats: {result['stats']}")
+
+    def apply_counts(segments):
+        for seg in segments:
+            formula = seg.get('formula', '')
+            if formula in counts or not formula:
+                seg['count'] = counts.get(formula) or 0
+
+    update_past_clients(apply_counts)
+    return {
+        'key': upload_result['key'],
+        'rows': result['rows'],
+        'counts': counts,
+        'message': f'Client data processed successfully! {result["rows"]:,} rows from {filename}'
+    }
+
+
+def analyze_files_job(payload, report):
+    """
+    Recalculate every segment's count from the selected files
+
+    Args:
+        payload: {'selected_files': [keys]}
+        report: Progress callback from the job runner
+
+    Returns:
+        dict: {'counts': {segment_id: count}, 'rows', 'message'}
+    """
+    formulas = {s['id']: s.get('formula', '') for s in datastore.load_items('past_clients')}
+
+    result = segment_counts(payload['selected_files'], [f for f in formulas.values() if f],
+                            progress=_file_progress(report, 'Counting'))
+    if not result['files']:
+        raise ValueError('could not load any of the selected files')
+    counts = {seg_id: result['counts'].get(formula) or 0 for seg_id, formula in formulas.items()}
+
+    def apply(segments):
+        # Segments created while the job ran keep their own counts
+        for seg in segments:
+            if seg['id'] in counts:
+                seg['count'] = counts[seg['id']]
+
+    update_past_clients(apply)
+    return {
+        'counts': counts,
+        'rows': result['rows'],
+        'message': f'Analysis complete! {result["rows"]} total records processed from {len(payload["selected_files"])} file(s)'
+    }
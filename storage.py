@@ -2,22 +2,108 @@
 Secure file storage using DigitalOcean Spaces (S3-compatible)
 """
 import os
+import time
+import tempfile
+import threading
 import boto3
 from botocore.client import Config
+from botocore.exceptions import ClientError
+from boto3.s3.transfer import TransferConfig
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+# Open HTTPS connections kept by the shared client (per process)
+SPACES_MAX_POOL_CONNECTIONS = int(os.environ.get('SPACES_MAX_POOL_CONNECTIONS', 32))
+
+# Parallel requests made by the *_many helpers
+SPACES_MAX_WORKERS = int(os.environ.get('SPACES_MAX_WORKERS', 8))
+
+# Seconds cached object reads are served without asking Spaces
+# (0 disables); stale objects are revalidated with If-None-Match
+SPACES_CACHE_TTL = float(os.environ.get('SPACES_CACHE_TTL', 60))
+
+# Touched on every write so all worker processes drop their caches
+SPACES_CACHE_STAMP = os.environ.get('SPACES_CACHE_STAMP', os.path.join(tempfile.gettempdir(), 'spaces-cache.stamp'))
+
+# Large uploads go up as parallel multipart parts streamed from disk/stream,
+# so only a few parts are ever held in memory
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=16 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=4
+)
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
 # Initialize S3 client for DigitalOcean Spaces
 def get_spaces_client():
-    """Get configured boto3 client for DigitalOcean Spaces"""
-    session = boto3.session.Session()
-    client = session.client('s3',
-        region_name=os.environ.get('SPACES_REGION', 'nyc3'),
-        endpoint_url=f"https://{os.environ.get('SPACES_REGION', 'nyc3')}.digitaloceanspaces.com",
-        aws_access_key_id=os.environ.get('SPACES_KEY'),
-        aws_secret_access_key=os.environ.get('SPACES_SECRET'),
-        config=Config(signature_version='s3v4')
-    )
-    return client
+    """
+    Get the shared boto3 client for DigitalOcean Spaces
+
+    boto3 clients are thread-safe and reuse pooled connections, so one is
+    built per process (forked workers build their own) instead of a new
+    session, credential lookup and TLS handshake on every call.
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                session = boto3.session.Session()
+                _client = session.client('s3',
+                    region_name=os.environ.get('SPACES_REGION', 'nyc3'),
+                    endpoint_url=f"https://{os.environ.get('SPACES_REGION', 'nyc3')}.digitaloceanspaces.com",
+                    aws_access_key_id=os.environ.get('SPACES_KEY'),
+                    aws_secret_access_key=os.environ.get('SPACES_SECRET'),
+                    config=Config(
+                        signature_version='s3v4',
+                        max_pool_connections=SPACES_MAX_POOL_CONNECTIONS,
+                        retries={'max_attempts': 5, 'mode': 'standard'}
+                    )
+                )
+                _client_pid = os.getpid()
+    return _client
+
+_cache = {}
+_cache_stamp = None
+_cache_lock = threading.Lock()
+
+def _cache_get(cache_key):
+    """Cached entry for cache_key (fresh or stale), dropping everything if another process wrote"""
+    global _cache_stamp
+    try:
+        stamp = os.stat(SPACES_CACHE_STAMP).st_mtime_ns
+    except OSError:
+        stamp = 0
+    with _cache_lock:
+        if stamp != _cache_stamp:
+            _cache.clear()
+            _cache_stamp = stamp
+        return _cache.get(cache_key)
+
+def _cache_put(cache_key, **values):
+    with _cache_lock:
+        _cache[cache_key] = {**values, 'expires': time.time() + SPACES_CACHE_TTL}
+
+def invalidate_spaces_cache():
+    """Drop cached object reads in every process"""
+    with _cache_lock:
+        _cache.clear()
+    try:
+        with open(SPACES_CACHE_STAMP, 'a'):
+            pass
+        os.utime(SPACES_CACHE_STAMP)
+    except OSError as e:
+        print(f"Error invalidating storage cache: {str(e)}")
+
+def _map_concurrent(func, items):
+    """Run func over items on a thread pool; returns results in order"""
+    items = list(items)
+    if len(items) <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(SPACES_MAX_WORKERS, len(items))) as pool:
+        return list(pool.map(func, items))
 
 def upload_file_to_spaces(file_obj, filename):
     """
@@ -38,16 +124,17 @@ def upload_file_to_spaces(file_obj, filename):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         key = f"client-data/{timestamp}_{filename}"
         
+        extra_args = {
+            'ACL': 'private',  # Private file
+            'ServerSideEncryption': 'AES256'  # Encryption at rest
+        }
+        
         # Upload with server-side encryption
-        client.upload_fileobj(
-            file_obj,
-            bucket,
-            key,
-            ExtraArgs={
-                'ACL': 'private',  # Private file
-                'ServerSideEncryption': 'AES256'  # Encryption at rest
-            }
-        )
+        if isinstance(file_obj, str):
+            client.upload_file(file_obj, bucket, key, ExtraArgs=extra_args, Config=TRANSFER_CONFIG)
+        else:
+            client.upload_fileobj(file_obj, bucket, key, ExtraArgs=extra_args, Config=TRANSFER_CONFIG)
+        invalidate_spaces_cache()
         
         return {
             'success': True,
@@ -90,35 +177,215 @@ def download_file_from_spaces(key, local_path):
             'message': f'Download failed: {str(e)}'
         }
 
-def list_files_in_spaces(prefix='client-data/'):
+def download_many(keys, local_dir):
     """
-    List all files in Spaces with given prefix
-    
+    Download several files from DigitalOcean Spaces concurrently
+
     Args:
-        prefix: Folder prefix to filter files
+        keys: List of file keys in Spaces
+        local_dir: Directory to save the files in (names keep the key's extension)
+
+    Returns:
+        dict: key -> {'success': bool, 'path': str, 'message': str}
+    """
+    keys = list(dict.fromkeys(keys))
+    paths = [os.path.join(local_dir, f'{i:04d}{os.path.splitext(key)[1]}') for i, key in enumerate(keys)]
+    results = _map_concurrent(lambda item: download_file_from_spaces(*item), zip(keys, paths))
+    return dict(zip(keys, results))
+
+def get_object_bytes(key, cache=False):
+    """
+    Read a file from DigitalOcean Spaces straight into memory
+
+    Args:
+        key: File key in Spaces
+        cache: Serve from the local cache for SPACES_CACHE_TTL seconds, then
+               revalidate with If-None-Match (a 304 costs no body transfer)
+
+    Returns:
+        dict: {'success': bool, 'data': bytes, 'etag': str, 'message': str}
+    """
+    cached = _cache_get(('object', key)) if cache and SPACES_CACHE_TTL > 0 else None
+    if cached and cached['expires'] > time.time():
+        return {'success': True, 'data': cached['data'], 'etag': cached['etag'], 'message': f'File read from cache: {key}'}
     
+    try:
+        client = get_spaces_client()
+        bucket = os.environ.get('SPACES_BUCKET')
+        
+        try:
+            if cached:
+                response = client.get_object(Bucket=bucket, Key=key, IfNoneMatch=f'"{cached["etag"]}"')
+            else:
+                response = client.get_object(Bucket=bucket, Key=key)
+        except ClientError as e:
+            if cached and e.response.get('Error', {}).get('Code') in ('304', 'NotModified'):
+                _cache_put(('object', key), data=cached['data'], etag=cached['etag'])
+                return {'success': True, 'data': cached['data'], 'etag': cached['etag'], 'message': f'File not modified: {key}'}
+            raise
+        
+        data = response['Body'].read()
+        etag = response['ETag'].strip('"')
+        if cache and SPACES_CACHE_TTL > 0:
+            _cache_put(('object', key), data=data, etag=etag)
+        
+        return {
+            'success': True,
+            'data': data,
+            'etag': etag,
+            'message': f'File read successfully: {key}'
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'data': None,
+            'etag': None,
+            'message': f'Read failed: {str(e)}'
+        }
+
+def put_object_bytes(key, data, content_type='application/octet-stream'):
+    """
+    Write bytes to an exact key in DigitalOcean Spaces
+
+    Unlike upload_file_to_spaces, the key is used as-is (no client-data/
+    prefix or timestamp), so fixed objects like the email template can be
+    overwritten in place.
+
+    Args:
+        key: File key in Spaces
+        data: bytes or str (encoded as UTF-8)
+        content_type: MIME type stored with the object
+
     Returns:
-        list: List of file objects with keys and metadata
+        dict: {'success': bool, 'key': str, 'message': str}
     """
     try:
         client = get_spaces_client()
         bucket = os.environ.get('SPACES_BUCKET')
         
-        response = client.list_objects_v2(Bucket=bucket, Prefix=prefix)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
         
-        if 'Contents' not in response:
-            return []
+        client.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=data,
+            ContentType=content_type,
+            ACL='private',
+            ServerSideEncryption='AES256'
+        )
+        invalidate_spaces_cache()
         
-        files = []
-        for obj in response['Contents']:
+        return {
+            'success': True,
+            'key': key,
+            'message': f'File saved successfully: {key}'
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'key': None,
+            'message': f'Save failed: {str(e)}'
+        }
+
+def get_file_metadata(key):
+    """
+    Fetch object metadata (no body) from DigitalOcean Spaces
+
+    Args:
+        key: File key in Spaces
+
+    Returns:
+        dict: {'success': bool, 'etag': str, 'size': int, 'last_modified': datetime, 'message': str}
+    """
+    try:
+        client = get_spaces_client()
+        bucket = os.environ.get('SPACES_BUCKET')
+
+        response = client.head_object(Bucket=bucket, Key=key)
+
+        return {
+            'success': True,
+            'etag': response['ETag'].strip('"'),
+            'size': response['ContentLength'],
+            'last_modified': response['LastModified'],
+            'message': f'Metadata loaded for {key}'
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'etag': None,
+            'size': None,
+            'last_modified': None,
+            'message': f'Metadata lookup failed: {str(e)}'
+        }
+
+def get_files_metadata(keys):
+    """
+    Fetch metadata for several objects concurrently
+
+    Args:
+        keys: List of file keys in Spaces
+
+    Returns:
+        dict: key -> get_file_metadata result
+    """
+    keys = list(dict.fromkeys(keys))
+    return dict(zip(keys, _map_concurrent(get_file_metadata, keys)))
+
+def _list_objects(prefix):
+    """Every object under prefix, following continuation tokens past 1,000 keys"""
+    client = get_spaces_client()
+    bucket = os.environ.get('SPACES_BUCKET')
+    
+    files = []
+    for page in client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
             files.append({
                 'key': obj['Key'],
                 'size': obj['Size'],
                 'last_modified': obj['LastModified'],
-                'filename': obj['Key'].split('/')[-1]
+                'filename': obj['Key'].split('/')[-1],
+                'etag': obj.get('ETag', '').strip('"')
             })
-        
-        return files
+    return files
+
+def scan_files_in_spaces(prefix='client-data/'):
+    """
+    List all files under a prefix, reporting failures
+
+    Args:
+        prefix: Folder prefix to filter files
+
+    Returns:
+        dict: {'success': bool, 'files': list, 'message': str}
+    """
+    try:
+        files = _list_objects(prefix)
+        return {
+            'success': True,
+            'files': files,
+            'message': f'Listed {len(files)} files under {prefix}'
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'files': [],
+            'message': f'Listing failed: {str(e)}'
+        }
+
+def list_files_in_spaces(prefix='client-data/'):
+    """
+    List all files in Spaces with given prefix
+    
+    Args:
+        prefix: Folder prefix to filter files
+    
+    Returns:
+        list: List of file objects with keys and metadata
+    """
+    try:
+        return _list_objects(prefix)
     except Exception as e:
         print(f"Error listing files: {str(e)}")
         return []
@@ -138,6 +405,7 @@ def delete_file_from_spaces(key):
         bucket = os.environ.get('SPACES_BUCKET')
         
         client.delete_object(Bucket=bucket, Key=key)
+        invalidate_spaces_cache()
         
         return {
             'success': True,
@@ -0,0 +1,140 @@
+"""
+Streaming exports of form submissions
+Rows are read from the datastore in keyset batches and written out as they
+arrive, so CSV downloads start immediately and memory stays flat however
+many leads have been captured
+"""
+import io
+import csv
+import json
+import tempfile
+
+import datastore
+
+EXPORT_COLUMNS = [
+    ('ID', 'id'),
+    ('Timestamp', 'timestamp'),
+    ('Campaign ID', 'campaign_id'),
+    ('Email', 'email'),
+    ('First Name', 'first_name'),
+    ('Last Name', 'last_name'),
+    ('Equity Priority', 'equity_priority'),
+    ('Goals', 'goals'),
+    ('Goals Text', 'goals_text'),
+    ('Phone', 'phone_number'),
+    ('Wants Report', 'wants_equity_report'),
+    ('Wants Expert', 'wants_expert_contact')
+]
+
+# Bytes of CSV buffered before a chunk is sent
+CSV_CHUNK_BYTES = 64 * 1024
+
+# Spooled xlsx output is kept in memory up to this size, then moved to disk
+XLSX_SPOOL_BYTES = 8 * 1024 * 1024
+
+
+def submission_filters(args):
+    """
+    Datastore filters from request arguments
+
+    Args:
+        args: Request args with optional campaign_id, status, start and end
+              (YYYY-MM-DD, inclusive)
+
+    Returns:
+        dict: {'filters': {...}, 'between': (field, low, high) or None}
+    """
+    filters = {}
+    if args.get('campaign_id'):
+        filters['campaign_id'] = args.get('campaign_id')
+    if args.get('status'):
+        filters['status'] = args.get('status')
+
+    start, end = args.get('start'), args.get('end')
+    between = None
+    if start or end:
+        # Timestamps are stored as 'YYYY-MM-DD HH:MM:SS', so they sort as text
+        between = ('timestamp', start or None, f'{end} 23:59:59' if end else None)
+    return {'filters': filters, 'between': between}
+
+
+def iter_submissions(filters, cursor=None, limit=None):
+    """Matching submissions, newest first, as (cursor, submission) pairs"""
+    return datastore.iter_items('submissions', filters=filters['filters'], between=filters['between'],
+                                cursor=cursor, limit=limit)
+
+
+def _row(submission):
+    return [submission.get(field, '') for _, field in EXPORT_COLUMNS]
+
+
+def iter_csv(filters):
+    """
+    Generate a CSV export in chunks
+
+    Args:
+        filters: Result of submission_filters
+
+    Yields:
+        str: CSV text, properly quoted
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for header, _ in EXPORT_COLUMNS])
+
+    for _, submission in iter_submissions(filters):
+        writer.writerow(_row(submission))
+        if buffer.tell() >= CSV_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def iter_json(filters):
+    """
+    Generate a JSON array of submissions in chunks
+
+    Args:
+        filters: Result of submission_filters
+
+    Yields:
+        str: Pieces of the JSON array
+    """
+    yield '['
+    for index, (_, submission) in enumerate(iter_submissions(filters)):
+        yield (',' if index else '') + json.dumps(submission)
+    yield ']'
+
+
+def iter_xlsx(filters, chunk_size=64 * 1024):
+    """
+    Build an xlsx export with openpyxl's write-only mode and stream the file
+
+    The workbook is written row by row to a spooled temporary file, so the
+    sheet is never held in memory as cell objects.
+
+    Args:
+        filters: Result of submission_filters
+        chunk_size: Bytes per yielded chunk
+
+    Yields:
+        bytes: Parts of the xlsx file
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Submissions')
+    sheet.append([header for header, _ in EXPORT_COLUMNS])
+    for _, submission in iter_submissions(filters):
+        sheet.append(_row(submission))
+
+    with tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_BYTES) as spool:
+        workbook.save(spool)
+        spool.seek(0)
+        while True:
+            chunk = spool.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
@@ -0,0 +1,19 @@
+"""
+Shared fixtures
+"""
+import threading
+
+import pytest
+
+import datastore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """A fresh datastore in tmp_path, with no legacy JSON files to import"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(datastore, 'DATASTORE_DB', str(tmp_path / 'keyes.db'))
+    monkeypatch.setattr(datastore, '_local', threading.local())
+    monkeypatch.setattr(datastore, '_ready', set())
+    monkeypatch.setattr(datastore, '_cache', {})
+    return datastore
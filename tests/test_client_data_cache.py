@@ -0,0 +1,90 @@
+"""
+Column cache: chunked ingestion must cache the same columns as a full-file
+read, and text columns must load as categoricals over mapped codes
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+import client_data_cache
+import file_catalog
+from client_data import read_client_data, read_client_data_chunks, _coerce_numeric
+from client_data_cache import CacheEntryWriter, read_cache_entry, _write_entry
+
+
+def _client_csv(path, rows=3000):
+    df = pd.DataFrame({
+        'FIRSTNAME': [None] * 1000 + [f'Name{i}' for i in range(rows - 1000)],
+        'STREET_NUMBER': [str(100 + i) for i in range(rows)],
+        'EXTRA_INT': np.arange(rows),
+        'AGE': [str(30 + i % 50) for i in range(rows)],
+        'CITY': ['Miami' if i % 2 else 'Tampa' for i in range(rows)],
+        'STATE_NAME': [f'State{i % 70}' for i in range(rows)],
+    })
+    df.loc[1801, 'STREET_NUMBER'] = '11151B'
+    df.loc[2500, 'AGE'] = 'unknown'
+    df.to_csv(path, index=False)
+
+
+@pytest.mark.parametrize('dictionary_limit', [20000, 50])
+def test_chunked_cache_matches_full_read(tmp_path, monkeypatch, dictionary_limit):
+    # A small limit makes later chunks repeat values already in the dictionary
+    monkeypatch.setattr(client_data_cache, 'CACHE_DICTIONARY_LIMIT', dictionary_limit)
+    monkeypatch.setattr(client_data_cache, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(file_catalog, 'FILE_CATALOG_DB', str(tmp_path / 'catalog.db'))
+    path = str(tmp_path / 'clients.csv')
+    _client_csv(path)
+
+    writer = CacheEntryWriter('clients.csv', 'etag-1')
+    for chunk in read_client_data_chunks(path, chunksize=800):
+        writer.append(chunk)
+    chunked = read_cache_entry(writer.finish())
+
+    full_dir = str(tmp_path / 'full')
+    # Schema numeric columns are coerced either way once prepared
+    _write_entry(_coerce_numeric(read_client_data(path)), full_dir)
+    full = read_cache_entry(full_dir)
+
+    assert writer.retyped == {'FIRSTNAME', 'STREET_NUMBER'}
+    assert chunked.loc[1801, 'STREET_NUMBER'] == '11151B'
+    assert chunked.loc[2999, 'FIRSTNAME'] == 'Name1999'
+    assert np.isnan(chunked.loc[2500, 'AGE'])
+    pdt.assert_frame_equal(chunked, full, check_dtype=False, check_categorical=False)
+
+
+def _is_mapped(array):
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = getattr(array, 'base', None)
+    return False
+
+
+def test_text_columns_load_as_mapped_categoricals(tmp_path):
+    entry_dir = str(tmp_path / 'entry')
+    df = pd.DataFrame({
+        'EMAIL1': [f'a{i}@example.com' for i in range(1000)],
+        'CITY': pd.Categorical(['Miami', 'Tampa'] * 500),
+        'IS_OWNER': pd.Series([True, False, np.nan, True] * 250, dtype=object),
+        'AGE': np.arange(1000, dtype=np.float64),
+    })
+    df.loc[7, 'EMAIL1'] = np.nan
+    _write_entry(df, entry_dir)
+
+    with open(os.path.join(entry_dir, 'manifest.json')) as f:
+        assert all('categories' not in col for col in json.load(f)['columns'])
+
+    cached = read_cache_entry(entry_dir)
+    for name in ('EMAIL1', 'CITY', 'IS_OWNER'):
+        assert isinstance(cached[name].dtype, pd.CategoricalDtype)
+        assert _is_mapped(cached[name].array.codes)
+    assert cached.loc[3, 'EMAIL1'] == 'a3@example.com'
+    assert pd.isna(cached.loc[7, 'EMAIL1'])
+    assert cached.loc[1, 'IS_OWNER'] is False
+    pdt.assert_frame_equal(cached, df, check_dtype=False, check_categorical=False)
+
+    assert list(read_cache_entry(entry_dir, {'AGE', 'MISSING'}).columns) == ['AGE']
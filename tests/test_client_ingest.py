@@ -0,0 +1,25 @@
+"""
+Upload ingestion: column statistics describe the uploaded values
+"""
+import pandas as pd
+
+import client_ingest
+
+
+def test_stats_ignore_prepare_defaults(tmp_path, monkeypatch):
+    monkeypatch.setattr(client_ingest, 'get_file_metadata', lambda key: {'success': False, 'message': 'offline'})
+    path = str(tmp_path / 'clients.csv')
+    pd.DataFrame({
+        'AGE': [40, 50, None, 70],
+        'CURRENT_SALE_MTG_1_LOAN_AMOUNT': [None, 120000, None, 80000],
+        'CURRENT_AVM_VALUE': [300000, 400000, 500000, 600000],
+    }).to_csv(path, index=False)
+
+    result = client_ingest.ingest_client_file(path, 'clients.csv', ['Mortgage_Balance = 0'], chunksize=2)
+
+    loan = result['stats']['CURRENT_SALE_MTG_1_LOAN_AMOUNT']
+    assert (loan['count'], loan['nulls'], loan['min'], loan['max']) == (2, 2, 80000.0, 120000.0)
+    assert result['stats']['AGE']['nulls'] == 1
+    assert 'SUM_BUILDING_SQFT' not in result['stats']
+    # Prepared data still treats a missing balance as paid off
+    assert result['counts'] == {'Mortgage_Balance = 0': 2}
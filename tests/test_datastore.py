@@ -0,0 +1,122 @@
+"""
+SQLite datastore: cached collection versions, paging and concurrent writes
+"""
+import json
+import threading
+
+import pytest
+
+
+def test_version_changes_only_when_rows_change(store, tmp_path):
+    (tmp_path / 'campaigns.json').write_text(json.dumps([{'id': 'spring', 'name': 'Spring'}]))
+    assert [c['id'] for c in store.load_items('campaigns')] == ['spring']
+    version = store._version_tag('campaigns')
+    assert version is not None
+
+    # Another worker starting up runs the same first-use setup
+    store._ready.clear()
+    assert store.get_item('campaigns', 'spring')['name'] == 'Spring'
+    assert store._version_tag('campaigns') == version
+
+    assert not store.delete_item('campaigns', 'missing')
+    assert not store.insert_new_item('campaigns', {'id': 'spring'})
+    assert store._version_tag('campaigns') == version
+
+    store.update_item('campaigns', {'id': 'spring', 'name': 'Spring 2'})
+    assert store._version_tag('campaigns') != version
+    assert store.get_item('campaigns', 'spring')['name'] == 'Spring 2'
+
+
+def _query_plans(store, run):
+    """EXPLAIN QUERY PLAN details of every SELECT run() sends to the datastore"""
+    conn = store._connect()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        run()
+    finally:
+        conn.set_trace_callback(None)
+    return [
+        [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+        for sql in statements if sql.lstrip().startswith('SELECT pk, data')
+    ]
+
+
+def test_submission_pages_use_indexes(store):
+    for i in range(300):
+        store.insert_item('submissions', {
+            'id': i, 'campaign_id': f'c{i % 3}', 'status': 'contacted' if i % 2 else 'pending',
+            'email': f'person{i}@example.com', 'first_name': 'Ana' if i == 7 else 'Bo', 'last_name': f'Smith{i}'
+        })
+    store.modify_item('submissions', 8, lambda item: item.update(first_name='ANASTASIA'))
+    store.delete_item('submissions', 9)
+
+    page = lambda **kwargs: list(store.iter_items('submissions', limit=20, batch_size=10, **kwargs))
+    plans = _query_plans(store, lambda: (page(filters={'status': 'pending', 'campaign_id': 'c1'}),
+                                         page(search='ana'), page(filters={'status': 'pending'}, cursor=100)))
+    assert plans
+    for plan in plans:
+        # Every page is an index search; the table is never scanned
+        assert not any(step.startswith('SCAN submissions') and 'VIRTUAL TABLE' not in step for step in plan), plan
+
+    pending = page(filters={'status': 'pending', 'campaign_id': 'c1'})
+    assert [item['id'] for _, item in pending][:3] == [298, 292, 286]
+    assert [item['id'] for _, item in page(search='ana')] == [8, 7]
+    assert [item['id'] for _, item in page(search='99@EXAMPLE')] == [299, 199, 99]
+    assert [item['id'] for _, item in page(filters={'status': 'pending'}, cursor=100)][:2] == [98, 96]
+    with pytest.raises(ValueError):
+        page(search='an')
+
+
+def test_existing_tables_gain_status_and_search(store, tmp_path):
+    import sqlite3
+    conn = sqlite3.connect(str(tmp_path / 'keyes.db'))
+    conn.execute('CREATE TABLE submissions (pk INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT, campaign_id TEXT, '
+                 'segment TEXT, data TEXT NOT NULL)')
+    conn.execute('CREATE TABLE migrations (collection TEXT PRIMARY KEY)')
+    conn.executemany("INSERT INTO migrations VALUES (?)", [('submissions',), ('submission_stats',)])
+    conn.execute('INSERT INTO submissions (id, data) VALUES (?, ?)',
+                 ('1', json.dumps({'id': 1, 'status': 'pending', 'email': 'old@example.com'})))
+    conn.commit()
+    conn.close()
+
+    assert [item['id'] for _, item in store.iter_items('submissions', filters={'status': 'pending'})] == [1]
+    assert [item['id'] for _, item in store.iter_items('submissions', search='old@')] == [1]
+
+
+def test_keyset_pages_resume_after_cursor(store):
+    for i in range(1, 26):
+        store.insert_item('submissions', {'id': i, 'timestamp': f'2026-03-{i:02d} 09:00:00'})
+
+    first = list(store.iter_items('submissions', limit=10, batch_size=4))
+    assert [item['id'] for _, item in first] == list(range(25, 15, -1))
+    rest = list(store.iter_items('submissions', cursor=first[-1][0], batch_size=4))
+    assert [item['id'] for _, item in rest] == list(range(15, 0, -1))
+
+    # Rows added while paging land before the cursor and don't shift later pages
+    store.insert_item('submissions', {'id': 26, 'timestamp': '2026-03-26 09:00:00'})
+    assert [item['id'] for _, item in store.iter_items('submissions', cursor=first[-1][0], limit=2)] == [15, 14]
+
+    oldest = list(store.iter_items('submissions', reverse=True, limit=3, batch_size=2))
+    assert [item['id'] for _, item in oldest] == [1, 2, 3]
+    between = ('timestamp', '2026-03-05', '2026-03-07 23:59:59')
+    assert [item['id'] for _, item in store.iter_items('submissions', between=between)] == [7, 6, 5]
+
+
+def test_insert_new_item_admits_one_racer(store):
+    store.load_items('campaigns')
+    barrier = threading.Barrier(8)
+    results = []
+
+    def add(n):
+        barrier.wait()
+        results.append(store.insert_new_item('campaigns', {'id': 'spring-bulk', 'writer': n}))
+
+    threads = [threading.Thread(target=add, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == [False] * 7 + [True]
+    assert len(store.find_items('campaigns')) == 1
@@ -0,0 +1,65 @@
+"""
+Formula compiler: comparison semantics and shared evaluation
+"""
+import numpy as np
+import pandas as pd
+
+from client_data import prepare_client_data
+from formula_evaluator import formula_mask, formula_masks, evaluate_formulas
+
+
+def _clients():
+    return prepare_client_data(pd.DataFrame({
+        'ZIP': pd.Categorical(['33065', '02134', '33066', None, 'N/A']),
+        'AGE': [30.0, 65.0, 70.0, np.nan, 45.0],
+    }))
+
+
+def test_text_zip_compares_with_numeric_literals():
+    df = _clients()
+    assert formula_mask(df, 'ZIP = 33065').tolist() == [True, False, False, False, False]
+    assert formula_mask(df, "ZIP = '33065'").tolist() == [True, False, False, False, False]
+    assert formula_mask(df, 'ZIP = 2134').tolist() == [False, True, False, False, False]
+    assert formula_mask(df, 'ZIP >= 33065 and Age > 40').tolist() == [False, False, True, False, False]
+    assert formula_mask(df, 'ZIP in [33065, 33066]').tolist() == [True, False, True, False, False]
+    assert formula_mask(df, 'ZIP != 33065').tolist() == [False, True, True, True, True]
+
+
+def _segment_clients():
+    return prepare_client_data(pd.DataFrame({
+        'AGE': [30.0, 65.0, 70.0, np.nan, 45.0],
+        'EMPLOYMENT_STATUS': pd.Categorical(['Employed', 'Retired', 'Employed', None, 'Retired']),
+        'CURRENT_AVM_VALUE': [400000.0, 900000.0, 300000.0, 500000.0, np.nan],
+        'CURRENT_SALE_MTG_1_LOAN_AMOUNT': [100000.0, np.nan, 250000.0, 0.0, 0.0],
+    }))
+
+
+def test_single_equals_is_equality():
+    df = _segment_clients()
+    assert formula_mask(df, 'Age = 65').tolist() == formula_mask(df, 'Age == 65').tolist()
+    assert formula_mask(df, 'Age = 65').tolist() == [False, True, False, False, False]
+    assert formula_mask(df, "EmploymentStatus = 'Retired'").tolist() == [False, True, False, False, True]
+    assert formula_mask(df, "EmploymentStatus ≠ 'Retired'").tolist() == [True, False, True, True, False]
+    assert formula_mask(df, 'Age BETWEEN 30 AND 65').tolist() == [True, True, False, False, True]
+    # Missing loan amounts count as paid off
+    assert formula_mask(df, 'Equity >= 300000').tolist() == [True, True, False, True, False]
+
+
+def test_shared_evaluation_matches_single_formulas():
+    df = _segment_clients()
+    formulas = [
+        "Age >= 60 and EmploymentStatus = 'Retired'",
+        "EmploymentStatus = 'Retired' and Age >= 60",
+        'Age >= 60 or Equity >= 300000',
+        'not (Age < 40)',
+        'Age >= 60 and NoSuchColumn > 1',
+        'Age >=',
+    ]
+    masks = formula_masks(df, formulas)
+
+    for formula in formulas[:4]:
+        assert masks[formula].tolist() == formula_mask(df, formula).tolist()
+    # Reordered and/or operands compile to one tree, evaluated once
+    assert masks[formulas[0]] is masks[formulas[1]]
+    assert masks[formulas[4]] is None and masks[formulas[5]] is None
+    assert evaluate_formulas(df, formulas)[formulas[0]] == 1
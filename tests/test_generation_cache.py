@@ -0,0 +1,70 @@
+"""
+Generation cache: identical requests share one model call, results are
+reused, errors are shared but never cached
+"""
+import threading
+import time
+
+import pytest
+
+import generation_cache
+from generation_cache import cached_generation
+
+
+@pytest.fixture(autouse=True)
+def cache_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(generation_cache, 'GENERATION_CACHE_DB', str(tmp_path / 'generation_cache.db'))
+    monkeypatch.setattr(generation_cache, 'GENERATION_POLL_SECONDS', 0.01)
+
+
+def _generator(result):
+    calls = []
+
+    def generate():
+        calls.append(threading.get_ident())
+        time.sleep(0.2)
+        return dict(result, call=len(calls))
+    return generate, calls
+
+
+def test_concurrent_requests_share_one_call():
+    request = {'model': 'gpt-test', 'messages': [{'role': 'user', 'content': 'spring campaign'}]}
+    generate, calls = _generator({'campaign_name': 'Spring'})
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cached_generation(request, generate)))
+               for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{'campaign_name': 'Spring', 'call': 1}] * 6
+    # Stored for later requests; refresh makes a new call
+    assert cached_generation(dict(request), generate) == {'campaign_name': 'Spring', 'call': 1}
+    assert cached_generation(request, generate, refresh=True)['call'] == 2
+
+
+def test_errors_are_shared_but_not_cached():
+    request = {'model': 'gpt-test', 'messages': []}
+    generate, calls = _generator({'error': 'rate limited'})
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cached_generation(request, generate)))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1 and results == [{'error': 'rate limited', 'call': 1}] * 3
+    assert cached_generation(request, generate)['call'] == 2
+
+
+def test_stale_lease_is_taken_over():
+    request = {'model': 'gpt-test', 'messages': [{'role': 'user', 'content': 'fall'}]}
+    with generation_cache._connect() as conn:
+        conn.execute('INSERT INTO inflight (key, owner, started_at) VALUES (?, ?, ?)',
+                     (generation_cache.request_key(request), 'dead-worker',
+                      time.time() - generation_cache.GENERATION_LEASE_SECONDS - 1))
+    generate, calls = _generator({'campaign_name': 'Fall'})
+    assert cached_generation(request, generate) == {'campaign_name': 'Fall', 'call': 1}
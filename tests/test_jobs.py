@@ -0,0 +1,37 @@
+"""
+Job queue: unique jobs are refused while another one with the same key is
+queued or running
+"""
+import time
+
+import jobs
+
+# Job ids submit_job returned from inside the running handler
+_resubmitted = []
+
+
+def _bulk_job(payload, report):
+    _resubmitted.append(jobs.submit_job(_bulk_job, payload, unique='campaign_id'))
+    return {'success': True, 'message': 'Done'}
+
+
+def test_unique_job_refused_while_running(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, 'JOBS_DB_FILE', str(tmp_path / 'jobs.db'))
+    monkeypatch.setattr(jobs, 'JOB_WORKERS', 0)
+    _resubmitted.clear()
+
+    # Inline workers run the job inside submit_job, so the handler sees itself running
+    job_id = jobs.submit_job(_bulk_job, {'campaign_id': 'spring'}, unique='campaign_id')
+    assert _resubmitted == [None]
+    assert jobs.get_job(job_id)['status'] == 'done'
+
+    # Finished jobs no longer block; other keys never did
+    assert jobs.submit_job(_bulk_job, {'campaign_id': 'spring'}, unique='campaign_id')
+    assert _resubmitted[1] is None
+    with jobs._connect() as conn:
+        conn.execute("INSERT INTO jobs (id, handler, status, payload, created_at, updated_at)"
+                     " VALUES ('old', ?, 'running', '{\"campaign_id\": \"fall\"}', 0, ?)",
+                     (f'{__name__}._bulk_job', time.time() - jobs.STALE_JOB_SECONDS - 1))
+    # A running job nobody updated for too long was interrupted and doesn't block
+    assert jobs.submit_job(_bulk_job, {'campaign_id': 'fall'}, unique='campaign_id')
+    assert jobs.get_job('old')['status'] == 'failed'
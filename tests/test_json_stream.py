@@ -0,0 +1,68 @@
+"""
+Streamed JSON fields: every split of the reply yields the same fields, each
+as soon as its value is complete
+"""
+import json
+import random
+
+import pytest
+
+from fake_openai import CANNED_CAMPAIGN
+from json_stream import ObjectFieldParser
+
+CAMPAIGN = dict(CANNED_CAMPAIGN, explanation='Quotes "like this", a \\ slash, {braces}, [brackets], a, comma',
+                score=0.5, approved=True, notes=None)
+
+
+def _split(text, sizes):
+    pieces, pos = [], 0
+    for size in sizes:
+        pieces.append(text[pos:pos + size])
+        pos += size
+    return pieces + [text[pos:]]
+
+
+@pytest.mark.parametrize('indent', [None, 2])
+@pytest.mark.parametrize('seed', [None, 1, 2, 3])
+def test_fields_match_for_any_split(indent, seed):
+    text = json.dumps(CAMPAIGN, indent=indent, ensure_ascii=seed == 2)
+    sizes = [1] * len(text) if seed is None else [random.Random(seed).randint(1, 12) for _ in range(len(text))]
+
+    parser = ObjectFieldParser()
+    fields = []
+    for piece in _split(text, sizes):
+        fields.extend(parser.feed(piece))
+
+    assert fields == list(CAMPAIGN.items())
+    assert parser.result() == CAMPAIGN
+
+
+def test_field_emitted_once_its_value_ends():
+    parser = ObjectFieldParser()
+    assert parser.feed('{"subject_line": "Your home, ') == []
+    assert parser.feed('valued"') == []
+    assert parser.feed(', "form_questions": [{"type": "radio"}') == [('subject_line', 'Your home, valued')]
+    assert parser.feed(']}') == [('form_questions', [{'type': 'radio'}])]
+
+
+def test_streamed_reply_from_fake_server(tmp_path, monkeypatch):
+    import fake_openai
+    import llm_client
+    import rate_limiter
+
+    server, fake = fake_openai.serve(0, latency=0.05)
+    try:
+        monkeypatch.setattr(llm_client, 'OPENAI_BASE_URL', f'http://127.0.0.1:{server.server_port}/v1')
+        monkeypatch.setattr(rate_limiter, 'RATE_LIMIT_DB', str(tmp_path / 'rate_limits.db'))
+        monkeypatch.setenv('OPENAI_API_KEY', 'fake')
+
+        parser = ObjectFieldParser()
+        fields = []
+        payload = {'model': 'gpt-test', 'messages': [{'role': 'user', 'content': 'campaign'}]}
+        for text in llm_client.stream_chat_completion(payload, timeout=5, deadline=10):
+            fields.extend(parser.feed(text))
+    finally:
+        server.shutdown()
+
+    assert fields == list(CANNED_CAMPAIGN.items())
+    assert fake.counts['ok'] == 1
@@ -0,0 +1,51 @@
+"""
+LLM client: failed attempts hand their reserved tokens back to the shared
+token bucket, while the request slots they used stay spent
+"""
+import sqlite3
+
+import pytest
+
+import llm_client
+import rate_limiter
+
+
+class _Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {'Retry-After': '0'}
+        self.text = 'error'
+
+
+class _Session:
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+
+    def post(self, url, **kwargs):
+        return _Response(self.statuses.pop(0))
+
+
+def _level(name):
+    conn = sqlite3.connect(rate_limiter.RATE_LIMIT_DB)
+    try:
+        return conn.execute('SELECT tokens FROM buckets WHERE name = ?', (name,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_failed_attempts_refund_tokens(tmp_path, monkeypatch):
+    monkeypatch.setattr(rate_limiter, 'RATE_LIMIT_DB', str(tmp_path / 'rate_limits.db'))
+    monkeypatch.setenv('OPENAI_API_KEY', 'fake')
+    monkeypatch.setattr(llm_client, 'LLM_RPM', 60)
+    monkeypatch.setattr(llm_client, 'LLM_TPM', 100000)
+    session = _Session([503, 400])
+    monkeypatch.setattr(llm_client, 'get_session', lambda: session)
+
+    payload = {'model': 'test-model', 'messages': [{'role': 'user', 'content': 'hi'}], 'max_tokens': 5000}
+    with pytest.raises(llm_client.LLMError) as failed:
+        llm_client.chat_completion(payload, deadline=30)
+
+    assert failed.value.status == 400
+    assert not session.statuses
+    assert _level('test-model:tokens') == pytest.approx(100000, abs=50)
+    assert _level('test-model:requests') < 59
@@ -0,0 +1,55 @@
+"""
+Token buckets: callers reserve up front and queue behind each other in
+arrival order
+"""
+import pytest
+
+import rate_limiter
+
+
+class _Clock:
+    """Stands in for the time module; sleeping advances the clock"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(tmp_path, monkeypatch):
+    monkeypatch.setattr(rate_limiter, 'RATE_LIMIT_DB', str(tmp_path / 'rate_limits.db'))
+    clock = _Clock()
+    monkeypatch.setattr(rate_limiter, 'time', clock)
+    return clock
+
+
+def test_callers_queue_for_refills(clock):
+    limits = lambda amount: {'requests': (1, 5, 5 / 60), 'tokens': (amount, 100, 10)}
+
+    assert rate_limiter.acquire(limits(100)) == 0
+    assert rate_limiter.acquire(limits(50)) == pytest.approx(5)
+    # Refused callers reserve nothing, so the next one waits only for its own tokens
+    assert rate_limiter.acquire(limits(20), max_wait=1) is None
+    assert rate_limiter.acquire(limits(20)) == pytest.approx(2)
+    assert clock.sleeps == [pytest.approx(5), pytest.approx(2)]
+    # A request bigger than the bucket waits for a full bucket, not forever
+    clock.now += 60
+    assert rate_limiter.acquire(limits(500)) == 0
+
+
+def test_refund_and_drain(clock):
+    limits = {'tokens': (80, 100, 10)}
+    rate_limiter.acquire(limits)
+    rate_limiter.refund('tokens', 500, 100)
+    assert rate_limiter.acquire({'tokens': (100, 100, 10)}) == 0
+
+    rate_limiter.refund('tokens', 100, 100)
+    rate_limiter.drain(limits, 3)
+    assert rate_limiter.acquire({'tokens': (10, 100, 10)}) == pytest.approx(4)
@@ -0,0 +1,54 @@
+"""
+Submission exports: CSV, xlsx and JSON generators stream every matching row
+"""
+import csv
+import io
+import json
+
+from openpyxl import load_workbook
+
+import submission_export
+from submission_export import EXPORT_COLUMNS, submission_filters, iter_csv, iter_json, iter_xlsx
+
+
+def _add_submissions(store, count=120):
+    for i in range(1, count + 1):
+        store.insert_item('submissions', {
+            'id': i, 'timestamp': f'2026-04-{i % 28 + 1:02d} 12:00:00', 'campaign_id': 'spring' if i % 2 else 'fall',
+            'status': 'pending', 'email': f'lead{i}@example.com', 'first_name': 'O"Neil, Jr.' if i == 3 else 'Ann',
+            'goals_text': 'line one\nline two'
+        })
+
+
+def test_csv_export_streams_in_chunks(store, monkeypatch):
+    _add_submissions(store)
+    monkeypatch.setattr(submission_export, 'CSV_CHUNK_BYTES', 1024)
+    chunks = list(iter_csv(submission_filters({'campaign_id': 'spring'})))
+
+    assert len(chunks) > 2
+    rows = list(csv.reader(io.StringIO(''.join(chunks))))
+    assert rows[0] == [header for header, _ in EXPORT_COLUMNS]
+    assert [row[0] for row in rows[1:]] == [str(i) for i in range(119, 0, -2)]
+    assert rows[-2][4] == 'O"Neil, Jr.'
+    assert rows[-1][8] == 'line one\nline two'
+
+
+def test_json_export_filters_by_date(store):
+    _add_submissions(store)
+    filters = submission_filters({'start': '2026-04-02', 'end': '2026-04-03'})
+    assert filters['between'] == ('timestamp', '2026-04-02', '2026-04-03 23:59:59')
+
+    exported = json.loads(''.join(iter_json(filters)))
+    assert [item['id'] for item in exported] == [114, 113, 86, 85, 58, 57, 30, 29, 2, 1]
+    assert json.loads(''.join(iter_json(submission_filters({'campaign_id': 'none'})))) == []
+
+
+def test_xlsx_export_has_every_row(store, tmp_path):
+    _add_submissions(store)
+    path = tmp_path / 'export.xlsx'
+    path.write_bytes(b''.join(iter_xlsx(submission_filters({'status': 'pending'}), chunk_size=512)))
+
+    rows = list(load_workbook(path, read_only=True)['Submissions'].values)
+    assert list(rows[0]) == [header for header, _ in EXPORT_COLUMNS]
+    assert len(rows) == 121
+    assert rows[1][0] == 120 and rows[-1][3] == 'lead1@example.com'